@@ -0,0 +1,363 @@
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import statistics
+import subprocess
+import importlib.metadata
+from pathlib import Path
+
+import numpy as np
+import shapely
+import geopandas as gpd
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+from sp_geoprocessing.synth import synth_county, SYNTH_EPSG
+from sp_geoprocessing.cluster import compute_distance_matrix, build_owner_clusters, build_place_regions
+from sp_geoprocessing.superparcels import (
+    build_superparcels,
+    compute_mitre_limit,
+    remove_overlap,
+    hash_puids,
+    hash_puid_groups,
+    repair_invalid_geoms,
+)
+from sp_geoprocessing.knn import (
+    calculate_regional_knn_distance,
+    calculate_knn_density_field,
+    build_knn_distances,
+    merge_small_clusters,
+)
+from sp_geoprocessing.neighbors import NeighborGraph
+from sp_geoprocessing.tools import merge_cross_region_clusters
+from sp_geoprocessing.places import PlaceIndex
+from sp_geoprocessing.adaptive import attach_singles
+from sp_geoprocessing.ordering import spatial_sort
+from sp_cli.sp_build import build_sp_fixed
+
+""" Stage-level benchmarks for sp_geoprocessing """
+
+BASELINE_DIR = Path(__file__).resolve().parent / "baselines"
+SCALES = [1_000, 10_000, 100_000, 1_000_000]
+SEED = 0
+
+
+def make_raw_parcels(n, seed=SEED, **options):
+    """Synthetic county of n parcels (see sp_geoprocessing.synth) in its projected CRS."""
+    return synth_county(n, seed=seed, **options).to_crs(epsg=SYNTH_EPSG)
+
+
+def make_parcels(n, seed=SEED, **options):
+    """Projected parcels after the geometry repair stage, as the later stages see them."""
+    return repair_invalid_geoms(make_raw_parcels(n, seed, **options))[0]
+
+
+def make_clustered(n, seed=SEED):
+    """Projected parcels with a cluster_ID per owner."""
+    gdf = make_parcels(n, seed)
+    gdf['puid'] = gdf.index
+    gdf['cluster_ID'] = gdf['OWNER']
+    return gdf
+
+
+""" Benchmarks. Each setup(n) returns a zero-argument callable to time. """
+
+def setup_distance_matrix(n):
+    polygons = make_parcels(n).geometry.to_list()
+    return lambda: compute_distance_matrix(polygons)
+
+
+def setup_repair_invalid_geoms(n):
+    gdf = make_raw_parcels(n)
+    return lambda: repair_invalid_geoms(gdf)
+
+
+def setup_owner_clusters(n):
+    gdf = make_parcels(n)
+    return lambda: build_owner_clusters(gdf, min_samples=3, eps=200)
+
+
+def setup_owner_clusters_stacked(n):
+    # condo-heavy county: 30% of parcels stacked 2-5 times
+    gdf = make_parcels(n, duplicate_rate=0.3)
+    return lambda: build_owner_clusters(gdf, min_samples=3, eps=200)
+
+
+def setup_neighbor_graph(n):
+    gdf = make_parcels(n)
+    owners = gdf['OWNER'].factorize()[0]
+    return lambda: NeighborGraph.build(gdf.geometry.to_numpy(), owners, max_distance=500)
+
+
+def setup_neighbor_graph_clusters(n):
+    # all owners of the county clustered from a built graph
+    gdf = make_parcels(n).reset_index(drop=True)
+    graph = NeighborGraph.build(gdf.geometry.to_numpy(), gdf['OWNER'].factorize()[0], max_distance=500)
+    owners = list(gdf.groupby('OWNER').indices.values())
+    return lambda: [graph.owner_clusters(rows, min_samples=3, eps=200) for rows in owners]
+
+
+def setup_place_assign(n):
+    # 100 places tiling half of the county
+    gdf = make_parcels(n)
+    xmin, ymin, xmax, ymax = gdf.total_bounds
+    w, h = (xmax - xmin) / 20, (ymax - ymin) / 10
+    boxes = [shapely.box(xmin + i * w, ymin + j * h, xmin + (i + 1) * w, ymin + (j + 1) * h)
+             for i in range(0, 20, 2) for j in range(10)]
+    places = PlaceIndex(gpd.GeoDataFrame(geometry=boxes, crs=gdf.crs))
+    return lambda: places.assign(gdf)
+
+
+def setup_superparcels(n):
+    gdf = make_clustered(n)
+    return lambda: build_superparcels(gdf, buffer=50, dissolve_by='cluster_ID')
+
+
+def setup_mitre_limit(n):
+    geoms = make_parcels(n).geometry.to_list()
+    return lambda: [compute_mitre_limit(g) for g in geoms]
+
+
+def setup_remove_overlap(n):
+    # superparcel-like blobs that overlap their neighbours
+    sp = make_parcels(n)
+    sp['geometry'] = sp.geometry.buffer(10)
+    sp['p_area'] = sp.geometry.area
+    return lambda: remove_overlap(sp.copy())
+
+
+def setup_hash_puids(n):
+    groups = make_clustered(n).groupby('cluster_ID')['PUID'].apply(list).to_list()
+    return lambda: [hash_puids(g) for g in groups]
+
+
+def setup_hash_puid_groups(n):
+    gdf = make_clustered(n)
+    return lambda: hash_puid_groups(gdf['PUID'], gdf['cluster_ID'])
+
+
+def setup_knn_distance(n):
+    coords = np.array([(g.x, g.y) for g in make_parcels(n).geometry.centroid])
+    return lambda: calculate_regional_knn_distance(
+        coords, kneighbors=3, smoothing_window=0.1, min_distance=10, max_distance=500
+    )
+
+
+def setup_knn_density_field(n):
+    coords = np.array([(g.x, g.y) for g in make_parcels(n).geometry.centroid])
+    return lambda: calculate_knn_density_field(
+        coords, kneighbors=3, cell_size=100, smoothing_radius=500, min_distance=15, max_distance=120
+    )
+
+
+def setup_knn_distances(n):
+    coords = np.array([(g.x, g.y) for g in make_parcels(n).geometry.centroid])
+    return lambda: build_knn_distances(coords, k=4)
+
+
+def setup_place_regions(n):
+    gdf = make_parcels(n)
+    return lambda: build_place_regions(gdf, 200)
+
+
+def setup_merge_cross_region_clusters(n):
+    # owners clustered apart in regions of 200 parcels
+    gdf = make_clustered(n)
+    gdf['place_id'] = build_place_regions(gdf, 200)[0]
+    gdf['cluster_ID'] = gdf['OWNER'].astype(str) + '_' + gdf['place_id'].astype(str)
+    return lambda: merge_cross_region_clusters(gdf.copy(), max_merge_distance=120)
+
+
+def setup_attach_singles(n):
+    # every third parcel single, the rest clustered by owner
+    gdf = make_clustered(n)
+    singles = gdf.iloc[::3]
+    clustered = gdf.drop(index=singles.index)
+    return lambda: attach_singles(clustered, singles, 'OWNER', max_distance=120)
+
+
+def setup_spatial_sort(n):
+    parcels = synth_county(n, seed=SEED)
+    return lambda: spatial_sort(parcels, 'hilbert', group_field='FIPS')
+
+
+def setup_merge_small_clusters(n):
+    rng = np.random.default_rng(0)
+    n_regions = max(n // 200, 2)
+    centroids = rng.uniform(0, 10_000, (n_regions, 2))
+    labels = rng.zipf(1.5, n) % n_regions
+    return lambda: merge_small_clusters(labels.copy(), centroids, min_cluster_size=100)
+
+
+def setup_build_sp_fixed(n):
+    parcels = synth_county(n, seed=SEED)
+    return lambda: build_sp_fixed(parcels, '06075', 'OWNER', 200, 3, None)
+
+
+def setup_build_sp_fixed_cached(n):
+    # refresh build: every owner is in the owner cache
+    import tempfile
+    parcels = synth_county(n, seed=SEED)
+    cache = os.path.join(tempfile.mkdtemp(prefix='sp_owner_cache_'), 'owner_cache.sqlite')
+    build_sp_fixed(parcels, '06075', 'OWNER', 200, 3, None, owner_cache=cache)
+    return lambda: build_sp_fixed(parcels, '06075', 'OWNER', 200, 3, None, owner_cache=cache)
+
+
+# name: (setup, max scale). Caps keep the O(n^2) stages runnable.
+BENCHMARKS = {
+    'repair_invalid_geoms': (setup_repair_invalid_geoms, 1_000_000),
+    'compute_distance_matrix': (setup_distance_matrix, 1_000),
+    'build_owner_clusters': (setup_owner_clusters, 1_000),
+    'build_owner_clusters.stacked': (setup_owner_clusters_stacked, 1_000),
+    'neighbor_graph.build': (setup_neighbor_graph, 1_000_000),
+    'neighbor_graph.owner_clusters': (setup_neighbor_graph_clusters, 1_000_000),
+    'places.assign': (setup_place_assign, 1_000_000),
+    'build_superparcels': (setup_superparcels, 100_000),
+    'compute_mitre_limit': (setup_mitre_limit, 100_000),
+    'remove_overlap': (setup_remove_overlap, 10_000),
+    'hash_puids': (setup_hash_puids, 1_000_000),
+    'hash_puid_groups': (setup_hash_puid_groups, 1_000_000),
+    'knn.calculate_regional_knn_distance': (setup_knn_distance, 1_000_000),
+    'knn.calculate_knn_density_field': (setup_knn_density_field, 1_000_000),
+    'knn.build_knn_distances': (setup_knn_distances, 1_000_000),
+    'build_place_regions': (setup_place_regions, 1_000_000),
+    'knn.merge_small_clusters': (setup_merge_small_clusters, 1_000_000),
+    'merge_cross_region_clusters': (setup_merge_cross_region_clusters, 1_000_000),
+    'attach_singles': (setup_attach_singles, 1_000_000),
+    'spatial_sort': (setup_spatial_sort, 1_000_000),
+    'build_sp_fixed': (setup_build_sp_fixed, 100_000),
+    'build_sp_fixed.owner_cache': (setup_build_sp_fixed_cached, 100_000),
+}
+
+
+def time_call(func, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return {
+        'rounds': repeat,
+        'min_s': min(times),
+        'median_s': statistics.median(times),
+    }
+
+
+def run_benchmarks(names, scales, repeat, max_seconds):
+    """
+    Times each benchmark at each scale up to its cap. A benchmark stops
+    growing once one round at the previous scale took longer than max_seconds.
+    """
+    results = {}
+    for name in names:
+        setup, cap = BENCHMARKS[name]
+        results[name] = {}
+        for n in scales:
+            if n > cap:
+                print(f"  {name:<38}{n:>10,}  skipped (cap {cap:,})")
+                continue
+            func = setup(n)
+            rounds = repeat if n <= 10_000 else 1
+            res = time_call(func, rounds)
+            results[name][str(n)] = res
+            print(f"  {name:<38}{n:>10,}  median {res['median_s']:.4f}s  min {res['min_s']:.4f}s")
+            if res['min_s'] > max_seconds:
+                print(f"  {name:<38}  stopping: over {max_seconds}s")
+                break
+    return results
+
+
+def environment():
+    try:
+        commit = subprocess.check_output(
+            "git rev-parse --short HEAD", shell=True, text=True, stderr=subprocess.DEVNULL
+        ).strip()
+    except subprocess.CalledProcessError:
+        commit = None
+    try:
+        version = importlib.metadata.version("superparcels")
+    except importlib.metadata.PackageNotFoundError:
+        version = None
+    return {
+        'version': version,
+        'commit': commit,
+        'python': platform.python_version(),
+        'machine': platform.platform(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+    }
+
+
+def compare(results, baseline, threshold):
+    """
+    Compares median times against a baseline.
+    Returns the list of (name, scale, baseline_s, current_s, ratio) regressions.
+    """
+    regressions = []
+    print(f"\n{'benchmark':<38}{'scale':>10}{'baseline s':>12}{'current s':>12}{'ratio':>8}")
+    for name, scales in results.items():
+        for n, res in scales.items():
+            base = baseline['results'].get(name, {}).get(n)
+            if not base:
+                continue
+            ratio = res['median_s'] / base['median_s'] if base['median_s'] else 1.0
+            flag = ''
+            if ratio > 1 + threshold:
+                flag = '  REGRESSION'
+                regressions.append((name, n, base['median_s'], res['median_s'], ratio))
+            print(f"{name:<38}{int(n):>10,}{base['median_s']:>12.4f}{res['median_s']:>12.4f}{ratio:>8.2f}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stage-level benchmarks for sp_geoprocessing")
+    parser.add_argument("--only", default=None, help="Comma-separated benchmark names (default: all)")
+    parser.add_argument("--scales", default=",".join(map(str, SCALES)), help="Comma-separated parcel counts")
+    parser.add_argument("--repeat", type=int, default=3, help="Rounds per benchmark for scales up to 10k")
+    parser.add_argument("--max-seconds", type=float, default=120, help="Stop scaling a benchmark once a round exceeds this")
+    parser.add_argument("--save", default=None, help="Save results as baselines/<name>.json")
+    parser.add_argument("--compare", default=None, help="Compare against baselines/<name>.json")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Allowed slowdown before a regression is reported (0.2 = 20%%)")
+    parser.add_argument("--list", action="store_true", help="List benchmarks and exit")
+
+    args = parser.parse_args()
+
+    if args.list:
+        for name, (_, cap) in BENCHMARKS.items():
+            print(f"{name:<38} up to {cap:,}")
+        return
+
+    names = args.only.split(",") if args.only else list(BENCHMARKS)
+    unknown = [n for n in names if n not in BENCHMARKS]
+    if unknown:
+        parser.error(f"Unknown benchmark(s): {', '.join(unknown)}")
+    scales = [int(s) for s in args.scales.split(",")]
+
+    print(f"Running {len(names)} benchmarks at scales {scales}")
+    report = {'env': environment(), 'results': run_benchmarks(names, scales, args.repeat, args.max_seconds)}
+
+    if args.save:
+        BASELINE_DIR.mkdir(exist_ok=True)
+        path = BASELINE_DIR / f"{args.save}.json"
+        with open(path, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nSaved baseline: {path}")
+
+    if args.compare:
+        path = BASELINE_DIR / f"{args.compare}.json"
+        if not path.exists():
+            print(f"❌ Baseline not found: {path}")
+            exit(1)
+        with open(path) as f:
+            baseline = json.load(f)
+        regressions = compare(report['results'], baseline, args.threshold)
+        if regressions:
+            print(f"\n❌ {len(regressions)} regression(s) over {args.threshold:.0%}")
+            exit(1)
+        print(f"\n✅ No regressions over {args.threshold:.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+import sys
+import argparse
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import shapely
+import shapely.affinity
+import geopandas as gpd
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+from sp_geoprocessing.synth import synth_county, SYNTH_EPSG
+from sp_geoprocessing.superparcels import repair_invalid_geoms
+from sp_geoprocessing.cluster import build_owner_clusters
+from sp_geoprocessing.neighbors import NeighborGraph
+
+""" Equivalence check: neighbor-graph DBSCAN against sklearn DBSCAN """
+
+EPS = [1, 10, 25, 50, 100, 200]
+MIN_SAMPLES = [2, 3, 5]
+LATTICE_OWNER = 'LATTICE'
+
+
+def lattice_parcels(crs, origin, side=10.0, gap=10.0, n=6, stacked=4):
+    """
+    One owner's n x n grid of squares 'gap' apart, so many pairs are exactly
+    'gap' (and gap * sqrt(2), ...) apart: eps at those distances is a tie.
+    The first square is stacked 'stacked' times, and one square is repeated
+    shifted by less than the duplicate grid (near-exact duplicate).
+    """
+    x0, y0 = origin
+    step = side + gap
+    squares = [
+        shapely.box(x0 + i * step, y0 + j * step, x0 + i * step + side, y0 + j * step + side)
+        for i in range(n) for j in range(n)
+    ]
+    squares += [squares[0]] * stacked
+    squares.append(shapely.affinity.translate(squares[-2], 1e-9, 0))
+    return gpd.GeoDataFrame({'OWNER': [LATTICE_OWNER] * len(squares)}, geometry=squares, crs=crs)
+
+
+def make_county(n_parcels, seed):
+    """Synthetic county with extra stacked parcels, plus the lattice owner."""
+    parcels = synth_county(n_parcels, seed=seed, duplicate_rate=0.05).to_crs(epsg=SYNTH_EPSG)
+    parcels = repair_invalid_geoms(parcels)[0][['OWNER', 'geometry']]
+    xmin, ymin = parcels.total_bounds[:2]
+    lattice = lattice_parcels(parcels.crs, (xmin - 1_000, ymin - 1_000))
+    return pd.concat([parcels, lattice], ignore_index=True)
+
+
+def tie_distances(graph, rows, limit=3):
+    """Some exact pair distances of an owner's parcels, used as eps."""
+    edges = np.concatenate([
+        graph.distances[graph.indptr[row]:graph.indptr[row + 1]] for row in rows
+    ])
+    edges = np.unique(edges[edges > 0])
+    return list(edges[np.linspace(0, len(edges) - 1, min(limit, len(edges))).astype(int)]) if len(edges) else []
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check that NeighborGraph.owner_clusters matches build_owner_clusters")
+    parser.add_argument("--parcels", type=int, default=5_000, help="Parcels of the synthetic county")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the synthetic county")
+    parser.add_argument("--max-owners", type=int, default=300, help="Owners checked, largest first")
+    args = parser.parse_args()
+
+    parcels = make_county(args.parcels, args.seed)
+    codes, owners = pd.factorize(parcels['OWNER'])
+    geoms = parcels.geometry.to_numpy()
+    graph = NeighborGraph.build(geoms, codes, max(EPS))
+    print(f"County: {len(parcels)} parcels, {len(owners)} owners, graph of {graph.n_edges} edges")
+
+    owner_rows = pd.Series(codes).groupby(codes).indices
+    checked = sorted(
+        (rows for code, rows in owner_rows.items() if code >= 0 and len(rows) >= 3),
+        key=len, reverse=True
+    )[:args.max_owners]
+    checked.append(owner_rows[owners.get_loc(LATTICE_OWNER)])
+
+    cases, failures = 0, []
+    for rows in checked:
+        owner = owners[codes[rows[0]]]
+        for eps in EPS + tie_distances(graph, rows):
+            for min_samples in MIN_SAMPLES:
+                expected = build_owner_clusters(parcels.geometry.iloc[rows], min_samples=min_samples, eps=eps)
+                labels = graph.owner_clusters(rows, min_samples=min_samples, eps=eps)
+                cases += 1
+                if not np.array_equal(np.asarray(expected), np.asarray(labels)):
+                    failures.append(f"{owner} ({len(rows)} parcels) eps={eps} min_samples={min_samples}")
+
+    print(f"Compared {cases} owner clusterings of {len(checked)} owners")
+    if failures:
+        print("\n❌ Graph DBSCAN labels differ from sklearn DBSCAN:")
+        for failure in failures[:20]:
+            print(f"  - {failure}")
+        exit(1)
+    print("\n✅ Graph DBSCAN labels match sklearn DBSCAN")
+
+
+if __name__ == "__main__":
+    main()
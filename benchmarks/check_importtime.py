@@ -0,0 +1,95 @@
+import re
+import sys
+import time
+import argparse
+import statistics
+import subprocess
+
+""" Import-time regression check for the sps CLI """
+
+# Commands that must start fast, and must not pull in the heavy dependencies
+COMMANDS = [
+    ["--help"],
+    ["config", "-see"],
+    ["build", "--help"],
+    ["build", "spfixed", "--help"],
+    ["synth", "--help"],
+    ["serve", "--help"],
+]
+HEAVY_MODULES = ["pandas", "geopandas", "shapely", "pyarrow", "sklearn", "scipy", "google.cloud"]
+
+IMPORTTIME_RE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+
+def run_command(args, importtime=False):
+    """
+    Runs 'sps <args>' in a fresh interpreter.
+    Returns the wall time in ms and, with importtime, the {module: cumulative us}
+    imports. -X importtime slows imports down, so wall times are measured without it.
+    """
+    code = f"import sys; sys.argv = ['sps'] + {args!r}; from sp_cli.cli import cli; cli()"
+    flags = ["-X", "importtime"] if importtime else []
+    start = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, *flags, "-c", code],
+        capture_output=True,
+        text=True,
+    )
+    wall_ms = (time.perf_counter() - start) * 1000
+
+    imports = {}
+    for line in proc.stderr.splitlines():
+        match = IMPORTTIME_RE.match(line)
+        if match:
+            imports[match.group(4)] = int(match.group(2))
+    return wall_ms, imports
+
+
+def interpreter_startup_ms(rounds):
+    times = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-c", "pass"], check=True)
+        times.append((time.perf_counter() - start) * 1000)
+    return statistics.median(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check sps CLI start-up time and heavy imports")
+    parser.add_argument("--budget-ms", type=float, default=200, help="Maximum median wall time per command")
+    parser.add_argument("--rounds", type=int, default=5, help="Runs per command")
+    parser.add_argument("--top", type=int, default=0, help="Print the N slowest imports of each command")
+
+    args = parser.parse_args()
+
+    print(f"Interpreter start-up: {interpreter_startup_ms(args.rounds):.0f} ms")
+    failures = []
+    for command in COMMANDS:
+        wall_ms = statistics.median(run_command(command)[0] for _ in range(args.rounds))
+        _, imports = run_command(command, importtime=True)
+
+        heavy = [m for m in HEAVY_MODULES if m in imports]
+        cli_ms = imports.get("sp_cli.cli", 0) / 1000
+        status = "ok"
+        if wall_ms > args.budget_ms:
+            status = "SLOW"
+            failures.append(f"sps {' '.join(command)}: {wall_ms:.0f} ms > {args.budget_ms:.0f} ms")
+        if heavy:
+            status = "HEAVY"
+            failures.append(f"sps {' '.join(command)} imports {', '.join(heavy)}")
+        print(f"  sps {' '.join(command):<28} {wall_ms:>7.0f} ms  (sp_cli.cli import {cli_ms:.0f} ms)  {status}")
+
+        if args.top:
+            for module, us in sorted(imports.items(), key=lambda x: -x[1])[:args.top]:
+                print(f"      {us / 1000:>8.1f} ms  {module}")
+
+    if failures:
+        print("\n❌ Import-time check failed:")
+        for failure in failures:
+            print(f"  - {failure}")
+        exit(1)
+    print(f"\n✅ All commands start in under {args.budget_ms:.0f} ms without heavy imports")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+import os
+from typing import Optional, Union, Dict
+
+# The CLI sets these so every BigQ client of a build (including the ones
+# created in pool workers and upload threads) uses the same backend.
+BACKEND_ENV = "SPS_BACKEND"
+LOCAL_DATA_DIR_ENV = "SPS_LOCAL_DATA_DIR"
+BACKENDS = ("bigquery", "local")
+
+
+def set_backend(backend: str, data_dir: Optional[str] = None):
+    """Selects the backend returned by connect() for this process and its children."""
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown backend '{backend}'. Choose from {BACKENDS}.")
+    os.environ[BACKEND_ENV] = backend
+    if data_dir:
+        os.environ[LOCAL_DATA_DIR_ENV] = data_dir
+
+
+def connect(
+    credentials: Union[str, Dict, None],
+    verbose: Optional[bool] = True,
+    backend: Optional[str] = None,
+    data_dir: Optional[str] = None,
+):
+    """
+    Returns an authenticated BigQ, or a LocalBigQ when the backend is 'local'.
+
+    Parameters
+    ----------
+    credentials : Union[str, Dict, None]
+        Service account key path or dictionary. Ignored by the local backend.
+    verbose : Optional[bool]
+        Whether to print verbose output.
+    backend : Optional[str]
+        'bigquery' or 'local'. Defaults to $SPS_BACKEND, then 'bigquery'.
+    data_dir : Optional[str]
+        Local table directory. Defaults to $SPS_LOCAL_DATA_DIR.
+    """
+    backend = backend or os.environ.get(BACKEND_ENV, "bigquery")
+    if backend == "local":
+        from bigq.local import LocalBigQ
+
+        data_dir = data_dir or os.environ.get(LOCAL_DATA_DIR_ENV)
+        if not data_dir:
+            raise ValueError("The local backend needs a data directory (LOCAL_DATA_DIR).")
+        bq = LocalBigQ(data_dir, verbose=verbose)
+    elif backend == "bigquery":
+        from bigq.bigq import BigQ
+
+        bq = BigQ(verbose=verbose)
+    else:
+        raise ValueError(f"Unknown backend '{backend}'. Choose from {BACKENDS}.")
+
+    bq.auth.authenticate(credentials)
+    return bq
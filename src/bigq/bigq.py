@@ -1,9 +1,9 @@
 import os
 import logging
 from datetime import datetime
-from typing import Optional, Union, Dict
-from google.cloud import bigquery
-from google.oauth2 import service_account
+from typing import Optional, Union, Dict, List, Tuple
+
+# google-cloud-bigquery is imported where it is used; it is slow to import.
 
 class Logging:
     def __init__(self, verbose: bool = True):
@@ -58,7 +58,7 @@ class BigQ:
             Whether to print verbose output.
         """
         self.authenticated = False
-        self.client: Optional[bigquery.Client] = None
+        self.client: Optional['bigquery.Client'] = None
         self.verbose = verbose
         self.logger = Logging(verbose)
         self.auth = self.Auth(self)
@@ -97,7 +97,48 @@ class BigQ:
             self.logger.error(f"Query failed: {e}")
             raise
 
-    def upload_gdf(self, gdf, table_id: str, write_disposition: str = "WRITE_TRUNCATE", autodetect: bool = True):
+    def execute(self, statement: str) -> int:
+        """
+        Execute a DML or DDL statement on BigQuery and wait for it to finish.
+
+        Parameters
+        ----------
+        statement : str
+            The SQL statement to execute.
+
+        Returns
+        -------
+        int
+            The number of rows affected by a DML statement (0 otherwise).
+
+        Raises
+        ------
+        RuntimeError
+            If the BigQuery client is not authenticated.
+        Exception
+            If the statement fails.
+        """
+        if not self.authenticated or self.client is None:
+            raise RuntimeError("BigQuery client is not authenticated. Please authenticate first.")
+
+        try:
+            query_job = self.client.query(statement)
+            query_job.result()
+            return query_job.num_dml_affected_rows or 0
+        except Exception as e:
+            self.logger.error(f"Statement failed: {e}")
+            raise
+
+    def upload_gdf(
+        self,
+        gdf,
+        table_id: str,
+        write_disposition: str = "WRITE_TRUNCATE",
+        autodetect: bool = True,
+        range_partition: Optional[Tuple[str, int, int, int]] = None,
+        clustering_fields: Optional[List[str]] = None,
+        job_id: Optional[str] = None,
+    ):
         """
         Uploads a GeoDataFrame to BigQuery.
 
@@ -111,6 +152,17 @@ class BigQ:
             The write disposition (default is "WRITE_TRUNCATE" to overwrite the table).
         autodetect : bool, optional
             Whether to autodetect the table schema (default is True).
+        range_partition : Tuple[str, int, int, int], optional
+            Integer range partitioning as (field, start, end, interval). Only
+            applied when the load job creates the table.
+        clustering_fields : List[str], optional
+            Fields to cluster the table by. Only applied when the load job
+            creates the table.
+        job_id : str, optional
+            ID of the load job. Calls with the same ID load the rows once:
+            if the job already exists (e.g. a retry after its result was
+            lost), it is waited for instead of loading the rows again.
+            See load_job.
 
         Raises
         ------
@@ -122,6 +174,8 @@ class BigQ:
         if not self.authenticated or self.client is None:
             raise RuntimeError("BigQuery client is not authenticated. Please authenticate first.")
 
+        from google.cloud import bigquery
+
         try:
             #self.logger.info("Preparing GeoDataFrame for upload...")
 
@@ -129,7 +183,7 @@ class BigQ:
             if "geometry" in gdf.columns:
                 gdf = gdf.copy()  # Avoid modifying the original
                 gdf["geometry"] = gdf["geometry"].apply(
-                    lambda geom: geom.wkt if not isinstance(geom, str) else geom
+                    lambda geom: geom.wkt if geom is not None and not isinstance(geom, str) else geom
                 )
 
             #self.logger.info("Uploading GeoDataFrame to BigQuery...")
@@ -137,13 +191,149 @@ class BigQ:
                 write_disposition=write_disposition,
                 autodetect=autodetect
             )
-            job = self.client.load_table_from_dataframe(gdf, table_id, job_config=job_config)
+            if (range_partition or clustering_fields) and not self.table_exists(table_id):
+                # a load into an existing table must match its partitioning:
+                # tables created by earlier versions are unpartitioned
+                if range_partition:
+                    field, start, end, interval = range_partition
+                    job_config.range_partitioning = bigquery.RangePartitioning(
+                        field=field,
+                        range_=bigquery.PartitionRange(start=start, end=end, interval=interval)
+                    )
+                if clustering_fields:
+                    job_config.clustering_fields = clustering_fields
+            if write_disposition == "WRITE_APPEND":
+                # allow new columns on tables created by earlier versions
+                job_config.schema_update_options = [
+                    bigquery.SchemaUpdateOption.ALLOW_FIELD_ADDITION
+                ]
+            if job_id:
+                job = self.load_job(gdf, table_id, job_config, job_id)
+            else:
+                job = self.client.load_table_from_dataframe(gdf, table_id, job_config=job_config)
             job.result()  # Wait for the load job to complete
             #self.logger.info(f"Uploaded {job.output_rows} rows to {table_id}")
         except Exception as e:
             self.logger.error(f"Failed to upload GeoDataFrame to BigQuery: {e}")
             raise
 
+    def load_job(self, gdf, table_id: str, job_config, job_id: str):
+        """
+        Starts the load job 'job_id', or returns it if it already exists
+        and is running or has committed, so its rows are not loaded twice.
+        An existing job that failed committed nothing: the rows are loaded
+        again as '<job_id>-1', '-2', ... under the same rule.
+        """
+        from google.api_core.exceptions import Conflict
+
+        attempt_id = job_id
+        for attempt in range(1, 100):
+            try:
+                return self.client.load_table_from_dataframe(
+                    gdf, table_id, job_config=job_config, job_id=attempt_id
+                )
+            except Conflict:
+                job = self.client.get_job(attempt_id)
+                if job.state != "DONE" or job.error_result is None:
+                    self.logger.info(f"Load job {attempt_id} already exists. Waiting for it instead of loading again.")
+                    return job
+            attempt_id = f"{job_id}-{attempt}"
+        raise RuntimeError(f"Too many failed load jobs for {job_id}")
+
+    def table_exists(self, table_id: str) -> bool:
+        """Whether the BigQuery table 'table_id' exists."""
+        from google.api_core.exceptions import NotFound
+
+        try:
+            self.client.get_table(table_id)
+        except NotFound:
+            return False
+        return True
+
+    def merge_gdf(
+        self,
+        gdf,
+        table_id: str,
+        key_fields: List[str],
+        deleted=None,
+        **upload_kwargs,
+    ) -> int:
+        """
+        Upserts a GeoDataFrame into a table and deletes rows by key, in one
+        atomic MERGE. The rows and the deleted keys are loaded to a temporary
+        staging table next to 'table_id', which is dropped afterwards.
+        Columns missing from the table are added. If the table does not
+        exist yet, the rows are uploaded with upload_gdf.
+
+        Parameters
+        ----------
+        gdf : geopandas.GeoDataFrame
+            Rows to insert, or to update where the key fields match a row.
+        table_id : str
+            The destination BigQuery table ID in the format 'project.dataset.table'.
+        key_fields : List[str]
+            Fields identifying a row.
+        deleted : pandas.DataFrame, optional
+            Key fields of the rows to delete.
+        **upload_kwargs
+            Passed through to upload_gdf (partitioning and clustering of a new table).
+
+        Returns
+        -------
+        int
+            The number of rows inserted, updated or deleted.
+        """
+        if not self.authenticated or self.client is None:
+            raise RuntimeError("BigQuery client is not authenticated. Please authenticate first.")
+
+        import uuid
+        import pandas as pd
+        from google.api_core.exceptions import NotFound
+
+        try:
+            table = self.client.get_table(table_id)
+        except NotFound:
+            if len(gdf):
+                self.upload_gdf(gdf, table_id, write_disposition="WRITE_APPEND", **upload_kwargs)
+            return len(gdf)
+
+        # rows to upsert and keys to delete share one staging table, told
+        # apart by _delete. Integer columns stay integers next to the null
+        # attributes of deleted keys.
+        columns = list(gdf.columns)
+        stage = pd.DataFrame(gdf).astype({
+            c: "Int64" for c in columns if pd.api.types.is_integer_dtype(gdf[c])
+        })
+        stage["_delete"] = False
+        if deleted is not None and len(deleted):
+            deleted = pd.DataFrame(deleted[key_fields]).assign(_delete=True)
+            stage = pd.concat([stage, deleted], ignore_index=True) if len(stage) else deleted
+
+        stage_id = f"{table_id}_merge_{uuid.uuid4().hex[:8]}"
+        try:
+            self.upload_gdf(stage, stage_id, write_disposition="WRITE_TRUNCATE")
+
+            missing = [f for f in self.client.get_table(stage_id).schema
+                       if f.name != "_delete" and f.name not in {t.name for t in table.schema}]
+            if missing:
+                table.schema = list(table.schema) + missing
+                self.client.update_table(table, ["schema"])
+
+            clauses = ["WHEN MATCHED AND S._delete THEN DELETE"]
+            if len(gdf):
+                values = [c for c in columns if c not in key_fields]
+                clauses.append("WHEN MATCHED THEN UPDATE SET " + ", ".join(f"`{c}` = S.`{c}`" for c in values))
+                clauses.append(
+                    f"WHEN NOT MATCHED AND NOT S._delete THEN INSERT ({', '.join(f'`{c}`' for c in columns)}) "
+                    f"VALUES ({', '.join(f'S.`{c}`' for c in columns)})"
+                )
+            on = " AND ".join(f"T.`{k}` = S.`{k}`" for k in key_fields)
+            return self.execute(
+                f"MERGE `{table_id}` T USING `{stage_id}` S ON {on}\n" + "\n".join(clauses)
+            )
+        finally:
+            self.client.delete_table(stage_id, not_found_ok=True)
+
 
     class Auth:
         def __init__(self, parent: 'BigQ'):
@@ -158,7 +348,7 @@ class BigQ:
             self.parent = parent
             self.credentials = None
 
-        def authenticate(self, credentials: Union[str, Dict]) -> bigquery.Client:
+        def authenticate(self, credentials: Union[str, Dict]) -> 'bigquery.Client':
             """
             Authenticate with BigQuery using a JSON file path or a credentials dictionary.
             
@@ -177,6 +367,9 @@ class BigQ:
             FileNotFoundError, TypeError, Exception
                 If credentials are invalid or authentication fails.
             """
+            from google.cloud import bigquery
+            from google.oauth2 import service_account
+
             try:
                 if isinstance(credentials, str):
                     if os.path.exists(credentials):
@@ -0,0 +1,370 @@
+import os
+import re
+import json
+import glob
+import uuid
+import time
+import tempfile
+import threading
+from typing import Optional, Union, Dict, List, Tuple
+import pandas as pd
+from bigq.bigq import Logging
+
+# SELECT <columns> FROM `<table>` [WHERE <conditions>]
+SELECT_RE = re.compile(
+    r"^\s*SELECT\s+(?P<columns>.+?)\s+FROM\s+`?(?P<table>[\w.\-]+)`?(?:\s+WHERE\s+(?P<where>.+?))?\s*;?\s*$",
+    re.IGNORECASE | re.DOTALL,
+)
+# DELETE FROM `<table>` WHERE <conditions>
+DELETE_RE = re.compile(
+    r"^\s*DELETE\s+FROM\s+`?(?P<table>[\w.\-]+)`?\s+WHERE\s+(?P<where>.+?)\s*;?\s*$",
+    re.IGNORECASE | re.DOTALL,
+)
+# <column> IN (<values>) | <column> = <value>
+CONDITION_RE = re.compile(
+    r"^\s*(?P<column>\w+)\s*(?:(?P<in>IN)\s*\((?P<values>.*)\)|=\s*(?P<value>.+?))\s*$",
+    re.IGNORECASE | re.DOTALL,
+)
+VALUE_RE = re.compile(r"TIMESTAMP\s*\(\s*'([^']*)'\s*\)|'([^']*)'|\"([^\"]*)\"|([-\d.]+)", re.IGNORECASE)
+
+# One lock per table path, shared by every client of the process: the
+# Uploader's threads merge, delete and append into the same part files.
+_TABLE_LOCKS: Dict[str, threading.RLock] = {}
+_TABLE_LOCKS_GUARD = threading.Lock()
+
+
+def table_lock(path: str) -> threading.RLock:
+    """Lock of the table at 'path' (see LocalBigQ.table_path)."""
+    path = os.path.abspath(path)
+    with _TABLE_LOCKS_GUARD:
+        return _TABLE_LOCKS.setdefault(path, threading.RLock())
+
+
+class LocalBigQ:
+    def __init__(self, data_dir: str, verbose: Optional[bool] = True):
+        """
+        Offline stand-in for BigQ that reads and writes local Parquet tables,
+        so the full pipeline runs without GCP credentials or network.
+
+        Table 'project.dataset.table' lives at <data_dir>/project/dataset/table,
+        either as a single table.parquet (GeoParquet) file or as a table/
+        directory of Parquet part files, one per upload.
+
+        Only the SQL the pipeline issues is supported:
+        SELECT <* | columns> FROM `table` [WHERE ...] and DELETE FROM `table` WHERE ...,
+        with conditions 'column IN (values)' or 'column = value' joined by AND.
+        MERGE is available as merge_gdf.
+
+        Parameters
+        ----------
+        data_dir : str
+            Root directory of the local tables.
+        verbose : Optional[bool]
+            Whether to print verbose output.
+        """
+        self.data_dir = data_dir
+        self.authenticated = False
+        self.client = None
+        self.verbose = verbose
+        self.logger = Logging(verbose)
+        self.auth = self.Auth(self)
+
+    def table_path(self, table_id: str) -> str:
+        """Directory path of a table (the single-file form adds '.parquet')."""
+        return os.path.join(self.data_dir, *table_id.split("."))
+
+    def table_files(self, table_id: str) -> List[str]:
+        path = self.table_path(table_id)
+        if os.path.isfile(path + ".parquet"):
+            return [path + ".parquet"]
+        return sorted(glob.glob(os.path.join(path, "*.parquet")))
+
+    def query(self, query: str):
+        """
+        Execute a SELECT on a local table.
+
+        Returns
+        -------
+        pandas.DataFrame or geopandas.GeoDataFrame
+            The query results. Tables with geometry are returned as GeoDataFrames.
+
+        Raises
+        ------
+        RuntimeError
+            If the client is not authenticated.
+        NotImplementedError
+            If the statement is outside the supported SQL subset.
+        FileNotFoundError
+            If the table does not exist.
+        """
+        if not self.authenticated:
+            raise RuntimeError("Local client is not authenticated. Please authenticate first.")
+
+        match = SELECT_RE.match(query)
+        if not match:
+            raise NotImplementedError(f"Unsupported query for local backend: {query.strip()}")
+
+        table_id = match.group("table")
+        files = self.table_files(table_id)
+        if not files:
+            raise FileNotFoundError(f"Local table not found: {self.table_path(table_id)}[.parquet]")
+
+        columns = match.group("columns").strip()
+        columns = None if columns == "*" else [c.strip().strip("`") for c in columns.split(",")]
+        conditions = parse_conditions(match.group("where"))
+
+        self.logger.info(f"Executing local query on {table_id}...")
+        frames = [read_table_file(f, columns, conditions) for f in files]
+        result = pd.concat(frames, ignore_index=True) if len(frames) > 1 else frames[0]
+        self.logger.info("Query executed successfully.")
+        return result
+
+    def execute(self, statement: str) -> int:
+        """
+        Execute a DELETE on a local table by rewriting its part files.
+
+        Returns
+        -------
+        int
+            The number of rows deleted.
+        """
+        if not self.authenticated:
+            raise RuntimeError("Local client is not authenticated. Please authenticate first.")
+
+        match = DELETE_RE.match(statement)
+        if not match:
+            raise NotImplementedError(f"Unsupported statement for local backend: {statement.strip()}")
+
+        table_id = match.group("table")
+        conditions = parse_conditions(match.group("where"))
+        deleted = 0
+        with table_lock(self.table_path(table_id)):
+            for path in self.table_files(table_id):
+                df = read_table_file(path)
+                mask = condition_mask(df, conditions)
+                if not mask.any():
+                    continue
+                deleted += int(mask.sum())
+                kept = df[~mask]
+                if len(kept):
+                    write_part(kept, path)
+                else:
+                    os.remove(path)
+        return deleted
+
+    def upload_gdf(
+        self,
+        gdf,
+        table_id: str,
+        write_disposition: str = "WRITE_TRUNCATE",
+        autodetect: bool = True,
+        range_partition: Optional[Tuple[str, int, int, int]] = None,
+        clustering_fields: Optional[List[str]] = None,
+        job_id: Optional[str] = None,
+    ):
+        """
+        Writes a GeoDataFrame to a local table as one Parquet part file.
+        'autodetect', 'range_partition', 'clustering_fields' and 'job_id'
+        are accepted for compatibility with BigQ.upload_gdf and ignored.
+        """
+        if not self.authenticated:
+            raise RuntimeError("Local client is not authenticated. Please authenticate first.")
+
+        path = self.table_path(table_id)
+        with table_lock(path):
+            existing = self.table_files(table_id)
+            if write_disposition == "WRITE_EMPTY" and existing:
+                raise ValueError(f"Local table {table_id} is not empty.")
+            if write_disposition == "WRITE_TRUNCATE":
+                for f in existing:
+                    os.remove(f)
+
+            os.makedirs(path, exist_ok=True)
+            part = os.path.join(path, f"part-{time.time_ns()}-{uuid.uuid4().hex[:8]}.parquet")
+            write_part(to_geodataframe(gdf), part)
+
+    def merge_gdf(
+        self,
+        gdf,
+        table_id: str,
+        key_fields: List[str],
+        deleted=None,
+        **upload_kwargs,
+    ) -> int:
+        """
+        Local equivalent of BigQ.merge_gdf: part files holding rows whose key
+        is upserted or deleted are rewritten without them, then the upserted
+        rows are written as a new part. Unlike the BigQuery MERGE, the
+        rewrite is not atomic across part files; merges, deletes and
+        uploads into one table are serialized by its table lock.
+
+        Returns
+        -------
+        int
+            The number of rows inserted, updated or deleted.
+        """
+        if not self.authenticated:
+            raise RuntimeError("Local client is not authenticated. Please authenticate first.")
+
+        upserted = pd.MultiIndex.from_frame(pd.DataFrame(gdf)[key_fields])
+        removed = upserted[:0]
+        if deleted is not None and len(deleted):
+            removed = pd.MultiIndex.from_frame(pd.DataFrame(deleted)[key_fields])
+
+        n_deleted = 0
+        with table_lock(self.table_path(table_id)):
+            for path in self.table_files(table_id):
+                df = read_table_file(path)
+                keys = pd.MultiIndex.from_frame(df[[resolve_column(df.columns, k) for k in key_fields]])
+                is_deleted = keys.isin(removed)
+                mask = is_deleted | keys.isin(upserted)
+                if not mask.any():
+                    continue
+                n_deleted += int(is_deleted.sum())
+                kept = df[~mask]
+                if len(kept):
+                    write_part(kept, path)
+                else:
+                    os.remove(path)
+
+            if len(gdf):
+                self.upload_gdf(gdf, table_id, write_disposition="WRITE_APPEND")
+        return len(gdf) + n_deleted
+
+
+    class Auth:
+        def __init__(self, parent: 'LocalBigQ'):
+            self.parent = parent
+            self.credentials = None
+
+        def authenticate(self, credentials: Union[str, Dict, None] = None) -> 'LocalBigQ':
+            """No credentials are needed locally. Checks the data directory exists."""
+            if not os.path.isdir(self.parent.data_dir):
+                raise FileNotFoundError(f"Local data directory not found: {self.parent.data_dir}")
+            self.parent.authenticated = True
+            self.parent.client = self.parent
+            self.parent.logger.info(f"Using local backend: {self.parent.data_dir}")
+            return self.parent
+
+
+def parse_conditions(where: Optional[str]) -> List[Tuple[str, list]]:
+    """Parses 'a IN (...) AND b = ...' into [(column, values), ...]."""
+    if not where:
+        return []
+    conditions = []
+    for part in re.split(r"\s+AND\s+", where.strip(), flags=re.IGNORECASE):
+        match = CONDITION_RE.match(part)
+        if not match:
+            raise NotImplementedError(f"Unsupported condition for local backend: {part.strip()}")
+        raw = match.group("values") if match.group("in") else match.group("value")
+        values = []
+        for ts, single, double, number in VALUE_RE.findall(raw):
+            if ts:
+                values.append(pd.Timestamp(ts))
+            elif number:
+                values.append(float(number) if "." in number else int(number))
+            else:
+                values.append(single or double)
+        conditions.append((match.group("column"), values))
+    return conditions
+
+
+def resolve_column(columns, name: str) -> str:
+    """BigQuery column names are case-insensitive."""
+    for column in columns:
+        if column.lower() == name.lower():
+            return column
+    raise KeyError(f"Column not found in local table: {name}")
+
+
+def condition_mask(df, conditions):
+    mask = pd.Series(True, index=df.index)
+    for column, values in conditions:
+        series = df[resolve_column(df.columns, column)]
+        if pd.api.types.is_datetime64_any_dtype(series):
+            values = [_as_utc(v) for v in values]
+            series = series.dt.tz_localize("UTC") if series.dt.tz is None else series
+        mask &= series.isin(values)
+    return mask
+
+
+def read_table_file(path: str, columns=None, conditions=()):
+    """
+    Reads one Parquet file of a local table with column projection and the
+    conditions pushed down to the reader.
+    """
+    import pyarrow.parquet as pq
+    import geopandas as gpd
+
+    schema = pq.read_schema(path)
+    names = schema.names
+    if columns is not None:
+        columns = [resolve_column(names, c) for c in columns]
+
+    filters = []
+    for column, values in conditions:
+        column = resolve_column(names, column)
+        if any(isinstance(v, pd.Timestamp) for v in values):
+            continue # timestamps are filtered below
+        filters.append((column, "in", values))
+
+    is_geo = schema.metadata is not None and b"geo" in schema.metadata
+    geo_column = None
+    if is_geo:
+        geo_column = json.loads(schema.metadata[b"geo"])["primary_column"]
+    read_columns = columns
+    if read_columns is not None:
+        # columns needed only for filtering are read and dropped after
+        read_columns = list(dict.fromkeys(
+            read_columns + [resolve_column(names, c) for c, _ in conditions]
+        ))
+
+    if is_geo and (read_columns is None or geo_column in read_columns):
+        df = gpd.read_parquet(path, columns=read_columns, filters=filters or None)
+    else:
+        df = pd.read_parquet(path, columns=read_columns, filters=filters or None)
+
+    timestamp_conditions = [
+        (c, v) for c, v in conditions if any(isinstance(x, pd.Timestamp) for x in v)
+    ]
+    if timestamp_conditions:
+        df = df[condition_mask(df, timestamp_conditions)]
+    if columns is not None:
+        df = df[columns]
+    return df.reset_index(drop=True)
+
+
+def to_geodataframe(df):
+    """Converts WKT or shapely 'geometry' columns to a GeoDataFrame in EPSG:4326."""
+    import geopandas as gpd
+
+    if isinstance(df, gpd.GeoDataFrame) or "geometry" not in df.columns:
+        return df
+    geometry = df["geometry"]
+    if len(geometry) and isinstance(geometry.iloc[0], str):
+        geometry = gpd.GeoSeries.from_wkt(geometry)
+    return gpd.GeoDataFrame(df.drop(columns="geometry"), geometry=geometry, crs="EPSG:4326")
+
+
+def write_part(df, path: str):
+    """
+    Writes a Parquet file under a unique temporary name in the same
+    directory and renames it, so readers never see a partial file.
+    """
+    fd, tmp_path = tempfile.mkstemp(
+        dir=os.path.dirname(path), prefix="." + os.path.basename(path) + "-", suffix=".tmp"
+    )
+    os.close(fd)
+    try:
+        df.to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def _as_utc(value):
+    if isinstance(value, pd.Timestamp) and value.tzinfo is None:
+        return value.tz_localize("UTC")
+    return value
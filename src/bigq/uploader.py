@@ -0,0 +1,296 @@
+import time
+import uuid
+import queue
+import threading
+from functools import lru_cache
+from typing import Optional, Union, Dict, Callable
+from bigq.bigq import BigQ, Logging
+from bigq.backend import connect
+
+
+@lru_cache(maxsize=1)
+def transient_errors() -> tuple:
+    """
+    Errors worth retrying; anything else (bad schema, permissions) fails fast.
+    Built on first use so importing the uploader does not import google-cloud.
+    """
+    from google.api_core import exceptions as api_exceptions
+    from requests import exceptions as requests_exceptions
+
+    return (
+        api_exceptions.TooManyRequests,
+        api_exceptions.InternalServerError,
+        api_exceptions.BadGateway,
+        api_exceptions.ServiceUnavailable,
+        api_exceptions.GatewayTimeout,
+        requests_exceptions.ConnectionError,
+        requests_exceptions.Timeout,
+        ConnectionError,
+        TimeoutError,
+    )
+
+
+class Uploader:
+    def __init__(
+        self,
+        credentials: Union[str, Dict],
+        n_threads: int = 2,
+        max_queue: int = 32,
+        max_retries: int = 5,
+        backoff: float = 2.0,
+        verbose: Optional[bool] = True,
+        bq: Optional[BigQ] = None,
+    ):
+        """
+        Background uploader that lives for the whole build.
+
+        Holds one authenticated BigQ client (and its pooled HTTP session) and
+        uploads GeoDataFrames from a bounded queue on a small thread pool, so
+        the caller only blocks when the queue is full. The client comes from
+        bigq.backend.connect, so the local backend is used when selected.
+
+        Parameters
+        ----------
+        credentials : Union[str, Dict]
+            The path to the JSON file or a dictionary containing the service account key.
+        n_threads : int
+            Number of upload threads.
+        max_queue : int
+            Maximum number of pending uploads before submit blocks.
+        max_retries : int
+            Maximum attempts for an upload failing with a transient error.
+        backoff : float
+            Base of the exponential backoff between retries, in seconds.
+        verbose : Optional[bool]
+            Whether to print verbose output.
+        bq : Optional[BigQ]
+            An already authenticated client to reuse instead of authenticating.
+        """
+        self.logger = Logging(verbose)
+        if bq is None:
+            bq = connect(credentials, verbose=verbose)
+        self.bq = bq
+
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.stats = []
+        self.failed = 0
+        self._lock = threading.Lock()
+        self._start = time.perf_counter()
+        self._threads = [
+            threading.Thread(target=self._worker, name=f"bq-uploader-{i}", daemon=True)
+            for i in range(n_threads)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def submit(
+        self,
+        gdf,
+        table_id: str,
+        write_disposition: str = "WRITE_APPEND",
+        callback: Optional[Callable[[bool], None]] = None,
+        **upload_kwargs,
+    ):
+        """
+        Queues a GeoDataFrame for upload. Blocks only if the queue is full.
+
+        Parameters
+        ----------
+        gdf : geopandas.GeoDataFrame
+            The GeoDataFrame to upload.
+        table_id : str
+            The destination BigQuery table ID in the format 'project.dataset.table'.
+        write_disposition : str, optional
+            The write disposition (default is "WRITE_APPEND").
+        callback : Callable[[bool], None], optional
+            Called from the upload thread with True on success, False on failure.
+        **upload_kwargs
+            Passed through to BigQ.upload_gdf.
+
+        Every attempt of the upload uses one load job ID, so a retry after
+        a transient error cannot append the rows twice (see BigQ.load_job).
+        """
+        upload_kwargs['write_disposition'] = write_disposition
+        upload_kwargs.setdefault('job_id', f"sps_load_{uuid.uuid4().hex}")
+        self.queue.put(('upload_gdf', gdf, table_id, callback, upload_kwargs))
+
+    def submit_merge(
+        self,
+        gdf,
+        table_id: str,
+        key_fields: list,
+        deleted=None,
+        callback: Optional[Callable[[bool], None]] = None,
+        **upload_kwargs,
+    ):
+        """
+        Queues an upsert of a GeoDataFrame and a delete of 'deleted' keys
+        (see BigQ.merge_gdf). Blocks only if the queue is full.
+
+        Parameters
+        ----------
+        gdf : geopandas.GeoDataFrame
+            Rows to insert or update.
+        table_id : str
+            The destination BigQuery table ID in the format 'project.dataset.table'.
+        key_fields : list
+            Fields identifying a row.
+        deleted : pandas.DataFrame, optional
+            Key fields of the rows to delete.
+        callback : Callable[[bool], None], optional
+            Called from the upload thread with True on success, False on failure.
+        **upload_kwargs
+            Passed through to BigQ.merge_gdf.
+        """
+        upload_kwargs.update(key_fields=key_fields, deleted=deleted)
+        self.queue.put(('merge_gdf', gdf, table_id, callback, upload_kwargs))
+
+    def submit_diff_merge(
+        self,
+        diff: Callable,
+        table_id: str,
+        key_fields: list,
+        callback: Optional[Callable[[bool], None]] = None,
+        **upload_kwargs,
+    ):
+        """
+        Queues a merge whose rows are computed on the upload thread, so
+        reading the previous output of a table does not block the caller.
+        Blocks only if the queue is full.
+
+        Parameters
+        ----------
+        diff : Callable
+            Called from the upload thread with the BigQ client. Returns the
+            (gdf, deleted) to merge (see submit_merge), or None when there
+            is nothing to merge. An error fails the job without a merge.
+        table_id : str
+            The destination BigQuery table ID in the format 'project.dataset.table'.
+        key_fields : list
+            Fields identifying a row.
+        callback : Callable[[bool], None], optional
+            Called from the upload thread with True on success (or nothing
+            to merge), False on failure.
+        **upload_kwargs
+            Passed through to BigQ.merge_gdf.
+        """
+        upload_kwargs['key_fields'] = key_fields
+        self.queue.put(('diff_merge', diff, table_id, callback, upload_kwargs))
+
+    def close(self):
+        """Waits for pending uploads to finish, stops the threads and logs a summary."""
+        for _ in self._threads:
+            self.queue.put(None)
+        for thread in self._threads:
+            thread.join()
+
+        summary = self.summary()
+        self.logger.info(
+            f"Uploads: {summary['uploads']} ok, {summary['failed']} failed, "
+            f"{summary['rows']} rows, {summary['mb']:.1f} MB, "
+            f"mean latency {summary['mean_latency_s']:.2f}s, "
+            f"throughput {summary['rows_per_s']:.0f} rows/s ({summary['mb_per_s']:.2f} MB/s)"
+        )
+        return summary
+
+    def summary(self) -> Dict:
+        """Per-build upload latency and throughput."""
+        with self._lock:
+            stats = list(self.stats)
+            failed = self.failed
+        elapsed = time.perf_counter() - self._start
+        rows = sum(s['rows'] for s in stats)
+        mb = sum(s['bytes'] for s in stats) / 1024 ** 2
+        latency = sum(s['seconds'] for s in stats)
+        return {
+            'uploads': len(stats),
+            'failed': failed,
+            'rows': rows,
+            'mb': mb,
+            'mean_latency_s': latency / len(stats) if stats else 0.0,
+            'max_latency_s': max((s['seconds'] for s in stats), default=0.0),
+            'rows_per_s': rows / elapsed if elapsed else 0.0,
+            'mb_per_s': mb / elapsed if elapsed else 0.0,
+        }
+
+    def _worker(self):
+        while True:
+            job = self.queue.get()
+            try:
+                if job is None:
+                    return
+                if job[0] == 'diff_merge':
+                    self._diff_merge(*job[1:])
+                else:
+                    self._upload(*job)
+            finally:
+                self.queue.task_done()
+
+    def _diff_merge(self, diff, table_id, callback, upload_kwargs):
+        try:
+            merge = diff(self.bq)
+        except Exception as e:
+            self.logger.error(f"Diff against {table_id} failed: {e}")
+            with self._lock:
+                self.failed += 1
+            self._callback(callback, table_id, False)
+            return
+
+        if merge is None:
+            self._callback(callback, table_id, True)
+            return
+        gdf, deleted = merge
+        self._upload('merge_gdf', gdf, table_id, callback, dict(upload_kwargs, deleted=deleted))
+
+    def _callback(self, callback, table_id, success):
+        if callback:
+            try:
+                callback(success)
+            except Exception as e:
+                self.logger.error(f"Upload callback for {table_id} failed: {e}")
+
+    def _upload(self, method, gdf, table_id, callback, upload_kwargs):
+        success = False
+        for attempt in range(1, self.max_retries + 1):
+            start = time.perf_counter()
+            try:
+                getattr(self.bq, method)(gdf, table_id, **upload_kwargs)
+            except transient_errors() as e:
+                if attempt == self.max_retries:
+                    self.logger.error(f"Upload to {table_id} failed after {attempt} attempts: {e}")
+                    break
+                wait = self.backoff ** attempt
+                self.logger.info(f"Transient upload error for {table_id} ({e}). Retrying in {wait:.0f}s...")
+                time.sleep(wait)
+                continue
+            except Exception as e:
+                self.logger.error(f"Upload to {table_id} failed: {e}")
+                break
+
+            seconds = time.perf_counter() - start
+            nbytes = int(gdf.memory_usage(deep=True).sum())
+            with self._lock:
+                self.stats.append({
+                    'table_id': table_id,
+                    'rows': len(gdf),
+                    'bytes': nbytes,
+                    'seconds': seconds,
+                    'attempts': attempt,
+                })
+            verb = "Merged" if method == 'merge_gdf' else "Uploaded"
+            self.logger.info(f"{verb} {len(gdf)} rows to {table_id} in {seconds:.2f}s")
+            success = True
+            break
+
+        if not success:
+            with self._lock:
+                self.failed += 1
+        self._callback(callback, table_id, success)
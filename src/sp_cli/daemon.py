@@ -0,0 +1,312 @@
+import os
+import logging
+import threading
+import traceback
+import contextlib
+from collections import OrderedDict
+from multiprocessing.connection import Listener, Client
+
+logger = logging.getLogger('sp_cmds')
+
+""" Warm build daemon: 'sps serve' and 'sps build --daemon' """
+
+SOCKET_ENV = "SPS_SOCKET"
+SOCKET_NAME = "sps.sock"
+
+
+def default_socket_path() -> str:
+    """$SPS_SOCKET, else sps.sock next to config.json."""
+    from sp_cli.helper import get_config_path
+
+    return os.environ.get(SOCKET_ENV) or str(get_config_path().parent / SOCKET_NAME)
+
+
+def warm_worker():
+    """
+    Pool initializer. Imports the clustering stack once per worker so
+    tasks start on a warm interpreter.
+    """
+    import sklearn.cluster
+    import scipy.spatial
+    import sp_cli.sp_build
+
+
+class CountyCache:
+    def __init__(self, max_counties: int = 8):
+        """
+        LRU of candidate parcels per county, projected to their UTM zone.
+        Entries are keyed by (source, fips), where 'source' identifies the
+        backend and input table the county was pulled from.
+
+        Parameters
+        ----------
+        max_counties : int
+            Counties kept in memory. The least recently used is evicted first.
+        """
+        self.max_counties = max_counties
+        self.hits = 0
+        self.misses = 0
+        self._counties = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, source: tuple, fips_list: list, load, refresh: bool = False) -> dict:
+        """
+        Returns {fips: projected GeoDataFrame} for the counties of 'fips_list'.
+        Counties not cached (all of them with 'refresh') are pulled with one
+        call to load(missing_fips), which returns candidate parcels in
+        EPSG:4326 with a FIPS column. Counties missing from the input are left out.
+        """
+        from sp_geoprocessing.utils import to_utm, compact_dtypes
+
+        with self._lock:
+            missing = [f for f in fips_list if refresh or (source, str(f)) not in self._counties]
+            self.hits += len(fips_list) - len(missing)
+            self.misses += len(missing)
+
+            if missing:
+                logger.info(f"County cache: pulling {len(missing)} of {len(fips_list)} counties")
+                candidate_gdf = load(missing)
+                fips_field = next((col for col in candidate_gdf.columns if 'fips' in col.lower()), None)
+                if fips_field is None:
+                    raise ValueError("No FIPS field found in the candidate GeoDataFrame.")
+                for county_fips, county_gdf in candidate_gdf.groupby(fips_field, sort=False, observed=True):
+                    county_gdf = compact_dtypes(to_utm(county_gdf)) # only this county's owners
+                    self._counties[(source, str(county_fips))] = (county_fips, county_gdf)
+                    self._counties.move_to_end((source, str(county_fips)))
+
+            counties = {}
+            for f in fips_list:
+                entry = self._counties.get((source, str(f)))
+                if entry is not None:
+                    self._counties.move_to_end((source, str(f)))
+                    counties[entry[0]] = entry[1]
+
+            while len(self._counties) > self.max_counties:
+                (_, evicted), _ = self._counties.popitem(last=False)
+                logger.debug(f"County cache: evicted {evicted}")
+            return counties
+
+    def stats(self) -> dict:
+        return {
+            'counties': [fips for _, fips in self._counties],
+            'parcels': sum(len(gdf) for _, gdf in self._counties.values()),
+            'hits': self.hits,
+            'misses': self.misses,
+        }
+
+
+class WarmSession:
+    def __init__(self, processes: int = 10, max_counties: int = 8):
+        """
+        State kept warm between builds by 'sps serve': a process pool whose
+        workers have the clustering stack imported, authenticated clients
+        per backend and credentials, and the projected county cache.
+
+        Parameters
+        ----------
+        processes : int
+            Pool size, the maximum number of concurrent tasks.
+        max_counties : int
+            Size of the county cache.
+        """
+        import multiprocessing
+        # fork after the imports so workers start with them loaded
+        import sp_cli.sp_build
+
+        self.processes = processes
+        self.counties = CountyCache(max_counties)
+        self.pool = multiprocessing.Pool(processes=processes, initializer=warm_worker)
+        self._clients = {}
+
+    def client(self, json_key, backend: str, data_dir: str = None):
+        """Authenticated BigQ or LocalBigQ, created on first use."""
+        from bigq.backend import connect
+
+        key = (backend, data_dir if backend == 'local' else json_key)
+        if key not in self._clients:
+            self._clients[key] = connect(json_key, backend=backend, data_dir=data_dir)
+        return self._clients[key]
+
+    def stats(self) -> dict:
+        return {
+            'pid': os.getpid(),
+            'processes': self.processes,
+            'clients': [backend for backend, _ in self._clients],
+            'county_cache': self.counties.stats(),
+        }
+
+    def close(self):
+        self.pool.terminate()
+        self.pool.join()
+
+
+class ClientStream:
+    """
+    Sends log records and stdout of a running job to the submitting client
+    as ('log', text) and ('out', text) messages. Upload threads and pool
+    callbacks log concurrently, so sends are serialized.
+    """
+    def __init__(self, conn):
+        self.conn = conn
+        self._lock = threading.Lock()
+        self.disconnected = False
+
+    def send(self, kind, payload):
+        with self._lock:
+            if self.disconnected:
+                return
+            try:
+                self.conn.send((kind, payload))
+            except (BrokenPipeError, ConnectionResetError, EOFError):
+                # the client went away, the job still finishes
+                self.disconnected = True
+
+    def write(self, text):
+        if not isinstance(text, str): # text only, like sys.stdout
+            raise TypeError(f"write() argument must be str, not {type(text).__name__}")
+        if text:
+            self.send('out', text)
+        return len(text)
+
+    def flush(self):
+        pass
+
+
+class StreamHandler(logging.Handler):
+    def __init__(self, stream: ClientStream):
+        super().__init__()
+        self.stream = stream
+
+    def emit(self, record):
+        try:
+            self.stream.send('log', self.format(record))
+        except Exception:
+            self.handleError(record)
+
+
+def run_job(session: WarmSession, request: dict, stream: ClientStream):
+    """
+    Runs one build request on the warm session, streaming its logs and
+    output to the client. Returns the build result.
+    """
+    from sp_cli.helper import load_config
+    from sp_cli.sp_cmds import BUILD_COMMANDS
+    from pathlib import Path
+
+    root = logging.getLogger()
+    handler = StreamHandler(stream)
+    handler.setFormatter(logging.Formatter(
+        "%(asctime)s - %(processName)s - %(name)s - %(levelname)s - %(message)s"
+    ))
+    level = root.level
+    root.addHandler(handler)
+    if request.get('verbose'):
+        root.setLevel(logging.DEBUG)
+    try:
+        with contextlib.redirect_stdout(stream):
+            config = load_config(Path(request['config_path']))
+            if not config:
+                logger.error('Cannot find config.json!!!')
+            return BUILD_COMMANDS[request['cmd']](
+                config,
+                request['version'],
+                session=session,
+                **request['params']
+            )
+    finally:
+        root.removeHandler(handler)
+        root.setLevel(level)
+
+
+def serve(socket_path: str = None, processes: int = 10, max_counties: int = 8):
+    """
+    Runs the build daemon on a Unix socket until a 'stop' request.
+    Jobs run one at a time in the order they connect.
+    """
+    import click
+
+    socket_path = socket_path or default_socket_path()
+    if os.path.exists(socket_path):
+        try:
+            Client(socket_path, family='AF_UNIX').close()
+        except (ConnectionRefusedError, FileNotFoundError):
+            os.remove(socket_path) # left behind by a daemon that died
+        else:
+            raise click.ClickException(f"A daemon is already listening on {socket_path}")
+
+    logger.info(f"Starting warm pool of {processes} workers...")
+    session = WarmSession(processes, max_counties)
+    old_umask = os.umask(0o177) # socket readable by the owner only
+    try:
+        listener = Listener(socket_path, family='AF_UNIX')
+    finally:
+        os.umask(old_umask)
+    logger.info(f"Listening on {socket_path}")
+
+    try:
+        while True:
+            with listener.accept() as conn:
+                try:
+                    request = conn.recv()
+                except EOFError:
+                    continue
+                cmd = request.get('cmd')
+
+                if cmd == 'stop':
+                    conn.send(('done', session.stats()))
+                    logger.info("Stop requested.")
+                    break
+                if cmd == 'status':
+                    conn.send(('done', session.stats()))
+                    continue
+                if cmd not in ('spfixed', 'spadaptive'):
+                    conn.send(('error', f"Unknown daemon command: {cmd}"))
+                    continue
+
+                logger.info(f"Job: {cmd} {request['params']}")
+                stream = ClientStream(conn)
+                try:
+                    result = run_job(session, request, stream)
+                    stream.send('done', result)
+                except click.ClickException as e:
+                    stream.send('error', e.format_message())
+                except Exception as e:
+                    logger.error(traceback.format_exc())
+                    stream.send('error', f"{type(e).__name__}: {e}")
+    finally:
+        listener.close()
+        session.close()
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        logger.info("Daemon stopped.")
+
+
+def submit(request: dict, socket_path: str = None):
+    """
+    Sends a request to the daemon and relays its streamed logs and output.
+    Returns the result of the request. Raises ConnectionError if no daemon
+    is listening and RuntimeError if the request failed.
+    """
+    import sys
+
+    socket_path = socket_path or default_socket_path()
+    try:
+        conn = Client(socket_path, family='AF_UNIX')
+    except (ConnectionRefusedError, FileNotFoundError):
+        raise ConnectionError(f"No sps daemon listening on {socket_path}. Start one with 'sps serve'.")
+
+    with conn:
+        conn.send(request)
+        while True:
+            try:
+                kind, payload = conn.recv()
+            except EOFError:
+                raise RuntimeError("The daemon closed the connection before the job finished.")
+            if kind == 'log':
+                print(payload, file=sys.stderr)
+            elif kind == 'out':
+                sys.stdout.write(payload)
+            elif kind == 'done':
+                return payload
+            elif kind == 'error':
+                raise RuntimeError(payload)
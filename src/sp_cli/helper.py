@@ -1,20 +1,49 @@
 import os
 import ast
-import geopandas as gpd
+import glob
+import shutil
 from typing import List, Tuple, Union
-import pandas as pd
-from shapely import wkt
 from platformdirs import user_config_dir
 from pathlib import Path
 import json
-import subprocess
 import click
-import importlib.metadata
-import multiprocessing
 import logging
+from sp_cli.manifest import (
+    task_param_hash,
+    STAGED,
+    UPLOADING,
+    DONE,
+    EMPTY,
+    FAILED
+)
 
 logger = logging.getLogger('sp_cmds')
 
+# pandas, geopandas, shapely, the BigQuery client and the profiling and
+# multiprocessing modules are imported inside the functions that use them so
+# the CLI starts fast (see benchmarks/check_importtime.py).
+
+# Output tables are range-partitioned on the integer FIPS in state-sized
+# buckets (BigQuery caps the partition count) and clustered on county FIPS.
+FIPS_PARTITION = ('fips_int', 1000, 80000, 1000)
+FIPS_CLUSTERING = ['fips']
+# Incremental uploads match output rows on these fields
+MERGE_KEYS = ['fips', 'sp_id']
+# Adaptive builds have no single distance threshold. Their tasks are
+# recorded in the run manifest with this dt.
+ADAPTIVE_DT = 0
+# Adaptive options named in the output table when not at their default
+# (see run_spadaptive): (option, name prefix, default, KNN mode using it or None for both)
+ADAPTIVE_NAME_OPTIONS = (
+    ('knn_mode', 'km', 'regional', None),
+    ('max_parcels_per_region', 'mpr', 200, 'regional'),
+    ('kneighbors', 'k', 3, None),
+    ('smoothing_window', 'sw', 0.5, 'regional'),
+    ('min_urban_distance', 'mind', 15, None),
+    ('max_urban_distance', 'maxd', 120, None),
+    ('cell_size', 'cs', 100, 'field'),
+    ('smoothing_radius', 'sr', 500, 'field'),
+)
 
 
 def check_paths(*args):
@@ -31,6 +60,27 @@ def build_filename(prefix, delimiter, suffix, *args):
     args_str = delimiter.join(map(str, args))
     return f"{prefix}-{args_str}-{suffix}"
 
+def output_name(meta):
+    """
+    Output table (and local file) name of a task from its metadata, e.g.
+    'spfixed-ss3-dt200', 'spfixed-ss3-at500-dt200', 'spfixed-ss3-rdt300-dt200'
+    (built by place, see process_place_batch), 'spadaptive-ss3-knn' or
+    'spadaptive-ss3-kmfield-mind10-rdt200-knn' (options not at their default,
+    see ADAPTIVE_NAME_OPTIONS, and the rural distance when built by place).
+    """
+    args = [f"ss{meta['ss']}"] + ([f"at{meta['at']}"] if meta['at'] else [])
+    if meta.get('product') == 'spadaptive':
+        adaptive = meta['adaptive']
+        for option, prefix, default, knn_mode in ADAPTIVE_NAME_OPTIONS:
+            if adaptive[option] != default and knn_mode in (None, adaptive['knn_mode']):
+                # no dots in table names: 0.25 is 0p25
+                args.append(prefix + str(adaptive[option]).replace('.', 'p'))
+    if meta.get('rural_dt') is not None:
+        args.append(f"rdt{meta['rural_dt']}")
+    if meta.get('product') == 'spadaptive':
+        return build_filename('spadaptive', '-', 'knn', *args)
+    return build_filename('spfixed', '-', f"dt{meta['dt']}", *args)
+
 def parse_to_str_list(ctx, param, value):
     if not value:
         return None
@@ -156,25 +206,26 @@ def sql_query(path, fips_list):
 def bigquery_to_gdf(
     json_key: str,
     sql_query: str,
-    verbose: bool = True
+    verbose: bool = True,
+    bq=None
     ):
     """
-    Pulls a BigQuery table to input geodataframe
+    Pulls a BigQuery table to input geodataframe.
+    Uses the local backend when selected (see bigq.backend).
 
     Args:
     json_key (str): Path to the JSON key file.
     sql_query (str): SQL query to execute
     verbose (bool): If true, log messages will be printed to the console.
+    bq (BigQ): Authenticated client to reuse. If None, one is created from json_key.
     """
     import geopandas as gpd
     from shapely import wkt
-    from bigq.bigq import BigQ
-
-    bq = BigQ(verbose=verbose)
+    from bigq.backend import connect
 
     # AUTH
     try:
-        bq.auth.authenticate(json_key)
+        bq = bq or connect(json_key, verbose=verbose)
     except Exception as auth_error:
         print(f"Authentication error: {auth_error}")
         return
@@ -188,6 +239,9 @@ def bigquery_to_gdf(
         logger.info(f"Query: {sql_query}")
         return
 
+    if isinstance(result_df, gpd.GeoDataFrame): # local backend reads GeoParquet
+        return result_df.to_crs('EPSG:4326')
+
     result_df['geometry'] = result_df['geometry'].apply(wkt.loads)
     gdf = gpd.GeoDataFrame(result_df, geometry='geometry', crs='EPSG:4326')
 
@@ -195,10 +249,12 @@ def bigquery_to_gdf(
 
 def gdf_to_bigquery(
     json_key: str,
-    gdf: gpd.GeoDataFrame,
+    gdf: 'gpd.GeoDataFrame',
     table_name: str,
     write_type: str = "WRITE_APPEND",
-    verbose: bool = True
+    verbose: bool = True,
+    range_partition: Tuple[str, int, int, int] = FIPS_PARTITION,
+    clustering_fields: List[str] = FIPS_CLUSTERING,
 ):
     """
     Pushes a geodataframe to BigQuery
@@ -208,14 +264,16 @@ def gdf_to_bigquery(
     gdf (gpd.GeoDataFrame): Geodataframe to push.
     table_name (str): Name of the BigQuery table.
     verbose (bool): If true, log messages will be printed to the console.
-    """
-    from bigq.bigq import BigQ
+    range_partition (tuple): Integer range partitioning (field, start, end, interval).
+    clustering_fields (list): Fields to cluster the table by.
 
-    bq = BigQ(verbose=verbose)
+    Returns True if the upload succeeded.
+    """
+    from bigq.backend import connect
 
     # AUTH
     try:
-        bq.auth.authenticate(json_key)
+        bq = connect(json_key, verbose=verbose)
     except Exception as auth_error:
         print(f"Authentication error: {auth_error}")
         return
@@ -225,12 +283,180 @@ def gdf_to_bigquery(
         bq.upload_gdf(
             gdf=gdf, 
             table_id=table_name,
-            write_disposition=write_type)
+            write_disposition=write_type,
+            range_partition=range_partition,
+            clustering_fields=clustering_fields)
     
     except Exception as push_error:
         logger.info(f"Push error: {push_error}")
         return
 
+    return True
+
+def stage_result(result, staging_dir, table_name, fips):
+    """
+    Writes a result to the local staging area for a later consolidated load.
+    Geometry is stored as WKT. The file is written under a temporary name and
+    renamed, so a partially written result is never picked up by a flush.
+    Returns the staged file path.
+    """
+    import pandas as pd
+
+    table_dir = os.path.join(staging_dir, table_name)
+    os.makedirs(table_dir, exist_ok=True)
+    out_path = os.path.join(table_dir, f"{fips}.parquet")
+    tmp_path = out_path + '.tmp'
+
+    df = pd.DataFrame(result.drop(columns='geometry'))
+    df['geometry'] = result.geometry.to_wkt()
+    df.to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, out_path)
+    return out_path
+
+def staged_size_mb(staging_dir, table_name):
+    """
+    Total size in MB of the results staged for an output table.
+    """
+    files = glob.glob(os.path.join(staging_dir, table_name, '*.parquet'))
+    return sum(os.path.getsize(f) for f in files) / 1024 ** 2
+
+def flush_staged_results(json_key, staging_dir, bq_output_dir, table_names=None, uploader=None, manifest=None):
+    """
+    Issues one BigQuery load job per output table from the staged results.
+    Files being loaded are renamed to *.loading so later results and flushes
+    skip them. They are removed once the load succeeds and restored if it
+    fails, so a failed flush can be retried from the staging directory.
+
+    Args:
+    json_key (str): Path to the JSON key file.
+    staging_dir (str): Local staging directory.
+    bq_output_dir (str): BigQuery dataset prefix for output tables.
+    table_names (list): Tables to flush. Defaults to every staged table.
+    uploader (Uploader): Background uploader. If None, loads synchronously.
+    manifest (RunManifest): Run manifest updated with the load status of each staged task.
+    """
+    import pandas as pd
+
+    if not os.path.isdir(staging_dir):
+        return
+
+    for table_name in table_names or sorted(os.listdir(staging_dir)):
+        files = sorted(glob.glob(os.path.join(staging_dir, table_name, '*.parquet')))
+        if not files:
+            continue
+
+        table_id = f"{bq_output_dir}.{table_name}"
+        loading = [f + '.loading' for f in files]
+        for f, lf in zip(files, loading):
+            os.replace(f, lf)
+        if manifest:
+            manifest.set_status_by_staged(files, UPLOADING, output=table_id)
+
+        def on_done(success, table_name=table_name, files=files, loading=loading):
+            for f, lf in zip(files, loading):
+                if success:
+                    os.remove(lf)
+                else:
+                    os.replace(lf, f)
+            if manifest:
+                manifest.set_status_by_staged(files, DONE if success else STAGED)
+            if success:
+                logger.info(f"Staged load successful: {table_name}")
+            else:
+                logger.error(f"Staged load failed for {table_name}. Staged files kept in {staging_dir}.")
+
+        df = pd.concat([pd.read_parquet(f) for f in loading], ignore_index=True)
+        logger.info(f"Loading {len(files)} staged results ({len(df)} rows) to {table_id}")
+
+        if uploader:
+            uploader.submit(
+                df,
+                table_id,
+                write_disposition='WRITE_APPEND',
+                callback=on_done,
+                range_partition=FIPS_PARTITION,
+                clustering_fields=FIPS_CLUSTERING
+            )
+        else:
+            on_done(bool(gdf_to_bigquery(
+                json_key=json_key,
+                gdf=df,
+                table_name=table_id,
+                write_type='WRITE_APPEND'
+            )))
+
+def delete_partial_outputs(bq, manifest, timestamp):
+    """
+    Removes rows a previous attempt of this run may have loaded for tasks
+    that never reached 'done', so re-running them cannot duplicate rows.
+    BigQuery load jobs are atomic, so a task's rows are either all present
+    or absent and can be identified by fips and the run timestamp.
+
+    Args:
+    bq (BigQ): Authenticated BigQuery client.
+    manifest (RunManifest): Run manifest of the resumed build.
+    timestamp (datetime): Timestamp of the resumed run.
+    """
+    for task in manifest.tasks([UPLOADING, FAILED]):
+        if not task['output']:
+            continue # never reached upload
+
+        logger.info(f"Removing partial output for {task['fips']} dt {task['dt']} from {task['output']}")
+        bq.execute(f"""
+            DELETE FROM `{task['output']}`
+            WHERE fips = '{task['fips']}' AND timestamp = TIMESTAMP('{timestamp.isoformat()}')
+        """)
+        status = STAGED if task['staged'] and os.path.exists(task['staged']) else FAILED
+        manifest.set_status(task['fips'], task['dt'], task['param_hash'], status)
+
+def previous_output(bq, table_id, fips):
+    """
+    sp_id and sp_hash of the superparcels a previous build wrote for 'fips'
+    to 'table_id'. Tables written before sp_hash was added return sp_id
+    only, and a missing table returns no rows. Any other error (auth,
+    network, quota) is raised, so the task fails instead of treating the
+    county as new and leaving its stale superparcels in the table.
+    """
+    import pandas as pd
+
+    query = f"SELECT {{columns}} FROM `{table_id}` WHERE fips = '{fips}'"
+    try:
+        return bq.query(query.format(columns='sp_id, sp_hash'))
+    except Exception as e:
+        if is_missing_table(e):
+            logger.debug(f"No previous output in {table_id}: {e}")
+            return pd.DataFrame({'sp_id': pd.Series(dtype=str)})
+        if not is_missing_column(e, 'sp_hash'):
+            raise
+    logger.debug(f"No sp_hash in {table_id}: previous output compared by sp_id")
+    return bq.query(query.format(columns='sp_id'))
+
+
+def is_missing_table(error):
+    """Whether 'error' is a BigQuery or local backend table-not-found error."""
+    if isinstance(error, FileNotFoundError): # local backend
+        return True
+    try:
+        from google.api_core.exceptions import NotFound
+    except ImportError:
+        return False
+    return isinstance(error, NotFound)
+
+
+def is_missing_column(error, column):
+    """
+    Whether 'error' is a BigQuery or local backend error about 'column'
+    missing from the table.
+    """
+    if isinstance(error, KeyError): # local backend (see bigq.local.resolve_column)
+        return column.lower() in str(error).lower()
+    try:
+        from google.api_core.exceptions import BadRequest
+    except ImportError:
+        return False
+    # BigQuery: "Unrecognized name: <column>"
+    return isinstance(error, BadRequest) and f'unrecognized name: {column}'.lower() in str(error).lower()
+
 """
 def download_from_gcs(json_key, gcs_path, local_dir):
     try:
@@ -250,6 +476,8 @@ def csv_conversion(csv_path, crs='EPSG:4326', dtypes=None):
         """
         Convert a CSV file to a dataframe
         """
+        import pandas as pd
+
         df = pd.read_csv(csv_path, dtype=dtypes, compression='gzip', encoding='utf-8')
 
         return df
@@ -261,6 +489,9 @@ def get_fips(df, filter_by='FIPS'):
     return df[filter_by].unique().tolist()
 
 def shp_conversion(df, crs='EPSG:4326', where=None):
+    import geopandas as gpd
+    from shapely import wkt
+
     if where:
         df = df.query(where) # sql-like query
 
@@ -268,8 +499,19 @@ def shp_conversion(df, crs='EPSG:4326', where=None):
 
     return gdf
 
+def candidate_fields(candidate_gdf) -> Tuple[str, str, str]:
+    """
+    Owner, FIPS and PUID field names of the candidate parcels,
+    the first column containing 'owner', 'fips' and 'puid'. None if missing.
+    """
+    def find(name):
+        return next((col for col in candidate_gdf.columns if name in col.lower()), None)
+
+    return find('owner'), find('fips'), find('puid')
+
+
 def build_sp_args(
-    candidate_gdf: gpd.GeoDataFrame,
+    candidate_gdf: 'gpd.GeoDataFrame',
     fips_field: str,
     dist_thres: List[Union[int, float]],
     owner_field: str,
@@ -282,6 +524,19 @@ def build_sp_args(
     bq_upload: bool,
     local_upload: bool,
     json_key: str,
+    stage_dir: str = None,
+    stage_flush_mb: int = None,
+    checkpoint_root: str = None,
+    resume_manifest=None,
+    county_gdfs: dict = None,
+    puid_field: str = None,
+    incremental: bool = False,
+    owner_cache: str = None,
+    owner_cache_mb: int = 2048,
+    neighbor_graph_dir: str = None,
+    neighbor_max_distance: int = 500,
+    places: 'PlaceIndex' = None,
+    rural_dt: Union[int, float] = None,
 ) -> List[Tuple]:
     
     
@@ -316,6 +571,38 @@ def build_sp_args(
         If True, save locally.
     json_key : str
         Path to the JSON key file for BigQuery authentication.
+    stage_dir : str, optional
+        Local staging directory. If set, BigQuery results are staged and
+        loaded once per output table instead of once per task.
+    stage_flush_mb : int, optional
+        Flush a staged table early once it exceeds this many MB.
+    checkpoint_root : str, optional
+        Root directory for per-task owner-shard checkpoints.
+    resume_manifest : RunManifest, optional
+        If given, tasks already complete in this manifest are skipped.
+    county_gdfs : dict, optional
+        Parcels already split by FIPS ({fips: GeoDataFrame}), e.g. the
+        projected counties cached by 'sps serve'. Used instead of
+        subsetting candidate_gdf, which may then be None.
+    puid_field : str, optional
+        The source parcel ID field, from which sp_ids are hashed.
+    incremental : bool, optional
+        If True, results are diffed against the previous output and only
+        the changes are uploaded.
+    owner_cache : str, optional
+        Path to the owner cache shared by all tasks. If None, no cache.
+    owner_cache_mb : int, optional
+        Size cap of the owner cache in MB.
+    neighbor_graph_dir : str, optional
+        Directory of the per-county neighbor graphs. If None, no graphs.
+    neighbor_max_distance : int, optional
+        Largest same-owner distance stored in a neighbor graph.
+    places : PlaceIndex, optional
+        Place boundaries (see sp_geoprocessing.places). If given, every
+        place of a county is built as its own task (see process_place_batch).
+    rural_dt : int or float, optional
+        Distance threshold of the parcels outside every place. If None,
+        the distance threshold of the task.
 
 
     Returns
@@ -324,14 +611,35 @@ def build_sp_args(
         A list of argument tuples for processing.
     """
 
-    fips_to_process = candidate_gdf[fips_field].unique()
+    from sp_geoprocessing.utils import compact_dtypes
+
+    if county_gdfs is not None:
+        fips_to_process = list(county_gdfs)
+    else:
+        fips_to_process = list(candidate_gdf[fips_field].unique())
     logger.info(f"FIPS in table: {fips_to_process}")
     sp_args = []
+    places_digest = places.digest if places is not None else None
 
     for dt in dist_thres:
+        place_params = {}
+        if places is not None:
+            place_params = {'places': places_digest, 'rural_dt': rural_dt or dt}
+        param_hash = task_param_hash(dt=dt, ss=sample_size, at=area_threshold, version=version, **place_params)
         for county_fips in fips_to_process:
+            if resume_manifest and resume_manifest.is_complete(county_fips, dt, param_hash):
+                logger.info(f"Skipping completed FIPS: {county_fips} with distance {dt}")
+                continue
+
             logger.info(f"Collecting FIPS: {county_fips} with distance {dt}")
-            fips_gdf = candidate_gdf[candidate_gdf[fips_field] == county_fips]
+            checkpoint_dir = None
+            if checkpoint_root:
+                checkpoint_dir = os.path.join(checkpoint_root, f"{county_fips}-dt{dt}-{param_hash}")
+            if county_gdfs is not None:
+                fips_gdf = county_gdfs[county_fips]
+            else:
+                # drop the other counties' owners from the categorical dictionaries
+                fips_gdf = compact_dtypes(candidate_gdf[candidate_gdf[fips_field] == county_fips])
 
             sp_args.append((
                 fips_gdf,
@@ -346,14 +654,121 @@ def build_sp_args(
                 local_output_dir,
                 bq_upload,
                 local_upload,
-                json_key
+                json_key,
+                stage_dir,
+                stage_flush_mb,
+                param_hash,
+                checkpoint_dir,
+                puid_field,
+                incremental,
+                owner_cache,
+                owner_cache_mb,
+                neighbor_graph_dir,
+                neighbor_max_distance,
+                places,
+                (rural_dt or dt) if places is not None else None
             ))
 
     return sp_args
 
 
+def build_sp_adaptive_args(
+    candidate_gdf: 'gpd.GeoDataFrame',
+    fips_field: str,
+    owner_field: str,
+    sample_size: int,
+    area_threshold: float,
+    adaptive: dict,
+    timestamp: str,
+    version: str,
+    bq_output_dir: str,
+    local_output_dir: str,
+    bq_upload: bool,
+    local_upload: bool,
+    json_key: str,
+    stage_dir: str = None,
+    stage_flush_mb: int = None,
+    places: 'PlaceIndex' = None,
+    resume_manifest=None,
+    county_gdfs: dict = None,
+    puid_field: str = None,
+    incremental: bool = False,
+) -> List[Tuple]:
+    """
+    Builds a list of argument tuples for adaptive-epsilon superparcels,
+    one per FIPS. Positions 6 to 15 and 18 hold the same task settings as
+    the tuples of build_sp_args.
+
+    Parameters
+    ----------
+    adaptive : dict
+        Region and distance parameters of build_sp_adaptive_place
+        (max_parcels_per_region, kneighbors, smoothing_window,
+        min_urban_distance, max_urban_distance, rural_distance, knn_mode)
+        and the grid of the 'field' KNN mode (cell_size, smoothing_radius).
+    places : PlaceIndex, optional
+        Place boundaries (see sp_geoprocessing.places). If None, each
+        county is one place.
+
+    See build_sp_args for the other parameters.
+
+    Returns
+    -------
+    List[Tuple]
+        A list of argument tuples for process_adaptive_batch.
+    """
+    from sp_geoprocessing.utils import compact_dtypes
+
+    if county_gdfs is not None:
+        fips_to_process = list(county_gdfs)
+    else:
+        fips_to_process = list(candidate_gdf[fips_field].unique())
+    logger.info(f"FIPS in table: {fips_to_process}")
+
+    param_hash = task_param_hash(
+        dt='adaptive', ss=sample_size, at=area_threshold, version=version, **adaptive,
+        places=None if places is None else places.digest
+    )
+    sp_args = []
+    for county_fips in fips_to_process:
+        if resume_manifest and resume_manifest.is_complete(county_fips, ADAPTIVE_DT, param_hash):
+            logger.info(f"Skipping completed FIPS: {county_fips}")
+            continue
+
+        logger.info(f"Collecting FIPS: {county_fips}")
+        if county_gdfs is not None:
+            fips_gdf = county_gdfs[county_fips]
+        else:
+            fips_gdf = compact_dtypes(candidate_gdf[candidate_gdf[fips_field] == county_fips])
+
+        sp_args.append((
+            fips_gdf,
+            county_fips,
+            owner_field,
+            sample_size,
+            area_threshold,
+            adaptive,
+            timestamp,
+            version,
+            bq_output_dir,
+            local_output_dir,
+            bq_upload,
+            local_upload,
+            json_key,
+            stage_dir,
+            stage_flush_mb,
+            param_hash,
+            places,
+            puid_field,
+            incremental
+        ))
+
+    return sp_args
+
 
 def get_git_commit_hash(short: bool = True) -> str:
+    import subprocess
+
     try:
         cmd = ["git", "rev-parse", "--short" if short else "HEAD"]
         print(os.getcwd())
@@ -384,6 +799,8 @@ def save_config(config_path: str = None, config: dict = None) -> None:
 
 
 def get_version():
+    import importlib.metadata
+
     try:
         version = importlib.metadata.version("superparcels")
     except importlib.metadata.PackageNotFoundError:
@@ -412,11 +829,21 @@ def create_batches(arg_tuples, batch_size):
 def parse_sp_fixed_args(task_tuple):
     """
     Parses a tuple of arguments for the build_sp_fixed function.
-    Returns the parsed arguments as a dictionary.
+    Returns the positional build arguments, the keyword build arguments
+    and the task metadata as a dictionary.
     """
     sp_fixed_build_args = task_tuple[:6]  # Extract the first six arguments for the function
+    sp_fixed_build_kwargs = {
+        'checkpoint_dir': task_tuple[16],
+        'puid_field': task_tuple[17],
+        'owner_cache': task_tuple[19],
+        'owner_cache_mb': task_tuple[20],
+        'neighbor_graph_dir': task_tuple[21],
+        'neighbor_max_distance': task_tuple[22]
+    }
 
     meta = {
+        'product': 'spfixed',
         'fips': task_tuple[1],
         'dt': task_tuple[3],
         'ss': task_tuple[4],
@@ -427,16 +854,63 @@ def parse_sp_fixed_args(task_tuple):
         'local_output_dir': task_tuple[9],
         'bq_upload': task_tuple[10],
         'local_upload': task_tuple[11],
-        'json_key': task_tuple[12]
+        'json_key': task_tuple[12],
+        'stage_dir': task_tuple[13],
+        'stage_flush_mb': task_tuple[14],
+        'param_hash': task_tuple[15],
+        'checkpoint_dir': task_tuple[16],
+        'incremental': task_tuple[18],
+        'rural_dt': task_tuple[24]
     }
 
-    return sp_fixed_build_args, meta
+    return sp_fixed_build_args, sp_fixed_build_kwargs, meta
 
 
-def process_result(result, meta):
+def parse_sp_adaptive_args(task_tuple):
+    """
+    Parses a tuple of arguments of an adaptive build (see
+    build_sp_adaptive_args) for the build_sp_adaptive function.
+    Returns the positional build arguments, the keyword build arguments
+    and the task metadata as a dictionary.
+    """
+    sp_adaptive_build_args = task_tuple[:3]
+    sp_adaptive_build_kwargs = {
+        'rural_distance': task_tuple[5]['rural_distance'],
+        'area_threshold': task_tuple[4],
+        'knn_mode': task_tuple[5]['knn_mode'],
+    }
+
+    meta = {
+        'product': 'spadaptive',
+        'fips': task_tuple[1],
+        'dt': ADAPTIVE_DT,
+        'ss': task_tuple[3],
+        'at': task_tuple[4],
+        'timestamp': task_tuple[6],
+        'version': task_tuple[7],
+        'bq_output_dir': task_tuple[8],
+        'local_output_dir': task_tuple[9],
+        'bq_upload': task_tuple[10],
+        'local_upload': task_tuple[11],
+        'json_key': task_tuple[12],
+        'stage_dir': task_tuple[13],
+        'stage_flush_mb': task_tuple[14],
+        'param_hash': task_tuple[15],
+        'checkpoint_dir': None,
+        'incremental': task_tuple[18],
+        'adaptive': task_tuple[5],
+        # places, or their digest once clustered (see cluster_places)
+        'rural_dt': None if task_tuple[16] is None else task_tuple[5]['rural_distance'],
+    }
+
+    return sp_adaptive_build_args, sp_adaptive_build_kwargs, meta
+
+
+def process_result(result, meta, uploader=None, manifest=None):
     """
     Callback to process each completed task.
     'meta' contains:
+      - product: 'spfixed' or 'spadaptive' (see output_name)
       - fips: the FIPS code for logging
       - dt: distance threshold
       - ss: sample size
@@ -448,34 +922,43 @@ def process_result(result, meta):
         - bq_upload: boolean for BigQuery upload
         - local_upload: boolean for local upload
         - json_key: path to the JSON key file
-
+        - stage_dir: local staging directory (None uploads directly)
+        - stage_flush_mb: staged table size that triggers an early flush
+        - param_hash: hash of the task parameters (manifest key)
+        - checkpoint_dir: owner-shard checkpoint directory of the task
+        - incremental: upload only the changes from the previous output
+    'uploader' is the build's background Uploader. If None, BigQuery uploads
+    run synchronously in the callback.
+    'manifest' is the build's RunManifest. If None, task status is not recorded.
     """
+    def set_status(status, **kwargs):
+        if manifest:
+            manifest.set_status(meta['fips'], meta['dt'], meta['param_hash'], status, **kwargs)
+        if status in (STAGED, DONE, EMPTY) and meta['checkpoint_dir']:
+            shutil.rmtree(meta['checkpoint_dir'], ignore_errors=True)
+
+    # Build filename based on the parameters
+    fn = output_name(meta)
+    output_table_name = f"{meta['bq_output_dir']}.{fn}"
+
     if result is None or len(result) == 0:
         logger.error(f"No results for {meta['fips']}. Skipping...")
+        if meta['bq_upload'] and meta['incremental']:
+            # superparcels of the previous build are deleted
+            upload_changes(None, meta, output_table_name, set_status, uploader, done_status=EMPTY)
+        else:
+            set_status(EMPTY)
         return
 
+    from sp_geoprocessing.superparcels import hash_rows
+
+    # Content hash, to diff the next build against this one
+    result['sp_hash'] = hash_rows(result)
+
     # Add timestamp and version field to the result
     result['timestamp'] = meta['timestamp']
     result['version'] = meta['version']
 
-    # Build filename based on the parameters
-    if meta['at']:
-        fn = build_filename('spfixed', '-', f"dt{meta['dt']}", f"ss{meta['ss']}", f"at{meta['at']}")
-    else:
-        fn = build_filename('spfixed', '-', f"dt{meta['dt']}", f"ss{meta['ss']}")
-
-    # Upload to BigQuery if enabled
-    if meta['bq_upload']:
-        output_table_name = f"{meta['bq_output_dir']}.{fn}"
-        logger.info(f"Uploading to BigQuery for {meta['fips']}: {output_table_name}")
-        gdf_to_bigquery(
-            gdf=result,
-            table_name=output_table_name,
-            json_key=meta['json_key'],
-            write_type='WRITE_APPEND'
-        )
-        logger.info("Upload to BigQuery successful.")
-
     # Save locally if enabled
     if meta['local_upload']:
         local_fn = f"{fn}_{meta['fips']}.shp"
@@ -483,32 +966,464 @@ def process_result(result, meta):
         logger.info(f"Saving to local directory for {meta['fips']}: {output_local_name}")
         result.to_file(output_local_name, driver='ESRI Shapefile')
         logger.info(f"Local upload successful: {output_local_name}")
+        if not meta['bq_upload']:
+            set_status(DONE, output=output_local_name)
+
+    # Integer FIPS the BigQuery tables are partitioned on, not in local files
+    if meta['bq_upload']:
+        result = result.assign(**{FIPS_PARTITION[0]: int(meta['fips'])})
+
+    # Stage for a consolidated load if enabled
+    if meta['bq_upload'] and meta['stage_dir']:
+        staged_path = stage_result(result, meta['stage_dir'], fn, meta['fips'])
+        set_status(STAGED, staged=staged_path)
+        logger.info(f"Staged result for {meta['fips']}: {staged_path}")
+
+        flush_mb = meta['stage_flush_mb']
+        if flush_mb and staged_size_mb(meta['stage_dir'], fn) >= flush_mb:
+            logger.info(f"Staged size for {fn} exceeds {flush_mb} MB. Flushing...")
+            flush_staged_results(
+                json_key=meta['json_key'],
+                staging_dir=meta['stage_dir'],
+                bq_output_dir=meta['bq_output_dir'],
+                table_names=[fn],
+                uploader=uploader,
+                manifest=manifest
+            )
+
+    # Upload only the changes from the previous output
+    elif meta['bq_upload'] and meta['incremental']:
+        upload_changes(result, meta, output_table_name, set_status, uploader)
+
+    # Upload to BigQuery if enabled
+    elif meta['bq_upload']:
+        set_status(UPLOADING, output=output_table_name)
+        if uploader:
+            logger.info(f"Queueing BigQuery upload for {meta['fips']}: {output_table_name}")
+            uploader.submit(
+                result,
+                output_table_name,
+                write_disposition='WRITE_APPEND',
+                callback=lambda success: set_status(DONE if success else FAILED),
+                range_partition=FIPS_PARTITION,
+                clustering_fields=FIPS_CLUSTERING
+            )
+        else:
+            logger.info(f"Uploading to BigQuery for {meta['fips']}: {output_table_name}")
+            uploaded = gdf_to_bigquery(
+                gdf=result,
+                table_name=output_table_name,
+                json_key=meta['json_key'],
+                write_type='WRITE_APPEND'
+            )
+            set_status(DONE if uploaded else FAILED)
+            if uploaded:
+                logger.info("Upload to BigQuery successful.")
+
+
+def upload_changes(result, meta, table_id, set_status, uploader=None, done_status=DONE):
+    """
+    Diffs a result against the previous output of its county in 'table_id'
+    and upserts the inserted and changed superparcels and deletes the
+    missing ones in one merge. Unchanged superparcels are not uploaded.
+    A None result deletes every superparcel of the county.
+    With an 'uploader', the previous output is read, diffed and merged on
+    the upload thread (see Uploader.submit_diff_merge); this only queues it.
+    'set_status' records the task status, 'done_status' once merged.
+    """
+    import pandas as pd
+    from bigq.backend import connect
+    from sp_geoprocessing.superparcels import diff_superparcels
+
+    if result is None:
+        result = pd.DataFrame({'fips': pd.Series(dtype=str), 'sp_id': pd.Series(dtype=str), 'sp_hash': pd.Series(dtype='int64')})
+
+    def diff(bq):
+        try:
+            previous = previous_output(bq, table_id, meta['fips'])
+        except Exception as e:
+            logger.error(f"Failed to read previous output for {meta['fips']}: {e}")
+            raise
+
+        changes, deleted, counts = diff_superparcels(result, previous)
+        logger.info(f"Diff for {meta['fips']} dt {meta['dt']}: {counts}")
+        if len(changes) == 0 and not deleted:
+            return None
+        return changes, pd.DataFrame({'fips': meta['fips'], 'sp_id': pd.Series(deleted, dtype=str)})
+
+    set_status(UPLOADING, output=table_id)
+    if uploader:
+        logger.info(f"Queueing BigQuery diff and merge for {meta['fips']}: {table_id}")
+        uploader.submit_diff_merge(
+            diff,
+            table_id,
+            key_fields=MERGE_KEYS,
+            callback=lambda success: set_status(done_status if success else FAILED),
+            range_partition=FIPS_PARTITION,
+            clustering_fields=FIPS_CLUSTERING
+        )
+        return
+
+    logger.info(f"Merging to BigQuery for {meta['fips']}: {table_id}")
+    try:
+        bq = connect(meta['json_key'])
+        merge = diff(bq)
+        if merge is not None:
+            changes, deleted = merge
+            bq.merge_gdf(
+                changes,
+                table_id,
+                key_fields=MERGE_KEYS,
+                deleted=deleted,
+                range_partition=FIPS_PARTITION,
+                clustering_fields=FIPS_CLUSTERING
+            )
+    except Exception as e:
+        logger.error(f"Merge error: {e}")
+        set_status(FAILED)
+        return
+    set_status(done_status)
+
+
+def profile_task(func, pstats_path, *args, **kwargs):
+    """
+    Runs a worker task under cProfile and dumps the stats to 'pstats_path'.
+    Module-level so it can be pickled into the process pool.
+    """
+    import cProfile
+
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        return func(*args, **kwargs)
+    finally:
+        profiler.disable()
+        profiler.dump_stats(pstats_path)
+
+
+# Pipeline stages summarized in the profile report (function name -> stage)
+PROFILE_STAGES = {
+    'to_crs': 'reprojection',
+    'repair_invalid_geoms': 'geometry repair',
+    'compute_distance_matrix': 'distance matrix',
+    'build_dbscan_clusters': 'clustering (DBSCAN)',
+    'build_owner_clusters': 'clustering (total)',
+    'dissolve': 'dissolve',
+    'buffer': 'buffering',
+    'owner_cache_keys': 'owner cache',
+    'load_or_build_graph': 'neighbor graph',
+    'owner_clusters': 'clustering (neighbor graph)',
+    'hash_puid_groups': 'hashing',
+    'remove_overlap': 'overlap removal',
+    'remove_invalid_geoms': 'invalid geometry removal',
+}
+
+def write_profile_report(profile_dir, report_path, top=50):
+    """
+    Merges the per-task .pstats files in 'profile_dir' into one report with
+    the cumulative time of each pipeline stage and the hottest functions
+    across all workers sorted by cumulative and internal time.
+    Returns the report path, or None if there are no profiles.
+    """
+    import pstats
+
+    files = sorted(glob.glob(os.path.join(profile_dir, '*.pstats')))
+    if not files:
+        return None
+
+    stats = pstats.Stats(files[0])
+    for f in files[1:]:
+        stats.add(f)
+
+    # cumulative time per stage. Library wrappers nest same-named functions
+    # (GeoDataFrame.to_crs -> GeoSeries.to_crs -> ...), so take the outermost.
+    stage_times = {}
+    for (filename, line, funcname), (cc, nc, tt, ct, callers) in stats.stats.items():
+        stage = PROFILE_STAGES.get(funcname)
+        if stage:
+            stage_times[stage] = max(stage_times.get(stage, 0.0), ct)
+
+    with open(report_path, 'w') as report:
+        report.write(f"Merged profile of {len(files)} tasks: {profile_dir}\n")
+        report.write(f"Total time: {stats.total_tt:.2f}s\n\n")
+        report.write("Pipeline stages (cumulative seconds, summed over workers)\n")
+        for stage, seconds in sorted(stage_times.items(), key=lambda x: -x[1]):
+            report.write(f"  {stage:<28} {seconds:>10.2f}\n")
 
+        stats.stream = report
+        for sort_key in ('cumulative', 'tottime'):
+            report.write(f"\n\nTop {top} functions by {sort_key}\n")
+            stats.sort_stats(sort_key).print_stats(top)
 
+    return report_path
 
 
-def process_batch(func, batch, pool_size):
+def write_run_report(report_dir, report_path, upload_summary=None):
+    """
+    Aggregates the per-task stage reports in '<report_dir>/tasks' into one
+    run report JSON (per-task stages, run totals and the upload summary).
+    Returns the report path and the formatted stage totals table.
+    """
+    from sp_geoprocessing.stages import aggregate_reports, format_stage_table
+
+    report = aggregate_reports(os.path.join(report_dir, 'tasks'))
+    report['uploads'] = upload_summary
+
+    tmp_path = report_path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(report, f, indent=2, default=str)
+    os.replace(tmp_path, report_path)
+
+    return report_path, format_stage_table(report['totals'])
+
+
+def process_error(error, meta, manifest=None):
+    """
+    Error callback for a failed task. Records the failure so --resume retries it.
+    """
+    logger.error(f"Build failed for {meta['fips']} dt {meta['dt']}: {error}")
+    if manifest:
+        manifest.set_status(meta['fips'], meta['dt'], meta['param_hash'], FAILED)
+
+
+def process_batch(func, batch, pool_size, uploader=None, manifest=None, profile_dir=None, report_dir=None, trace_memory=False, pool=None):
     """
     Processes a single batch of tasks asynchronously.
     Each task is submitted to a shared pool, and results are processed immediately upon completion.
+    Uploads are handed to 'uploader' (if given) so workers never wait on the network.
+    Task status is recorded in 'manifest' (if given).
+    If 'profile_dir' is given, each task runs under cProfile and writes a .pstats file there.
+    If 'report_dir' is given, each task writes its per-stage timing and memory report there.
+    If 'pool' is given (the warm pool of 'sps serve'), tasks run there and the
+    pool is left open; otherwise a pool of 'pool_size' processes is created.
+    """
+    import multiprocessing
+
+    if pool is not None:
+        submit_batch(pool, func, batch, uploader, manifest, profile_dir, report_dir, trace_memory)
+        return
+
+    # Create a process pool limited to the desired number of concurrent jobs
+    with multiprocessing.Pool(processes=pool_size) as pool:
+        submit_batch(pool, func, batch, uploader, manifest, profile_dir, report_dir, trace_memory)
+
+
+# Task tuple parser of each pool task function (see submit_batch)
+TASK_PARSERS = {
+    'build_sp_fixed': parse_sp_fixed_args,
+    'build_sp_adaptive': parse_sp_adaptive_args,
+}
+
+def submit_batch(pool, func, batch, uploader=None, manifest=None, profile_dir=None, report_dir=None, trace_memory=False):
+    """
+    Submits each task of 'batch' to 'pool' and waits for all of them.
+    See process_batch.
     """
     # Prepare a list of async results to later ensure all tasks in the batch finish
     async_results = []
-    
-    # Create a process pool limited to the desired number of concurrent jobs
+
+    for task in batch:
+        build_args, build_kwargs, meta = TASK_PARSERS[func.__name__](task)
+
+        if report_dir:
+            build_kwargs['report_path'] = os.path.join(
+                report_dir, f"{func.__name__}-dt{meta['dt']}-ss{meta['ss']}_{meta['fips']}.json"
+            )
+            build_kwargs['trace_memory'] = trace_memory
+
+        task_func = func
+        if profile_dir:
+            pstats_path = os.path.join(
+                profile_dir, f"{func.__name__}-dt{meta['dt']}-ss{meta['ss']}_{meta['fips']}.pstats"
+            )
+            task_func = profile_task
+            build_args = (func, pstats_path) + tuple(build_args)
+
+        # Submit the task asynchronously with a callback that processes the result immediately.
+        async_result = pool.apply_async(
+            task_func,
+            args=build_args,
+            kwds=build_kwargs,
+            callback=lambda res, meta=meta: process_result(res, meta, uploader, manifest),
+            error_callback=lambda err, meta=meta: process_error(err, meta, manifest)
+        )
+        async_results.append(async_result)
+
+    for async_result in async_results:
+        async_result.wait()
+
+
+def process_adaptive_batch(batch, pool_size, uploader=None, manifest=None, profile_dir=None, report_dir=None, trace_memory=False, pool=None):
+    """
+    Processes a batch of adaptive-epsilon county tasks (see
+    build_sp_adaptive_args) in two steps on one pool: every place of every
+    county is clustered as its own task (see cluster_places), then the
+    superparcels of each county are built from its clustered places with
+    build_sp_adaptive and handled by process_result.
+    See process_batch for the other parameters.
+    """
+    import multiprocessing
+    from sp_cli.sp_build import build_sp_adaptive
+
+    if pool is not None:
+        tasks = cluster_places(pool, batch, uploader, manifest, profile_dir, report_dir, trace_memory)
+        submit_batch(pool, build_sp_adaptive, tasks, uploader, manifest, profile_dir, report_dir, trace_memory)
+        return
+
     with multiprocessing.Pool(processes=pool_size) as pool:
-        for task in batch:
-            
-            if func.__name__ == 'build_sp_fixed':
-                build_args, meta = parse_sp_fixed_args(task)
+        tasks = cluster_places(pool, batch, uploader, manifest, profile_dir, report_dir, trace_memory)
+        submit_batch(pool, build_sp_adaptive, tasks, uploader, manifest, profile_dir, report_dir, trace_memory)
+
+
+def cluster_places(pool, batch, uploader=None, manifest=None, profile_dir=None, report_dir=None, trace_memory=False):
+    """
+    Splits each county of 'batch' into places (see sp_build.split_places)
+    and runs every place as a build_sp_adaptive_place task on 'pool'
+    (see submit_places).
+
+    Returns the county tasks with the clustered parcels of their places
+    in place of the county's parcels, for build_sp_adaptive. Counties
+    without clusters are handed to process_result as empty; a failed place
+    fails its county.
+    """
+    import pandas as pd
+    from sp_cli.sp_build import split_places, build_sp_adaptive_place
+
+    # grid options of the 'field' KNN mode, used when a county is split
+    field_options = ('cell_size', 'smoothing_radius')
+
+    def split(task):
+        adaptive = task[5]
+        field = None
+        if adaptive.get('knn_mode') == 'field':
+            field = {
+                'kneighbors': adaptive['kneighbors'],
+                'cell_size': adaptive['cell_size'],
+                'smoothing_radius': adaptive['smoothing_radius'],
+                'min_distance': adaptive['min_urban_distance'],
+                'max_distance': adaptive['max_urban_distance'],
+            }
+        return split_places(task[0], task[16], task[2], task[17], field=field)
+
+    def place_task(task, place_id, place_name, parcels):
+        fips, key_field, sample_size, _, adaptive = task[1:6]
+        kwargs = {'place_id': place_id, 'place_name': place_name, 'sample_size': sample_size}
+        kwargs.update({key: value for key, value in adaptive.items() if key not in field_options})
+        name = f"build_sp_adaptive_place-p{place_id}-ss{sample_size}_{fips}"
+        return build_sp_adaptive_place, (parcels, fips, key_field), kwargs, name
+
+    tasks = []
+    for task, places in submit_places(
+        pool, batch, split, place_task, parse_sp_adaptive_args, manifest, profile_dir, report_dir, trace_memory
+    ):
+        frames = [clustered for _, _, clustered in places if clustered is not None]
+        if not frames:
+            process_result(None, parse_sp_adaptive_args(task)[2], uploader, manifest)
+            continue
+        clustered = pd.concat(frames, ignore_index=True) if len(frames) > 1 else frames[0]
+        # the county parcels and places are not needed by build_sp_adaptive,
+        # the places' digest tells process_result the task was built by place
+        places_digest = None if task[16] is None else task[16].digest
+        tasks.append((clustered,) + task[1:16] + (places_digest,) + task[17:])
+    return tasks
+
+
+def process_place_batch(batch, pool_size, uploader=None, manifest=None, profile_dir=None, report_dir=None, trace_memory=False, pool=None):
+    """
+    Processes a batch of spfixed tasks built by place (see build_sp_args
+    with 'places'). Every place of every task runs build_sp_fixed as its
+    own task, with the task's distance threshold inside places and its
+    rural_dt outside them. The superparcels of a task's places are
+    combined (see sp_build.combine_places) and handled by process_result.
+    See process_batch for the other parameters.
+    """
+    import multiprocessing
+
+    if pool is not None:
+        build_places(pool, batch, uploader, manifest, profile_dir, report_dir, trace_memory)
+        return
 
-            # Submit the task asynchronously with a callback that processes the result immediately.
-            async_result = pool.apply_async(func, args=build_args,
-                                            callback=lambda res, meta=meta: process_result(res, meta))
-            async_results.append(async_result)
+    with multiprocessing.Pool(processes=pool_size) as pool:
+        build_places(pool, batch, uploader, manifest, profile_dir, report_dir, trace_memory)
 
-        for async_result in async_results:
-            async_result.wait()
 
+def build_places(pool, batch, uploader=None, manifest=None, profile_dir=None, report_dir=None, trace_memory=False):
+    """
+    Runs the places of each spfixed task of 'batch' on 'pool' (see
+    process_place_batch). A county is split once for all its distance
+    thresholds.
+    """
+    from sp_cli.sp_build import build_sp_fixed, combine_places
+    from sp_geoprocessing.places import RURAL_PLACE_ID
+
+    county_places = {}
+    def split(task):
+        if task[1] not in county_places:
+            county_places[task[1]] = task[23].split(task[0])
+        return county_places[task[1]]
+
+    def place_task(task, place_id, place_name, parcels):
+        build_args, build_kwargs, meta = parse_sp_fixed_args(task)
+        dt = meta['rural_dt'] if place_id == RURAL_PLACE_ID else meta['dt']
+        # checkpoints and neighbor graphs per place: a county's graphs
+        # prune the older snapshots of the same place only
+        for path in ('checkpoint_dir', 'neighbor_graph_dir'):
+            if build_kwargs[path]:
+                build_kwargs[path] = os.path.join(build_kwargs[path], f"p{place_id}")
+        # named by the task's distance threshold: rural places share theirs
+        name = f"build_sp_fixed-dt{meta['dt']}-p{place_id}-ss{meta['ss']}_{meta['fips']}"
+        return build_sp_fixed, (parcels,) + build_args[1:3] + (dt,) + build_args[4:], build_kwargs, name
+
+    for task, places in submit_places(
+        pool, batch, split, place_task, parse_sp_fixed_args, manifest, profile_dir, report_dir, trace_memory
+    ):
+        process_result(combine_places(places, task[2]), parse_sp_fixed_args(task)[2], uploader, manifest)
 
 
+def submit_places(pool, batch, split, place_task, parse, manifest=None, profile_dir=None, report_dir=None, trace_memory=False):
+    """
+    Runs the places of every task of 'batch' as separate tasks on 'pool'
+    and waits for all of them.
+
+    split(task) returns the (place_id, place_name, parcels) of a task and
+    runs in this process. place_task(task, place_id, place_name, parcels)
+    returns the (function, args, kwargs, report name) of one place. The
+    places of a task are submitted as soon as it is split, while the next
+    task is prepared. A task whose split or any place fails is recorded
+    with process_error ('parse' is its TASK_PARSERS entry).
+
+    Returns (task, [(place_id, place_name, result), ...]) for every other
+    task, in batch order. See process_batch for the other parameters.
+    """
+    pending, results, failed = [], {}, set()
+    for i, task in enumerate(batch):
+        try:
+            places = split(task)
+        except Exception as e:
+            process_error(e, parse(task)[2], manifest)
+            failed.add(i)
+            continue
+        results[i] = []
+        for place_id, place_name, parcels in places:
+            func, args, kwargs, name = place_task(task, place_id, place_name, parcels)
+            if report_dir:
+                kwargs['report_path'] = os.path.join(report_dir, f"{name}.json")
+                kwargs['trace_memory'] = trace_memory
+
+            task_func = func
+            if profile_dir:
+                task_func = profile_task
+                args = (func, os.path.join(profile_dir, f"{name}.pstats")) + tuple(args)
+            pending.append((i, place_id, place_name, pool.apply_async(task_func, args=args, kwds=kwargs)))
+
+    for i, place_id, place_name, async_result in pending:
+        try:
+            result = async_result.get()
+        except Exception as e:
+            if i not in failed:
+                process_error(e, parse(batch[i])[2], manifest)
+                failed.add(i)
+            continue
+        results[i].append((place_id, place_name, result))
+
+    return [(batch[i], places) for i, places in results.items() if i not in failed]
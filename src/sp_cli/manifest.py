@@ -0,0 +1,367 @@
+import os
+import json
+import glob
+import shutil
+import sqlite3
+import hashlib
+import threading
+import time
+from datetime import datetime, timezone
+from typing import List, Optional
+import logging
+
+logger = logging.getLogger('sp_cmds')
+
+# Task status values recorded in the manifest
+PENDING = 'pending'
+STAGED = 'staged'
+UPLOADING = 'uploading'
+DONE = 'done'
+EMPTY = 'empty'
+FAILED = 'failed'
+
+# Statuses whose compute does not need to be repeated on --resume
+COMPLETE = (STAGED, DONE, EMPTY)
+
+
+def task_param_hash(**params) -> str:
+    """
+    Stable short hash of the parameters that define a task's output.
+    Example: task_param_hash(dt=200, ss=3, at=None, version='0.2.0')
+    """
+    joined = json.dumps(params, sort_keys=True, default=str)
+    return hashlib.sha256(joined.encode()).hexdigest()[:12]
+
+
+class RunManifest:
+    def __init__(self, path: str):
+        """
+        SQLite run manifest recording the status and output location of every
+        (fips, dt, parameter hash) task of a build.
+
+        Parameters
+        ----------
+        path : str
+            Path to the SQLite file, usually <build_dir>/manifest.sqlite.
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        # callbacks from the uploader threads write to the same connection
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        with self._conn:
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS tasks (
+                    fips TEXT NOT NULL,
+                    dt INTEGER NOT NULL,
+                    param_hash TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    output TEXT,
+                    staged TEXT,
+                    updated TEXT NOT NULL,
+                    PRIMARY KEY (fips, dt, param_hash)
+                )
+            """)
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS run (
+                    key TEXT PRIMARY KEY,
+                    value TEXT
+                )
+            """)
+
+    def reset(self):
+        """Clears all tasks and run values for a new run."""
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM tasks")
+            self._conn.execute("DELETE FROM run")
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def get_run_value(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM run WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def set_run_value(self, key: str, value: str):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO run (key, value) VALUES (?, ?)", (key, value)
+            )
+
+    def set_status(self, fips, dt, param_hash, status, output=None, staged=None):
+        """
+        Records a task's status. 'output' and 'staged' are kept from the
+        previous record when not given.
+        """
+        updated = datetime.now(timezone.utc).isoformat()
+        with self._lock, self._conn:
+            self._conn.execute("""
+                INSERT INTO tasks (fips, dt, param_hash, status, output, staged, updated)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (fips, dt, param_hash) DO UPDATE SET
+                    status = excluded.status,
+                    output = COALESCE(excluded.output, tasks.output),
+                    staged = COALESCE(excluded.staged, tasks.staged),
+                    updated = excluded.updated
+            """, (str(fips), int(dt), param_hash, status, output, staged, updated))
+
+    def set_status_by_staged(self, staged_paths: List[str], status: str, output=None):
+        """Updates every task whose staged file is in 'staged_paths'."""
+        updated = datetime.now(timezone.utc).isoformat()
+        with self._lock, self._conn:
+            self._conn.executemany("""
+                UPDATE tasks SET status = ?, output = COALESCE(?, output), updated = ?
+                WHERE staged = ?
+            """, [(status, output, updated, p) for p in staged_paths])
+
+    def get_status(self, fips, dt, param_hash) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT status FROM tasks WHERE fips = ? AND dt = ? AND param_hash = ?",
+                (str(fips), int(dt), param_hash)
+            ).fetchone()
+        return row[0] if row else None
+
+    def is_complete(self, fips, dt, param_hash) -> bool:
+        return self.get_status(fips, dt, param_hash) in COMPLETE
+
+    def tasks(self, statuses: Optional[List[str]] = None) -> List[dict]:
+        query = "SELECT fips, dt, param_hash, status, output, staged FROM tasks"
+        args = ()
+        if statuses:
+            query += f" WHERE status IN ({','.join('?' * len(statuses))})"
+            args = tuple(statuses)
+        with self._lock:
+            rows = self._conn.execute(query, args).fetchall()
+        keys = ('fips', 'dt', 'param_hash', 'status', 'output', 'staged')
+        return [dict(zip(keys, row)) for row in rows]
+
+    def summary(self) -> dict:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT status, COUNT(*) FROM tasks GROUP BY status"
+            ).fetchall()
+        return dict(rows)
+
+
+def recover_staging(staging_dir: str):
+    """
+    Restores staged files left as *.loading by an interrupted flush so they
+    are loaded again by the next flush.
+    """
+    for lf in glob.glob(os.path.join(staging_dir, '*', '*.parquet.loading')):
+        os.replace(lf, lf[:-len('.loading')])
+
+
+class OwnerCheckpoint:
+    def __init__(self, checkpoint_dir: str, input_key: str):
+        """
+        Owner-shard checkpoints for a single (fips, dt) task, so a crash on a
+        large county resumes from the last completed shard of owners.
+
+        Parameters
+        ----------
+        checkpoint_dir : str
+            Directory holding the shard files for this task.
+        input_key : str
+            Fingerprint of the task input. Shards written for a different
+            input are discarded.
+        """
+        self.checkpoint_dir = checkpoint_dir
+        key_path = os.path.join(checkpoint_dir, 'input.key')
+        if os.path.exists(key_path):
+            with open(key_path) as f:
+                if f.read().strip() != input_key:
+                    logger.info(f'Input changed. Discarding checkpoints in {checkpoint_dir}')
+                    shutil.rmtree(checkpoint_dir)
+        os.makedirs(checkpoint_dir, exist_ok=True)
+        with open(key_path, 'w') as f:
+            f.write(input_key)
+
+    def shard_path(self, shard: int) -> str:
+        return os.path.join(self.checkpoint_dir, f'shard_{shard:05d}.parquet')
+
+    def load(self, shard: int):
+        """Returns the checkpointed shard GeoDataFrame, or None if not written yet."""
+        import geopandas as gpd
+
+        path = self.shard_path(shard)
+        if os.path.exists(path + '.empty'):
+            return gpd.GeoDataFrame()
+        if not os.path.exists(path):
+            return None
+        return gpd.read_parquet(path)
+
+    def save(self, shard: int, gdf):
+        """
+        Writes a completed shard under a temporary name and renames it.
+        Shards without clusters are recorded with an empty marker file.
+        """
+        path = self.shard_path(shard)
+        if len(gdf) == 0:
+            open(path + '.empty', 'w').close()
+            return
+        gdf.to_parquet(path + '.tmp', index=False)
+        os.replace(path + '.tmp', path)
+
+    def clear(self):
+        shutil.rmtree(self.checkpoint_dir, ignore_errors=True)
+
+
+def input_fingerprint(parcels, key_field: str) -> str:
+    """
+    Order-sensitive fingerprint of a task's input (owners and geometries).
+    Row order matters because it determines how clusters are numbered.
+    """
+    import pandas as pd
+
+    owner_hash = pd.util.hash_pandas_object(parcels[key_field], index=False).to_numpy()
+    geom_hash = pd.util.hash_array(parcels.geometry.to_wkb(hex=True).to_numpy())
+    digest = hashlib.sha256(owner_hash.tobytes() + geom_hash.tobytes())
+    return digest.hexdigest()[:16]
+
+
+# Bump when clustering, dissolve or buffer output changes, so owners cached
+# by an older engine are computed again.
+OWNER_CACHE_VERSION = 2
+
+# Owners with fewer parcels never cluster (see build_owner_clusters)
+OWNER_CACHE_MIN_PARCELS = 3
+
+
+class OwnerCache:
+    def __init__(self, path: str, max_mb: int = 2048):
+        """
+        Content-addressed cache of per-owner clustering results, shared by
+        all tasks and runs of a build directory. An owner is looked up by a
+        key hashed from its parcels and the clustering parameters (see
+        owner_cache_keys), so an owner whose parcels did not change between
+        builds is not clustered, dissolved or buffered again.
+
+        Each entry holds the owner's cluster labels and the dissolved and
+        buffered geometry of its clusters. Once the cache exceeds 'max_mb',
+        the least recently used entries are evicted.
+
+        Parameters
+        ----------
+        path : str
+            Path to the SQLite file, usually <build_dir>/cache/owner_cache.sqlite.
+        max_mb : int
+            Size cap of the cached payloads in MB.
+        """
+        self.path = path
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        # pool workers of concurrent tasks read and write the same file
+        self._conn = sqlite3.connect(path, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        with self._conn:
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS owners (
+                    key TEXT PRIMARY KEY,
+                    payload BLOB NOT NULL,
+                    size INTEGER NOT NULL,
+                    last_used REAL NOT NULL
+                )
+            """)
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS owners_last_used ON owners (last_used)"
+            )
+
+    def close(self):
+        self._conn.close()
+
+    def get_many(self, keys: List[str]) -> dict:
+        """Returns {key: entry} for the cached keys and marks them as used."""
+        import pickle
+
+        keys = list(dict.fromkeys(keys))
+        found = {}
+        now = time.time()
+        with self._conn:
+            for i in range(0, len(keys), 900): # SQLite variable limit
+                chunk = keys[i:i + 900]
+                marks = ','.join('?' * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT key, payload FROM owners WHERE key IN ({marks})", chunk
+                ).fetchall()
+                found.update((key, pickle.loads(payload)) for key, payload in rows)
+                self._conn.execute(
+                    f"UPDATE owners SET last_used = ? WHERE key IN ({marks})", (now, *chunk)
+                )
+        return found
+
+    def put_many(self, entries: dict):
+        """Stores {key: entry} and evicts the least recently used entries over the size cap."""
+        import pickle
+
+        if not entries:
+            return
+        now = time.time()
+        rows = []
+        for key, entry in entries.items():
+            payload = pickle.dumps(entry, protocol=pickle.HIGHEST_PROTOCOL)
+            rows.append((key, payload, len(payload), now))
+        with self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO owners (key, payload, size, last_used) VALUES (?, ?, ?, ?)",
+                rows
+            )
+            self._evict()
+
+    def _evict(self):
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM owners").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        evicted = []
+        for key, size in self._conn.execute("SELECT key, size FROM owners ORDER BY last_used"):
+            if total <= self.max_bytes:
+                break
+            evicted.append((key,))
+            total -= size
+        self._conn.executemany("DELETE FROM owners WHERE key = ?", evicted)
+        logger.info(f'Owner cache over {self.max_bytes // 2**20} MB: evicted {len(evicted)} owners')
+
+    def summary(self) -> dict:
+        entries, size = self._conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM owners"
+        ).fetchone()
+        return {'entries': entries, 'mb': round(size / 2**20, 1)}
+
+
+def owner_cache_keys(parcels, key_field: str, **params):
+    """
+    Owner cache key of every owner, from the set of its parcels (PUID and
+    geometry WKB) and the clustering parameters 'params'. Parcel hashes
+    are summed per owner (two 64-bit hashes, mod 2**64 each), so a key
+    does not depend on row order or on the owner's name.
+
+    Returns the keys as a Series indexed by owner, and the row positions
+    of each owner in canonical order (sorted by parcel hash),
+    {owner: array of positions}. Cached cluster labels are stored in that order.
+    """
+    import numpy as np
+    import pandas as pd
+
+    codes, owners = pd.factorize(parcels[key_field]) # owners without a name are not clustered
+    content = pd.DataFrame({
+        'puid': parcels['puid'].astype(str).to_numpy(dtype=object),
+        'wkb': parcels.geometry.to_wkb().to_numpy(),
+    })
+    named = codes >= 0
+    hashes = [
+        pd.util.hash_pandas_object(content, index=False, hash_key=hash_key).to_numpy()
+        for hash_key in ('0123456789123456', 'superparcels0001')
+    ]
+    sums = np.zeros((2, len(owners)), dtype=np.uint64)
+    for total, parcel_hashes in zip(sums, hashes):
+        np.add.at(total, codes[named], parcel_hashes[named])
+
+    suffix = ''.join(f'-{k}{v}' for k, v in sorted(params.items()))
+    keys = [f'{a:016x}{b:016x}{suffix}-v{OWNER_CACHE_VERSION}' for a, b in zip(*sums)]
+    order = np.lexsort((hashes[0], codes))
+    order = order[named[order]]
+    counts = np.bincount(codes[named], minlength=len(owners))
+    owner_rows = dict(zip(owners, np.split(order, np.cumsum(counts)[:-1])))
+    return pd.Series(keys, index=np.asarray(owners), dtype=object), owner_rows
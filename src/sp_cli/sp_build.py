@@ -1,6 +1,11 @@
 
+import numpy as np
 import pandas as pd
 import geopandas as gpd
+import os
+import glob
+import shutil
+import hashlib
 import warnings
 warnings.filterwarnings('ignore')
 import logging
@@ -8,15 +13,42 @@ import logging
 from sp_geoprocessing.cluster import build_owner_clusters
 from sp_geoprocessing.superparcels import (
     build_superparcels,
-    hash_puids, 
+    hash_puid_groups,
     remove_overlap,
-    remove_invalid_geoms
+    remove_invalid_geoms,
+    repair_invalid_geoms,
+    filter_area
 )
 from sp_geoprocessing.utils import (
     add_attributes,
-    remove_from_df,
-    segregate_outliers,
-    add_attributes
+    add_attributes,
+    to_utm,
+    compact_dtypes,
+    restore_dtypes
+)
+from sp_geoprocessing.neighbors import load_or_build_graph
+from sp_geoprocessing.tools import merge_cross_region_clusters
+from sp_geoprocessing.adaptive import (
+    place_regions,
+    region_distance,
+    attach_singles,
+    parcel_distances,
+    owner_distances,
+    MAX_PARCELS_PER_REGION,
+    KNEIGHBORS,
+    SMOOTHING_WINDOW,
+    MIN_URBAN_DISTANCE,
+    MAX_URBAN_DISTANCE,
+    RURAL_DISTANCE
+)
+from sp_geoprocessing.places import RURAL_PLACE_ID
+from sp_geoprocessing.stages import StageRecorder, NULL_RECORDER
+from sp_cli.manifest import (
+    OwnerCheckpoint,
+    OwnerCache,
+    OWNER_CACHE_MIN_PARCELS,
+    input_fingerprint,
+    owner_cache_keys
 )
 
 logger = logging.getLogger(__name__)
@@ -27,17 +59,42 @@ def build_sp_fixed(
     distance_threshold=200, 
     sample_size=3,
     area_threshold=None,
+    puid_field='PUID',
+    checkpoint_dir=None,
+    checkpoint_min_parcels=100_000,
+    checkpoint_shard_owners=2_000,
+    owner_cache=None,
+    owner_cache_mb=2048,
+    neighbor_graph_dir=None,
+    neighbor_max_distance=500,
+    report_path=None,
+    trace_memory=False,
     ):
     """
     Executes the clustering and super parcel creation process.
     Uses a fixed epsilon value for DBSCAN clustering.
 
     Args:
-    parcels (GeoDataFrame): Candidate parcels for super parcel creation.
+    parcels (GeoDataFrame): Candidate parcels for super parcel creation. Parcels in a
+        geographic CRS are projected to their UTM zone, projected parcels are used as is.
     key_field (str): Field to use for clustering.
     distance_threshold (int): Distance threshold for DBSCAN clustering.
     sample_size (int): Minimum number of samples for DBSCAN clustering.
-    area_threshold (int): Minimum area threshold for super parcel creation.
+    area_threshold (int): Minimum total parcel area (sq. meters) of a cluster. Smaller clusters are dropped before the dissolve.
+    puid_field (str): Source parcel ID field. sp_ids are hashed from the PUIDs of each superparcel,
+        so they are stable across builds. If missing, row positions are used instead.
+    checkpoint_dir (str): Directory for owner-shard checkpoints. If None, no checkpoints.
+    checkpoint_min_parcels (int): Counties with fewer parcels are not checkpointed.
+    checkpoint_shard_owners (int): Number of owners per checkpointed shard.
+    owner_cache (str): Path to the owner cache (see manifest.OwnerCache). Owners whose parcels
+        and parameters are cached are not clustered, dissolved or buffered again. If None, no cache.
+    owner_cache_mb (int): Size cap of the owner cache in MB. Least recently used owners are evicted.
+    neighbor_graph_dir (str): Directory of the per-county neighbor graphs (see neighbors.NeighborGraph).
+        The graph of this county snapshot is built once and clustering reads distances from it
+        instead of computing them. If None, or distance_threshold is over neighbor_max_distance, no graph.
+    neighbor_max_distance (int): Largest same-owner distance stored in a neighbor graph.
+    report_path (str): If set, per-stage timing and memory is written to this JSON file.
+    trace_memory (bool): Record tracemalloc peaks per stage (slower). Requires report_path.
     """
     #class TqdmToLogger:
     #    def write(self, message):
@@ -47,89 +104,169 @@ def build_sp_fixed(
     #            logger.info(message)
     #    def flush(self):
     #        pass
+    recorder = StageRecorder(trace_memory) if report_path else NULL_RECORDER
+    report_meta = {'fips': fips, 'dt': distance_threshold, 'parcels': len(parcels)}
+
     parcels = parcels.reset_index(drop=True)
-    parcels['puid'] = parcels.index
-    # setup cProfiler
-    #if qa:
-    #    # enable cProfiler
-    #    pass
+    if puid_field in parcels:
+        parcels['puid'] = parcels[puid_field]
+    else:
+        logger.warning(f'No {puid_field} field for {fips}. sp_ids are hashed from row positions and change with row order.')
+        parcels['puid'] = parcels.index
+    # owners as categorical codes: grouping and cluster IDs work on ints
+    parcels = compact_dtypes(parcels, category_fields=[key_field])
     
-    utm = parcels.estimate_utm_crs().to_epsg()
-    parcels = parcels.to_crs(epsg=utm)  
+    with recorder.stage('reprojection', rows_in=len(parcels)) as rec:
+        if not parcels.crs.is_projected: # 'sps serve' caches counties already projected
+            parcels = to_utm(parcels)
+        rec['rows_out'] = len(parcels)
 
-    unique_owners = parcels[key_field].unique()
+    # REPAIR INVALID GEOMETRIES before any distance, dissolve or buffer work
+    with recorder.stage('geometry_repair', rows_in=len(parcels)) as rec:
+        parcels, repair_counts = repair_invalid_geoms(parcels)
+        rec['rows_out'] = len(parcels)
+    report_meta.update({f'geoms_{k}': v for k, v in repair_counts.items()})
 
-    clustered_parcel_data = gpd.GeoDataFrame() # cluster data
+    unique_owners = parcels[key_field].unique()
+    owner_rows = owner_positions(parcels, key_field)
+
+    # OWNER CACHE: owners whose parcels did not change since a previous
+    # build are taken from the cache instead of the owner loop
+    cache, hits, labels_out = None, {}, None
+    if owner_cache:
+        with recorder.stage('owner_cache', rows_in=len(parcels)) as rec:
+            cache = OwnerCache(owner_cache, owner_cache_mb)
+            cache_keys, canonical_rows = owner_cache_keys(
+                parcels, key_field, dt=distance_threshold, ss=sample_size, at=area_threshold
+            )
+            cache_keys = cache_keys[[
+                len(canonical_rows[owner]) >= OWNER_CACHE_MIN_PARCELS for owner in cache_keys.index
+            ]]
+            cached = cache.get_many(cache_keys.to_list())
+            hits = {owner: cached[key] for owner, key in cache_keys.items() if key in cached}
+            # owners with too few parcels to cluster are skipped altogether
+            unique_owners = np.array([owner for owner in cache_keys.index if owner not in hits], dtype=object)
+            labels_out = np.full(len(parcels), -1, dtype=np.int64)
+            rec['rows_out'] = sum(len(canonical_rows[owner]) for owner in hits)
+        logger.info(f'Owner cache: {len(hits)} of {len(cache_keys)} owners cached for {fips}')
+        report_meta.update(owners_cached=len(hits), owners_cacheable=len(cache_keys))
+
+    # NEIGHBOR GRAPH: same-owner distances of this county snapshot, built once
+    fingerprint = None
+    graph = None
+    if neighbor_graph_dir and len(unique_owners) > 0:
+        if distance_threshold > neighbor_max_distance:
+            logger.info(f'dt {distance_threshold} is over the neighbor graph distance {neighbor_max_distance}. Computing distances.')
+        else:
+            with recorder.stage('neighbor_graph', rows_in=len(parcels)) as rec:
+                fingerprint = input_fingerprint(parcels, key_field)
+                graph = county_graph(parcels, key_field, fips, fingerprint, neighbor_graph_dir, neighbor_max_distance)
+                rec['rows_out'] = graph.n_edges
+
+    # CHECKPOINTS: large counties run the owner loop in shards of owners
+    owner_shards = [unique_owners]
+    computed_shards = [] # shards clustered in this run, not loaded from a checkpoint
+    checkpoint = None
+    if checkpoint_dir and len(parcels) >= checkpoint_min_parcels:
+        input_key = fingerprint or input_fingerprint(parcels, key_field)
+        if cache:
+            # shards hold the owners missing from the cache
+            missed = sorted(set(cache_keys) - {cache_keys[owner] for owner in hits})
+            input_key += '-' + hashlib.sha256(''.join(missed).encode()).hexdigest()[:8]
+        checkpoint = OwnerCheckpoint(checkpoint_dir, input_key)
+        unique_owners = np.array(sorted(unique_owners, key=str), dtype=object)
+        owner_shards = [
+            unique_owners[i:i + checkpoint_shard_owners]
+            for i in range(0, len(unique_owners), checkpoint_shard_owners)
+        ]
+        logger.info(f'Checkpointing {fips} in {len(owner_shards)} owner shards: {checkpoint_dir}')
+
+    shard_frames = [] # cluster data per shard, concatenated once
     #single_parcel_data = gpd.GeoDataFrame() # non-clustered data
     logger.info(f'Building super parcels for {fips} and dt {distance_threshold}...')
    
-    for owner in unique_owners:
-        owner_parcels = parcels[parcels[key_field] == owner] # ownder specific parcels
-        
-        # CLUSTERING
-        clusters = build_owner_clusters(
-                owner_parcels,
-                min_samples=sample_size,
-                eps=distance_threshold
-            )
-
-        if len(clusters) == 0: # EMPTY: NO CLUSTERS
-            continue
-
-        owner_parcels['cluster'] = clusters # clustert ID
-        owner_parcels['cluster_area'] = owner_parcels['geometry'].area
-        owner_parcels['cluster_area'] = owner_parcels['cluster_area'].astype(int)
-
-        counts = owner_parcels['cluster'].value_counts() # pd.series of cluster counts
-        
-        outlier_ids, clean_counts = segregate_outliers(counts, -1)
-
-        cluster_filter = remove_from_df(
-            df=owner_parcels, 
-            list_of_ids=outlier_ids, 
-            field='cluster'
-        )
-        
-    
-        if len(cluster_filter) > 0:
-            # calcualte total area
-            total_area = cluster_filter.groupby('cluster')['cluster_area'].sum()
-
-            # add attributes
-            cluster_filter = add_attributes(
-                cluster_filter,
-                pcount=cluster_filter['cluster'].map(clean_counts),
-                p_area=cluster_filter['cluster'].map(total_area),
+    with recorder.stage('owner_loop', rows_in=len(parcels)) as rec:
+        for shard, shard_owners in enumerate(owner_shards):
+            if checkpoint:
+                shard_data = checkpoint.load(shard)
+                if shard_data is not None:
+                    logger.info(f'Loaded checkpointed shard {shard} for {fips}')
+                    if len(shard_data) > 0:
+                        shard_frames.append(shard_data)
+                    continue
+
+            shard_data = run_owner_shard(
+                parcels, shard_owners, key_field, distance_threshold, sample_size, recorder, owner_rows,
+                labels_out=labels_out, graph=graph
             )
-            cluster_filter = cluster_filter[[key_field, 'puid', 'cluster', 'pcount', 'p_area', 'geometry']]
-            clustered_parcel_data = pd.concat([clustered_parcel_data, cluster_filter], ignore_index=True)
-
+            computed_shards.append(shard_owners)
+
+            if checkpoint:
+                checkpoint.save(shard, shard_data)
+            if len(shard_data) > 0:
+                shard_frames.append(shard_data)
+
+        if hits:
+            cached_data = cached_parcels(parcels, hits, canonical_rows, key_field)
+            if len(cached_data) > 0:
+                shard_frames.append(cached_data)
+
+        clustered_parcel_data = gpd.GeoDataFrame()
+        if len(shard_frames) == 1:
+            clustered_parcel_data = shard_frames[0]
+        elif shard_frames:
+            clustered_parcel_data = pd.concat(shard_frames, ignore_index=True)
+        rec['rows_out'] = len(clustered_parcel_data)
+
+    computed_owners = [owner for shard_owners in computed_shards for owner in shard_owners]
     if len(clustered_parcel_data) == 0:
+        if cache:
+            store_owner_cache(cache, None, computed_owners, cache_keys, canonical_rows, labels_out, key_field)
+        recorder.write(report_path, **report_meta, superparcels=0)
         return None # no clusters for input county candidate parcels
 
     # REFACTOR: cluster ID       
     clustered_parcel_data['cluster_ID'] = (
-        clustered_parcel_data[key_field] + '_' +
+        clustered_parcel_data[key_field].astype(str) + '_' +
         clustered_parcel_data['cluster'].astype(str)
     )
 
-    # REFACTOR: SUPER PARCELS creation with area theshold option
+    # AREA THRESHOLD: drop small clusters before the dissolve
     if area_threshold:
-        # log message not implemented yet
-        # run filter_area()
-        pass
-    
-    # CLUSTER IDS PUIDS (eg. cluster0: [p1, p2, p3], cluster1: [p4, p5])
-    cluster_puid_gb = clustered_parcel_data.groupby('cluster_ID')['puid'].apply(list).reset_index()
-    
-    super_parcels = build_superparcels(
-        df=clustered_parcel_data,
-        buffer=distance_threshold,
-        dissolve_by='cluster_ID',
-    )
-
-    # CREATE HASED UNIQUE SP_ID
-    super_parcels['sp_id'] = cluster_puid_gb['puid'].apply(hash_puids)
+        with recorder.stage('area_filter', rows_in=len(clustered_parcel_data)) as rec:
+            clustered_parcel_data = filter_area(clustered_parcel_data, area_threshold)
+            rec['rows_out'] = len(clustered_parcel_data)
+
+        if len(clustered_parcel_data) == 0:
+            if cache:
+                store_owner_cache(cache, None, computed_owners, cache_keys, canonical_rows, labels_out, key_field)
+            recorder.write(report_path, **report_meta, superparcels=0)
+            return None # no clusters over the area threshold
+
+    # only the clusters of owners missing from the cache are dissolved
+    is_cached = clustered_parcel_data[key_field].isin(list(hits))
+    super_parcels = None
+    if not is_cached.all():
+        super_parcels = build_superparcels(
+            df=clustered_parcel_data[~is_cached] if hits else clustered_parcel_data,
+            buffer=distance_threshold,
+            dissolve_by='cluster_ID',
+            recorder=recorder,
+        )
+    if cache:
+        store_owner_cache(cache, super_parcels, computed_owners, cache_keys, canonical_rows, labels_out, key_field)
+    if hits:
+        # in dissolve order: overlap removal depends on the row order
+        super_parcels = pd.concat([
+            super_parcels,
+            cached_superparcels(clustered_parcel_data[is_cached], hits, key_field)
+        ]).sort_values('cluster_ID', ignore_index=True)
+
+    # CREATE HASHED UNIQUE SP_ID from the set of PUIDs of each cluster
+    with recorder.stage('hashing', rows_in=len(clustered_parcel_data)) as rec:
+        sp_ids = hash_puid_groups(clustered_parcel_data['puid'], clustered_parcel_data['cluster_ID'])
+        super_parcels['sp_id'] = super_parcels['cluster_ID'].map(sp_ids)
+        rec['rows_out'] = len(super_parcels)
 
     # ADD OTHER ATTRIBUTES
     super_parcels = add_attributes(
@@ -140,146 +277,547 @@ def build_sp_fixed(
     )
     super_parcels['sp_area'] = super_parcels['sp_area'].astype(int)
     super_parcels['p_area'] = super_parcels['p_area'].astype(int)
+    super_parcels['pcount'] = super_parcels['pcount'].astype(int)
 
     # REMOVE OVERLAPS
     logger.info('Removing overlaps...')
-    super_parcels = remove_overlap(super_parcels)
+    with recorder.stage('overlap_removal', rows_in=len(super_parcels)) as rec:
+        super_parcels = remove_overlap(super_parcels)
+        rec['rows_out'] = len(super_parcels)
 
     # REMOVE INVALID GEOMETRIES
     logger.info(f'Shape before removing invalid geometries: {super_parcels.shape}')
     logger.info('Removing invalid geometries...')
-    super_parcels, invalid_geoms = remove_invalid_geoms(super_parcels)
+    with recorder.stage('invalid_geoms', rows_in=len(super_parcels)) as rec:
+        super_parcels, invalid_geoms = remove_invalid_geoms(super_parcels)
+        rec['rows_out'] = len(super_parcels)
     logger.info(f'Shape after removing invalid geometries: {super_parcels.shape}')
     # FINAL TABLE
-    super_parcels = (
-        super_parcels[['fips', 'sp_id', 'cluster_ID', key_field, 'pcount', 'area_ratio', 'p_area', 'sp_area', 'cbi', 'geometry']]
-        .to_crs(epsg=4326)
-    )
+    with recorder.stage('output', rows_in=len(super_parcels)) as rec:
+        super_parcels = (
+            restore_dtypes(
+                super_parcels[['fips', 'sp_id', 'cluster_ID', key_field, 'pcount', 'area_ratio', 'p_area', 'sp_area', 'cbi', 'geometry']],
+                fields=[key_field]
+            )
+            .to_crs(epsg=4326)
+        )
+        rec['rows_out'] = len(super_parcels)
 
+    recorder.write(report_path, **report_meta, superparcels=len(super_parcels))
     logger.info(f'Finished building super parcels for {fips} and dt {distance_threshold}...')
     return super_parcels
 
 
-def build_sp_multi(
-    parcels, 
+def combine_places(places, key_field='OWNER'):
+    """
+    Combines the superparcels of the places of a county, built by
+    build_sp_fixed per place (see helper.process_place_batch), into one
+    table with the place_id and place_name of each superparcel. An owner's
+    clusters are numbered per place, so cluster_IDs are qualified by place
+    ('<owner>_<place_id>-<cluster>').
+    Returns None if no place has superparcels.
+    """
+    frames = []
+    for place_id, place_name, super_parcels in places:
+        if super_parcels is None or len(super_parcels) == 0:
+            continue
+        owner_cluster = super_parcels['cluster_ID'].str.rsplit('_', n=1)
+        frames.append(super_parcels.assign(
+            cluster_ID=owner_cluster.str[0] + f'_{place_id}-' + owner_cluster.str[1],
+            place_id=place_id,
+            place_name=place_name,
+        ))
+    if not frames:
+        return None
+
+    columns = list(frames[0].columns.drop(['place_id', 'place_name']))
+    at = columns.index(key_field) + 1
+    combined = pd.concat(frames, ignore_index=True) if len(frames) > 1 else frames[0]
+    return combined[columns[:at] + ['place_id', 'place_name'] + columns[at:]]
+
+
+def run_owner_shard(parcels, owners, key_field, distance_threshold, sample_size, recorder=NULL_RECORDER, owner_rows=None, labels_out=None, graph=None):
+    """
+    Runs owner clustering for a shard of owners.
+    Returns the clustered parcels of those owners.
+    'owner_rows' maps each owner to its row positions in 'parcels' (see
+    owner_positions). Computed here if None.
+    If 'labels_out' (an array with a label per parcel) is given, the labels
+    of every clustered owner are written to it, outliers included.
+    With a NeighborGraph ('graph'), owners are clustered from its stored
+    distances instead of their distance matrices.
+    """
+    if owner_rows is None:
+        owner_rows = owner_positions(parcels, key_field)
+    geoms = parcels.geometry
+
+    # only the row positions and labels of clustered parcels are kept per owner
+    positions, labels = [], []
+    for owner in owners:
+        rows = owner_rows.get(owner)
+        if rows is None: # missing owner
+            continue
+        
+        # CLUSTERING
+        with recorder.stage('clustering', rows_in=len(rows)) as rec:
+            if graph is not None:
+                clusters = graph.owner_clusters(rows, min_samples=sample_size, eps=distance_threshold)
+            else:
+                clusters = build_owner_clusters(
+                        geoms.iloc[rows],
+                        min_samples=sample_size,
+                        eps=distance_threshold
+                    )
+            rec['rows_out'] = int((clusters != -1).sum())
+
+        if len(clusters) == 0: # EMPTY: NO CLUSTERS
+            continue
+        if labels_out is not None:
+            labels_out[rows] = clusters
+
+        clustered = clusters != -1 # drop outliers
+        order = np.argsort(rows[clustered]) # parcels in input order, as the dissolve takes them
+        positions.append(rows[clustered][order])
+        labels.append(clusters[clustered][order])
+
+    if not positions:
+        return gpd.GeoDataFrame()
+    return clustered_parcels(parcels, np.concatenate(positions), np.concatenate(labels), key_field)
+
+
+def county_graph(parcels, key_field, fips, fingerprint, graph_dir, max_distance):
+    """
+    Neighbor graph of a county snapshot, identified by the input
+    'fingerprint', at <graph_dir>/<fips>-<fingerprint>-m<max_distance>.
+    Graphs of older snapshots of the county in 'graph_dir' are removed,
+    so place builds pass one 'graph_dir' per place (see helper.build_places).
+    """
+    path = os.path.join(graph_dir, f'{fips}-{fingerprint}-m{max_distance}')
+    for old_path in glob.glob(os.path.join(graph_dir, f'{fips}-*-m{max_distance}')):
+        if old_path != path:
+            shutil.rmtree(old_path, ignore_errors=True)
+
+    owners, _ = pd.factorize(parcels[key_field])
+    return load_or_build_graph(path, parcels.geometry.to_numpy(), owners, max_distance)
+
+
+def owner_positions(parcels, key_field, sort_field='puid'):
+    """
+    Row positions of each owner's parcels, {owner: array of positions}.
+    One groupby instead of a boolean mask over the county per owner.
+
+    Each owner's positions are in 'sort_field' order (ties in row order),
+    so its DBSCAN labels do not depend on the row order of the input and
+    an owner cached by one build is numbered as an uncached build of the
+    same parcels numbers it (see store_owner_cache).
+    """
+    if sort_field not in parcels:
+        return parcels.groupby(key_field, sort=False, observed=True).indices
+    order = np.argsort(parcels[sort_field].to_numpy(), kind='stable')
+    owners = parcels[key_field].take(order)
+    return {
+        owner: order[rows]
+        for owner, rows in owners.groupby(owners, sort=False, observed=True).indices.items()
+    }
+
+
+def clustered_parcels(parcels, positions, labels, key_field):
+    """
+    Takes the clustered parcels out of 'parcels' at once and adds the
+    cluster attributes with one groupby per (owner, cluster):
+    pcount (number of parcels) and p_area (total parcel area), both
+    downcast to the smallest integer type that holds them.
+    """
+    cluster_data = parcels.take(positions)[[key_field, 'puid', 'geometry']].reset_index(drop=True)
+    cluster_data.insert(2, 'cluster', labels)
+
+    cluster_area = cluster_data['geometry'].area.astype(int)
+    clusters = cluster_area.groupby([cluster_data[key_field], cluster_data['cluster']], sort=False, observed=True)
+    cluster_data.insert(3, 'pcount', clusters.transform('size'))
+    cluster_data.insert(4, 'p_area', clusters.transform('sum'))
+    return compact_dtypes(cluster_data, downcast_fields=['pcount', 'p_area'])
+
+
+def cached_parcels(parcels, hits, canonical_rows, key_field):
+    """
+    Clustered parcels of the owners found in the owner cache, from their
+    cached labels ('hits', {owner: entry}). 'canonical_rows' holds each
+    owner's row positions in the order its labels were cached (see
+    manifest.owner_cache_keys).
+    """
+    positions, labels = [], []
+    for owner, entry in hits.items():
+        clustered = entry['labels'] != -1
+        positions.append(canonical_rows[owner][clustered])
+        labels.append(entry['labels'][clustered])
+    positions = np.concatenate(positions)
+    if len(positions) == 0:
+        return gpd.GeoDataFrame()
+    order = np.argsort(positions, kind='stable') # parcels in input order, as the owner loop takes them
+    labels = np.concatenate(labels).astype(np.int64)
+    return clustered_parcels(parcels, positions[order], labels[order], key_field)
+
+
+def cached_superparcels(cached_data, hits, key_field, dissolve_by='cluster_ID'):
+    """
+    Superparcels of the owners found in the owner cache: the attributes of
+    the first parcel of each cluster, as the dissolve takes them, with the
+    cached dissolved and buffered geometry and cross-boundary indicator.
+    """
+    owners, clusters, wkb, cbi = [], [], [], []
+    for owner, entry in hits.items():
+        owners.extend([owner] * len(entry['clusters']))
+        clusters.append(entry['clusters'])
+        wkb.extend(entry['wkb'])
+        cbi.append(entry['cbi'])
+    cached_index = pd.MultiIndex.from_arrays([
+        pd.Index(owners, dtype=object), np.concatenate(clusters).astype(np.int64)
+    ])
+
+    sp = cached_data.drop_duplicates(dissolve_by)
+    found = cached_index.get_indexer(pd.MultiIndex.from_arrays([
+        sp[key_field].astype(object), sp['cluster'].astype(np.int64)
+    ]))
+    if (found == -1).any():
+        raise RuntimeError(f'Owner cache entries without the geometry of {int((found == -1).sum())} clusters')
+
+    sp = sp.copy()
+    sp['geometry'] = gpd.GeoSeries.from_wkb(np.asarray(wkb, dtype=object)[found], index=sp.index, crs=cached_data.crs)
+    sp['cbi'] = np.concatenate(cbi).astype(np.int64)[found]
+    return sp.reset_index(drop=True)
+
+
+def store_owner_cache(cache, super_parcels, owners, cache_keys, canonical_rows, labels, key_field):
+    """
+    Stores the labels and superparcel geometries of the owners clustered in
+    this build. 'super_parcels' holds the dissolved and buffered clusters
+    (before overlap removal, which depends on the neighbouring owners), or
+    None if no cluster was dissolved.
+    """
+    sp_rows, wkb, sp_clusters, sp_cbi = {}, None, None, None
+    if super_parcels is not None:
+        sp_rows = super_parcels.groupby(key_field, sort=False, observed=True).indices
+        wkb = super_parcels.geometry.to_wkb().to_numpy()
+        sp_clusters = super_parcels['cluster'].to_numpy(dtype=np.int32)
+        sp_cbi = super_parcels['cbi'].to_numpy(dtype=np.int8)
+
+    entries = {}
+    for owner in owners:
+        key = cache_keys.get(owner)
+        if key is None: # too few parcels to cluster
+            continue
+        rows = sp_rows.get(owner, np.array([], dtype=int))
+        entries[key] = {
+            'labels': labels[canonical_rows[owner]].astype(np.int32),
+            'clusters': sp_clusters[rows] if len(rows) else np.array([], dtype=np.int32),
+            'wkb': list(wkb[rows]) if len(rows) else [],
+            'cbi': sp_cbi[rows] if len(rows) else np.array([], dtype=np.int8),
+        }
+    if entries:
+        cache.put_many(entries)
+        logger.info(f'Owner cache: stored {len(entries)} owners ({cache.summary()})')
+    cache.close()
+
+
+def split_places(parcels, places=None, key_field='OWNER', puid_field='PUID', field=None):
+    """
+    Prepares a county for an adaptive build as build_sp_fixed prepares its
+    parcels (puid, categorical owners, UTM projection, geometry repair) and
+    splits it by place (see places.PlaceIndex.split).
+
+    If 'field' (keyword arguments of adaptive.parcel_distances) is given,
+    the local epsilon of every parcel is computed over the whole county
+    and kept as 'local_eps', for the 'field' KNN mode.
+
+    Returns (place_id, place_name, parcels) per place, in place order, with
+    the parcels outside every place last as RURAL_PLACE_ID. Without
+    'places', the county is one place.
+    """
+    parcels = parcels.reset_index(drop=True)
+    if puid_field in parcels:
+        parcels['puid'] = parcels[puid_field]
+    else:
+        logger.warning(f'No {puid_field} field. sp_ids are hashed from row positions and change with row order.')
+        parcels['puid'] = parcels.index
+    # only what the place tasks use is pickled to them
+    parcels = compact_dtypes(parcels[[key_field, 'puid', parcels.geometry.name]], category_fields=[key_field])
+    if not parcels.crs.is_projected: # 'sps serve' caches counties already projected
+        parcels = to_utm(parcels)
+    parcels = repair_invalid_geoms(parcels)[0].reset_index(drop=True)
+    if field is not None:
+        parcels['local_eps'] = parcel_distances(parcels, **field)
+
+    if places is None:
+        return [(1, '', parcels)]
+    return [
+        (place_id, place_name, compact_dtypes(place_parcels))
+        for place_id, place_name, place_parcels in places.split(parcels)
+    ]
+
+
+def build_sp_adaptive_place(
+    parcels,
     fips,
     key_field='OWNER',
-    distance_thresholds=[30,50,75,100], 
+    place_id=1,
+    place_name='',
     sample_size=3,
-    area_threshold=None,
-    qa=False # if true, trigger cprofiler
+    max_parcels_per_region=MAX_PARCELS_PER_REGION,
+    kneighbors=KNEIGHBORS,
+    smoothing_window=SMOOTHING_WINDOW,
+    min_urban_distance=MIN_URBAN_DISTANCE,
+    max_urban_distance=MAX_URBAN_DISTANCE,
+    rural_distance=RURAL_DISTANCE,
+    knn_mode='regional',
+    report_path=None,
+    trace_memory=False,
     ):
     """
-    Executes the clustering and super parcel creation process.
-    Uses a fixed epsilon value for DBSCAN clustering.
+    Clusters the parcels of one place, a task of an adaptive build.
+    The place is split into regions and the owners of each region
+    are clustered with the region's own epsilon, from the KNN distances of
+    its parcels. Single parcels then join the nearest same-owner cluster
+    within max_urban_distance, and same-owner clusters of different
+    regions within it are merged.
+
+    In the 'field' knn_mode, each owner is clustered with the median local
+    epsilon of its parcels (their 'local_eps', see split_places) instead.
+    The owners of one epsilon form a region numbered by it; as an owner is
+    in one region, there are no clusters to merge across regions.
+
+    Parcels outside every place (RURAL_PLACE_ID) are one region clustered
+    with rural_distance; their clusters are only merged across the county
+    (see build_sp_adaptive).
 
     Args:
-    parcels (GeoDataFrame): Candidate parcels for super parcel creation.
+    parcels (GeoDataFrame): Parcels of the place, projected, with key_field and puid (see split_places).
     key_field (str): Field to use for clustering.
-    distance_threshold (int): Distance threshold for DBSCAN clustering.
+    place_id (int): Place number, RURAL_PLACE_ID for the parcels outside every place.
+    place_name (str): Place name, kept on its superparcels.
     sample_size (int): Minimum number of samples for DBSCAN clustering.
-    area_threshold (int): Minimum area threshold for super parcel creation.
+    max_parcels_per_region (int): Parcels per region.
+    kneighbors (int): Nearest neighbors of the regional KNN distance.
+    smoothing_window (float): Share of a region's KNN distances in the moving average.
+    min_urban_distance (int): Lower bound passed to the regional KNN distance.
+    max_urban_distance (int): Distance within which singles join clusters and regions merge.
+    rural_distance (int): Epsilon outside places.
+    knn_mode (str): 'regional' (regions by coordinate bisection) or 'field' (local epsilon per owner).
+    report_path (str): If set, per-stage timing and memory is written to this JSON file.
+    trace_memory (bool): Record tracemalloc peaks per stage (slower). Requires report_path.
+
+    Returns the clustered parcels with cluster_ID, place_id, place_name,
+    region and knn_dist (the region's epsilon), or None if there are no clusters.
     """
-    class TqdmToLogger:
-        def write(self, message):
-            # Avoid logging empty messages (e.g., newlines)
-            message = message.strip()
-            if message:
-                logger.info(message)
-        def flush(self):
-            pass
-    parcels = gpd.read_file(parcels)
-    # setup cProfiler
-    if qa:
-        # enable cProfiler
-        pass
-    
-    utm = parcels.estimate_utm_crs().to_epsg()
-    parcels = parcels.to_crs(epsg=utm)  
+    recorder = StageRecorder(trace_memory) if report_path else NULL_RECORDER
+    report_meta = {'fips': fips, 'place_id': place_id, 'parcels': len(parcels)}
+    parcels = parcels.reset_index(drop=True)
+    rural = place_id == RURAL_PLACE_ID
+    field = knn_mode == 'field' and not rural
+
+    with recorder.stage('regions', rows_in=len(parcels)) as rec:
+        if rural:
+            regions = np.zeros(len(parcels), dtype=np.int64)
+        elif field:
+            regions = parcels[key_field].map(owner_distances(parcels, key_field)).to_numpy(dtype=np.int64)
+        else:
+            regions = place_regions(parcels, max_parcels_per_region, kneighbors)
+        region_rows = pd.Series(regions).groupby(regions).indices
+        rec['rows_out'] = len(region_rows)
+
+    frames, singles = [], [] # per region, concatenated once
+    with recorder.stage('owner_loop', rows_in=len(parcels)) as rec:
+        for region, rows in region_rows.items():
+            region_parcels = parcels.take(rows).reset_index(drop=True)
+            if len(rows) == 1:
+                singles.append(region_parcels)
+                continue
+
+            if rural:
+                distance = rural_distance
+            elif field:
+                distance = int(region)
+            else:
+                with recorder.stage('knn_distance', rows_in=len(rows)):
+                    distance = region_distance(
+                        region_parcels, kneighbors, smoothing_window, min_urban_distance, max_urban_distance
+                    )
+
+            owner_rows = owner_positions(region_parcels, key_field)
+            labels = np.full(len(rows), -1, dtype=np.int64)
+            region_data = run_owner_shard(
+                region_parcels, list(owner_rows), key_field, distance, sample_size, recorder, owner_rows,
+                labels_out=labels
+            )
+            singles.append(region_parcels[labels == -1])
+            if len(region_data) == 0:
+                continue
+
+            # owner_place-region_cluster
+            region_data['cluster_ID'] = (
+                region_data[key_field].astype(str) + f'_{place_id}-{region}_' +
+                region_data['cluster'].astype(str)
+            )
+            region_data['region'] = int(region)
+            region_data['knn_dist'] = distance
+            frames.append(region_data)
+        rec['rows_out'] = sum(len(frame) for frame in frames)
+
+    if not frames:
+        recorder.write(report_path, **report_meta, clustered=0)
+        return None # no clusters in this place
+
+    clustered = pd.concat(frames, ignore_index=True) if len(frames) > 1 else frames[0]
+    clustered['place_id'] = place_id
+    clustered['place_name'] = place_name
+
+    if not rural:
+        with recorder.stage('attach_singles', rows_in=len(clustered)) as rec:
+            clustered = attach_singles(clustered, pd.concat(singles, ignore_index=True), key_field, max_urban_distance)
+            rec['rows_out'] = len(clustered)
+    if not rural and not field:
+        with recorder.stage('region_merge', rows_in=len(clustered)) as rec:
+            clustered = merge_cross_region_clusters(
+                clustered, max_merge_distance=max_urban_distance, key_field=key_field, region_field='region'
+            )
+            rec['rows_out'] = clustered['cluster_ID'].nunique()
 
-    unique_owners = parcels[key_field].unique()
+    recorder.write(report_path, **report_meta, clustered=len(clustered))
+    logger.info(f'Clustered {len(clustered)} parcels of place {place_id} {place_name} in {fips}')
+    return clustered[[key_field, 'puid', 'cluster_ID', 'place_id', 'place_name', 'region', 'knn_dist', 'geometry']]
 
-    clustered_parcel_data = gpd.GeoDataFrame() # cluster data
-    #single_parcel_data = gpd.GeoDataFrame() # non-clustered data
-    logger.info(f'Building super parcels for {fips} and dt {distance_thresholds}...')
-   
-    for owner in unique_owners:
-        owner_parcels = parcels[parcels[key_field] == owner] # ownder specific parcels
-        
-        # REFACTOR: CLUSTERING
-        clusters = build_owner_clusters(
-                owner_parcels,
-                min_samples=sample_size,
-                eps=distance_thresholds
-            )
 
-        if len(clusters) == 0: # EMPTY: NO CLUSTERS
-            #single_parcel_data = pd.concat([single_parcel_data, owner_parcels], ignore_index=True)  
-            #single_parcel_data = add_attributes(
-            #    single_parcel_data,
-            #    #place_id=place_id,
-            #    )
-            continue
+def build_sp_adaptive(
+    clustered,
+    fips,
+    key_field='OWNER',
+    rural_distance=RURAL_DISTANCE,
+    area_threshold=None,
+    knn_mode='regional',
+    report_path=None,
+    trace_memory=False,
+    ):
+    """
+    Builds the superparcels of a county from the clustered parcels of its
+    places (see build_sp_adaptive_place), the last task of an adaptive build.
+    Same-owner clusters within rural_distance are merged across places,
+    then every cluster is dissolved and closed with a buffer of its own
+    knn_dist.
 
-        owner_parcels['cluster'] = clusters # clustert ID
-        owner_parcels['cluster_area'] = owner_parcels['geometry'].area
-        counts = owner_parcels['cluster'].value_counts() # pd.series of cluster counts
-        
-        outlier_ids, clean_counts = segregate_outliers(counts, -1)
-
-        #add_to_singles = locate_in_df(
-        #    df=owner_parcels, 
-        #    list_of_ids=outlier_ids, 
-        #    field='cluster'
-        #).drop(columns=['cluster', 'cluster_area'])
-
-        #single_parcel_data = pd.concat([single_parcel_data, add_to_singles], ignore_index=True)
-
-        #REFACTOR: WHAT FIELDS GO HERE??
-        #if len(single_parcel_data) > 0:
-        #    single_parcel_data = add_attributes(
-        #        single_parcel_data,
-        #        #place_id=place_id,
-        #    )
-
-        cluster_filter = remove_from_df(
-            df=owner_parcels, 
-            list_of_ids=outlier_ids, 
-            field='cluster'
-        )
-        
-        # REFACTOR: ADD ATTRIBUTES??
-        if len(cluster_filter) > 0:
-            cluster_filter = add_attributes(
-                cluster_filter,
-                pcount=cluster_filter['cluster'].map(clean_counts)
-            )
-            clustered_parcel_data = pd.concat([clustered_parcel_data, cluster_filter], ignore_index=True)
+    Args:
+    clustered (GeoDataFrame): Clustered parcels of every place of the county, projected.
+    key_field (str): Field to use for clustering.
+    rural_distance (int): Distance within which same-owner clusters merge across places.
+    area_threshold (int): Minimum total parcel area (sq. meters) of a cluster. Smaller clusters are dropped before the dissolve.
+    knn_mode (str): KNN mode the places were clustered with (see build_sp_adaptive_place), kept on the superparcels.
+    report_path (str): If set, per-stage timing and memory is written to this JSON file.
+    trace_memory (bool): Record tracemalloc peaks per stage (slower). Requires report_path.
+
+    Returns the superparcels as build_sp_fixed does, with place_id,
+    place_name, region, knn_dist and knn_mode, or None if there are none.
+    """
+    recorder = StageRecorder(trace_memory) if report_path else NULL_RECORDER
+    report_meta = {'fips': fips, 'dt': 'adaptive', 'parcels': len(clustered)}
+    clustered = compact_dtypes(clustered.reset_index(drop=True), category_fields=[key_field])
 
-    if len(clustered_parcel_data) == 0:
-        return None # no clusters for input county candidate parcels
+    with recorder.stage('place_merge', rows_in=len(clustered)) as rec:
+        clustered = merge_cross_region_clusters(clustered, max_merge_distance=rural_distance, key_field=key_field)
+        rec['rows_out'] = clustered['cluster_ID'].nunique()
 
-    # REFACTOR: cluster ID       
-    clustered_parcel_data['cluster_ID'] = (
-        clustered_parcel_data[key_field] + '_' +
-        clustered_parcel_data['cluster'].astype(str)
-    )
+    # pcount and p_area of the merged clusters
+    parcel_area = clustered['geometry'].area.astype(int)
+    clusters = parcel_area.groupby(clustered['cluster_ID'], sort=False)
+    clustered['pcount'] = clusters.transform('size')
+    clustered['p_area'] = clusters.transform('sum')
 
-    # REFACTOR: SUPER PARCELS creation with area theshold option
     if area_threshold:
-        # log message not implemented yet
-        # run filter_area()
-        pass
+        with recorder.stage('area_filter', rows_in=len(clustered)) as rec:
+            clustered = filter_area(clustered, area_threshold)
+            rec['rows_out'] = len(clustered)
+        if len(clustered) == 0:
+            recorder.write(report_path, **report_meta, superparcels=0)
+            return None # no clusters over the area threshold
 
     super_parcels = build_superparcels(
-        df=clustered_parcel_data,
-        buffer=distance_threshold,
+        df=clustered,
+        buffer='knn_dist',
         dissolve_by='cluster_ID',
+        recorder=recorder,
     )
 
-    # super parcel ID eg. owner + cluster ID + ID of each unique super parcel
-    super_parcels['sp_id'] = super_parcels['cluster_ID'] + "_" + super_parcels.groupby('cluster_ID').cumcount().astype(str) 
-    super_parcels = super_parcels[['sp_id', key_field, 'pcount', 'geometry']]
+    with recorder.stage('hashing', rows_in=len(clustered)) as rec:
+        sp_ids = hash_puid_groups(clustered['puid'], clustered['cluster_ID'])
+        super_parcels['sp_id'] = super_parcels['cluster_ID'].map(sp_ids)
+        rec['rows_out'] = len(super_parcels)
 
-    logger.info(f'Finished building super parcels for {fips} and dt {distance_threshold}...')
-    return super_parcels
\ No newline at end of file
+    super_parcels = add_attributes(
+        super_parcels,
+        fips=fips,
+        knn_mode=knn_mode,
+        sp_area=super_parcels['geometry'].area,
+        area_ratio=super_parcels['p_area'] / super_parcels['geometry'].area,
+    )
+    super_parcels['sp_area'] = super_parcels['sp_area'].astype(int)
+    super_parcels['p_area'] = super_parcels['p_area'].astype(int)
+    super_parcels['pcount'] = super_parcels['pcount'].astype(int)
+
+    logger.info('Removing overlaps...')
+    with recorder.stage('overlap_removal', rows_in=len(super_parcels)) as rec:
+        super_parcels = remove_overlap(super_parcels)
+        rec['rows_out'] = len(super_parcels)
+
+    with recorder.stage('invalid_geoms', rows_in=len(super_parcels)) as rec:
+        super_parcels, invalid_geoms = remove_invalid_geoms(super_parcels)
+        rec['rows_out'] = len(super_parcels)
+
+    with recorder.stage('output', rows_in=len(super_parcels)) as rec:
+        super_parcels = (
+            restore_dtypes(
+                super_parcels[[
+                    'fips', 'sp_id', 'cluster_ID', key_field, 'place_id', 'place_name', 'region', 'knn_dist',
+                    'knn_mode', 'pcount', 'area_ratio', 'p_area', 'sp_area', 'cbi', 'geometry'
+                ]],
+                fields=[key_field]
+            )
+            .to_crs(epsg=4326)
+        )
+        rec['rows_out'] = len(super_parcels)
+
+    recorder.write(report_path, **report_meta, superparcels=len(super_parcels))
+    logger.info(f'Finished building adaptive super parcels for {fips}...')
+    return super_parcels
+
+
+def build_sp_multi(
+    parcels,
+    fips,
+    key_field='OWNER',
+    distance_thresholds=[30,50,75,100],
+    sample_size=3,
+    area_threshold=None,
+    **kwargs
+    ):
+    """
+    Builds the superparcels of a county for several distance thresholds,
+    one build_sp_fixed per threshold. Profile it with helper.profile_task
+    (sps build spfixed -qa runs every task that way).
+
+    Args:
+    parcels (GeoDataFrame or str): Candidate parcels, or the path of a file of them.
+    key_field (str): Field to use for clustering.
+    distance_thresholds (list): Distance thresholds for DBSCAN clustering.
+    sample_size (int): Minimum number of samples for DBSCAN clustering.
+    area_threshold (int): Minimum total parcel area (sq. meters) of a cluster.
+    kwargs: Passed to build_sp_fixed. Pass a neighbor_graph_dir to compute
+        the county's distances once for every threshold.
+
+    Returns a dict of the superparcels (or None) of each distance threshold.
+    """
+    if isinstance(parcels, str):
+        parcels = gpd.read_file(parcels)
+    logger.info(f'Building super parcels for {fips} and dt {distance_thresholds}...')
+    return {
+        distance_threshold: build_sp_fixed(
+            parcels, fips, key_field, distance_threshold, sample_size, area_threshold, **kwargs
+        )
+        for distance_threshold in distance_thresholds
+    }
@@ -1,9 +1,8 @@
 import os
 import sys
+import shutil
 import glob
 import click
-import pandas as pd
-import geopandas as gpd
 import json
 import logging
 from datetime import datetime, timezone
@@ -86,6 +85,8 @@ def config(ctx, build_dir, json_key, county_fips, see, update):
     config["GCP_INPUT_TABLE"] = 'short_query_pu_pipeline_candidate_parcels'
     config["GCP_OUTPUT_DATASET"] = 'superparcels'
     config["GCS_BUCKET"] = 'gs://geospatial-projects/super_parcels'
+    config["BACKEND"] = 'bigquery'
+    config["LOCAL_DATA_DIR"] = os.path.join(build_dir, "local_tables")
     config["FIPS_LIST"] = county_fips
     
     try:
@@ -101,8 +102,11 @@ def config(ctx, build_dir, json_key, county_fips, see, update):
     click.echo("_________________________________________________________")
 
 @click.group(help='Build Processes build run the Phase 1 and Phase 2 processes for SuperParcel creation.')
+@click.option('--daemon', is_flag=True, default=False,
+              help="Submits the build to the warm 'sps serve' daemon instead of running it in this process. Default is False.")
 @click.pass_context
-def build(ctx):
+def build(ctx, daemon):
+    ctx.obj["DAEMON"] = daemon
     if ctx.obj["VERBOSE"]:
         logger.setLevel(logging.DEBUG)
 
@@ -117,46 +121,290 @@ def build(ctx):
 @click.option('-ss', '--sample-size', type=int, default=3,
               help="Minimum number of samples for clustering. Default is 3.")
 @click.option('-at', '--area-threshold', type=int, default=None,
-              help="Minimum area threshold for super parcel creation. Default is None. NOT YET IMPLEMENTED.")
+              help="Minimum total parcel area (sq. meters) of a cluster. Smaller clusters are dropped before the dissolve. Default is None.")
 @click.option('-local', '--local-upload', type=click.BOOL, default=False,
               help="Saves build to local build directory. Default is False.")
 @click.option('-bq', '--bq-upload', type=click.BOOL, default=True,
                 help="Uploads to BigQueryTable. Default is True.")
+@click.option('-stage', '--stage-upload', type=click.BOOL, default=False,
+              help="Stages results locally and issues one BigQuery load per output table at the end of the run. Default is False.")
+@click.option('-smb', '--stage-flush-mb', type=int, default=None,
+              help="Flushes a staged output table to BigQuery once it exceeds this many MB. Default is None (flush at end of run).")
+@click.option('--incremental', is_flag=True, default=False,
+              help="Diffs each county against its previous output (by sp_id and content hash) and uploads only the inserted, changed and deleted superparcels in one merge. Cannot be combined with -stage. Default is False.")
+@click.option('-oc', '--owner-cache', is_flag=True, default=False,
+              help="Caches the clusters and superparcel geometries of every owner in build_dir/cache, keyed by its parcels and the clustering parameters. Owners whose parcels did not change since a previous build are not clustered again. Default is False.")
+@click.option('-ocmb', '--owner-cache-mb', type=int, default=2048,
+              help="Size cap of the owner cache in MB. The least recently used owners are evicted. Default is 2048.")
+@click.option('-ng', '--neighbor-graph', is_flag=True, default=False,
+              help="Stores the distances between every pair of same-owner parcels up to --neighbor-max-dist per county snapshot in build_dir/neighbors, and clusters every distance threshold up to it from the stored graph. Default is False.")
+@click.option('-ngmax', '--neighbor-max-dist', type=int, default=500,
+              help="Largest same-owner distance stored in the neighbor graph. Larger distance thresholds compute their distances. Default is 500.")
+@click.option('-ut', '--upload-threads', type=int, default=2,
+              help="Number of background BigQuery upload threads. Default is 2.")
 @click.option('-bd', '--build-dir', type=click.Path(), default=None,
               help="Directory where you want the build to occur. If not provided, will use the build directory from config.json.",
               required=False)
+@click.option('--resume', is_flag=True, default=False,
+              help="Resumes the last run in the build directory, skipping tasks completed in its manifest. Default is False.")
 @click.option('-qa', is_flag=True, default=False,
-              help="Enables cProfiler. Default is False. NOT YET IMPLEMENTED.")
-@click.option('-pb', type=click.Path(), default=None,
-              help="Path to Place Boundaries Shapefile. FUTURE IMPLEMENTATION")
+              help="Profiles each task with cProfile. Writes a .pstats file per FIPS and distance threshold and a merged hot-function report to the build's analysis directory. Default is False.")
+@click.option('-report', '--run-report', is_flag=True, default=False,
+              help="Records wall time, CPU time, peak memory and row counts per pipeline stage. Writes a run_report.json to the build's analysis directory and prints a summary. Default is False.")
+@click.option('-tm', '--trace-memory', is_flag=True, default=False,
+              help="Adds tracemalloc peaks per stage to the run report (slower). Default is False.")
+@click.option('--backend', type=click.Choice(['bigquery', 'local']), default=None,
+              help="Reads input from and writes output to BigQuery or local Parquet tables under LOCAL_DATA_DIR. If not provided, uses BACKEND from config.json (default bigquery).")
+@click.option('--refresh', is_flag=True, default=False,
+              help="With --daemon, pulls the counties again instead of using the daemon's county cache. Default is False.")
+@click.option('-so', '--spatial-order', type=click.Choice(['hilbert', 'morton']), default=None,
+              help="Sorts each county's parcels along a Hilbert or Morton curve through their bounding box centers at ingest, before any clustering, and keeps the curve key in a spatial_key column. Default is None (input order).")
+@click.option('-pb', type=click.Path(exists=True), default=None,
+              help="Path to Place Boundaries Shapefile (NAME field for place names). Each place of a county is built as its own task with -dt, the parcels outside every place with --rural-dt. Output tables are named with the rural distance (e.g. spfixed-ss3-rdt300-dt200). Default is None.")
+@click.option('-rdt', '--rural-dt', type=int, default=None,
+              help="Distance threshold of the parcels outside every place, with -pb. Default is each -dt.")
 @click.pass_context
-def spfixed(ctx, fips, dist_thres, sample_size, area_threshold, local_upload, bq_upload, build_dir, qa, pb):
+def spfixed(ctx, **params):
+    run_command(ctx, 'spfixed', params)
+
+
+@build.command(
+    help="Builds SuperParcel Phase 2 with an adaptive epsilon: places are split into regions of about -mpr parcels and each region is clustered with the epsilon of its own KNN distances. Places and regions run in parallel."
+)
+@click.option('-fips', default=None, multiple=True, type=str,
+              help="FIPS code(s) to build SuperParcel for. Comma-seperated. No Spaces. If not provided, will build for all FIPS codes found in config.json",
+              callback=parse_to_str_list)
+@click.option('-ss', '--sample-size', type=int, default=3,
+              help="Minimum number of samples for clustering. Default is 3.")
+@click.option('-at', '--area-threshold', type=int, default=None,
+              help="Minimum total parcel area (sq. meters) of a cluster. Smaller clusters are dropped before the dissolve. Default is None.")
+@click.option('-mpr', '--max-parcels-per-region', type=int, default=200,
+              help="Parcels per region of a place. Regions are cut by recursive coordinate bisection. Default is 200.")
+@click.option('-k', '--kneighbors', type=int, default=3,
+              help="Nearest neighbors of the regional KNN distance. Default is 3.")
+@click.option('-sw', '--smoothing-window', type=float, default=0.5,
+              help="Share of a region's KNN distances in the smoothing moving average. Default is 0.5.")
+@click.option('-mind', '--min-urban-dist', type=int, default=15,
+              help="Smallest regional epsilon. Default is 15.")
+@click.option('-maxd', '--max-urban-dist', type=int, default=120,
+              help="Largest regional epsilon, and the distance within which single parcels join clusters and regions merge in a place. Default is 120.")
+@click.option('-rd', '--rural-dist', type=int, default=200,
+              help="Epsilon of the parcels outside every place, and the distance within which clusters merge across places. Default is 200.")
+@click.option('-km', '--knn-mode', type=click.Choice(['regional', 'field']), default='regional',
+              help="'regional': one epsilon per region, from the elbow of its KNN distances. 'field': one epsilon per owner, the median over its parcels of a KNN distance field smoothed over the county (no regions, no region borders). Default is regional.")
+@click.option('-cs', '--cell-size', type=int, default=100,
+              help="Grid cell size of the 'field' KNN mode. Default is 100.")
+@click.option('-sr', '--smoothing-radius', type=int, default=500,
+              help="Half width of the window the 'field' KNN distances are averaged over. Default is 500.")
+@click.option('-local', '--local-upload', type=click.BOOL, default=False,
+              help="Saves build to local build directory. Default is False.")
+@click.option('-bq', '--bq-upload', type=click.BOOL, default=True,
+                help="Uploads to BigQueryTable. Default is True.")
+@click.option('-stage', '--stage-upload', type=click.BOOL, default=False,
+              help="Stages results locally and issues one BigQuery load per output table at the end of the run. Default is False.")
+@click.option('-smb', '--stage-flush-mb', type=int, default=None,
+              help="Flushes a staged output table to BigQuery once it exceeds this many MB. Default is None (flush at end of run).")
+@click.option('--incremental', is_flag=True, default=False,
+              help="Diffs each county against its previous output (by sp_id and content hash) and uploads only the inserted, changed and deleted superparcels in one merge. Cannot be combined with -stage. Default is False.")
+@click.option('-ut', '--upload-threads', type=int, default=2,
+              help="Number of background BigQuery upload threads. Default is 2.")
+@click.option('-p', '--processes', type=int, default=10,
+              help="Worker pool size, the maximum number of concurrent place tasks. Ignored with --daemon. Default is 10.")
+@click.option('-bd', '--build-dir', type=click.Path(), default=None,
+              help="Directory where you want the build to occur. If not provided, will use the build directory from config.json.",
+              required=False)
+@click.option('--resume', is_flag=True, default=False,
+              help="Resumes the last run in the build directory, skipping counties completed in its manifest. Default is False.")
+@click.option('-qa', is_flag=True, default=False,
+              help="Profiles each task with cProfile. Writes a .pstats file per place and per FIPS and a merged hot-function report to the build's analysis directory. Default is False.")
+@click.option('-report', '--run-report', is_flag=True, default=False,
+              help="Records wall time, CPU time, peak memory and row counts per pipeline stage. Writes a run_report.json to the build's analysis directory and prints a summary. Default is False.")
+@click.option('-tm', '--trace-memory', is_flag=True, default=False,
+              help="Adds tracemalloc peaks per stage to the run report (slower). Default is False.")
+@click.option('--backend', type=click.Choice(['bigquery', 'local']), default=None,
+              help="Reads input from and writes output to BigQuery or local Parquet tables under LOCAL_DATA_DIR. If not provided, uses BACKEND from config.json (default bigquery).")
+@click.option('--refresh', is_flag=True, default=False,
+              help="With --daemon, pulls the counties again instead of using the daemon's county cache. Default is False.")
+@click.option('-so', '--spatial-order', type=click.Choice(['hilbert', 'morton']), default=None,
+              help="Sorts each county's parcels along a Hilbert or Morton curve through their bounding box centers at ingest, before any clustering, and keeps the curve key in a spatial_key column. Default is None (input order).")
+@click.option('-pb', type=click.Path(exists=True), default=None,
+              help="Path to Place Boundaries Shapefile (NAME field for place names). Parcels outside every place are clustered with --rural-dist. If not provided, each county is one place.")
+@click.pass_context
+def spadaptive(ctx, **params):
+    run_command(ctx, 'spadaptive', params)
+
+
+def run_command(ctx, cmd, params):
+    """
+    Runs a build command in this process, or submits it to the 'sps serve'
+    daemon with 'sps build --daemon'.
+    """
+    if ctx.obj.get("DAEMON"):
+        from sp_cli.daemon import submit
+
+        # the daemon runs in its own working directory
+        for path in ('build_dir', 'pb'):
+            if params[path]:
+                params[path] = os.path.abspath(params[path])
+        request = {
+            'cmd': cmd,
+            'config_path': str(ctx.obj["CONFIG"]),
+            'version': ctx.obj["VERSION"],
+            'verbose': ctx.obj["VERBOSE"],
+            'params': params,
+        }
+        try:
+            submit(request)
+        except (ConnectionError, RuntimeError) as e:
+            raise click.ClickException(str(e))
+        return
+
+    # Attempt to load configuration from file (if provided via ctx)
+    if os.path.exists(ctx.obj["CONFIG"]):
+        with open(ctx.obj["CONFIG"], "r") as config_file:
+            config = json.load(config_file)
+    else:
+        logger.error('Cannot find config.json!!!')
+        config = {}
+
+    BUILD_COMMANDS[cmd](config, ctx.obj["VERSION"], **params)
+
+
+def run_spfixed(
+    config,
+    version,
+    dist_thres=(200,),
+    owner_cache=False,
+    owner_cache_mb=2048,
+    neighbor_graph=False,
+    neighbor_max_dist=500,
+    rural_dt=None,
+    **params
+):
+    """
+    Runs a SuperParcel Phase 1 build with the 'sps build spfixed' options.
+    See run_build for the options shared by every build.
+    """
+    options = {
+        'dist_thres': dist_thres,
+        'owner_cache': owner_cache,
+        'owner_cache_mb': owner_cache_mb,
+        'neighbor_graph': neighbor_graph,
+        'neighbor_max_dist': neighbor_max_dist,
+        'rural_dt': rural_dt,
+    }
+    return run_build('spfixed', config, version, options, **params)
+
+
+def run_spadaptive(
+    config,
+    version,
+    max_parcels_per_region=200,
+    kneighbors=3,
+    smoothing_window=0.5,
+    min_urban_dist=15,
+    max_urban_dist=120,
+    rural_dist=200,
+    knn_mode='regional',
+    cell_size=100,
+    smoothing_radius=500,
+    processes=10,
+    **params
+):
+    """
+    Runs a SuperParcel Phase 2 (adaptive epsilon) build with the
+    'sps build spadaptive' options. 'processes' sizes the worker pool
+    when no 'session' pool is given.
+    See run_build for the options shared by every build.
+    """
+    options = {
+        'adaptive': {
+            'max_parcels_per_region': max_parcels_per_region,
+            'kneighbors': kneighbors,
+            'smoothing_window': smoothing_window,
+            'min_urban_distance': min_urban_dist,
+            'max_urban_distance': max_urban_dist,
+            'rural_distance': rural_dist,
+            'knn_mode': knn_mode,
+            'cell_size': cell_size,
+            'smoothing_radius': smoothing_radius,
+        },
+        'processes': processes,
+    }
+    return run_build('spadaptive', config, version, options, **params)
+
+
+def run_build(
+    product,
+    config,
+    version,
+    options,
+    fips=None,
+    sample_size=3,
+    area_threshold=None,
+    local_upload=False,
+    bq_upload=True,
+    stage_upload=False,
+    stage_flush_mb=None,
+    incremental=False,
+    upload_threads=2,
+    build_dir=None,
+    resume=False,
+    qa=False,
+    run_report=False,
+    trace_memory=False,
+    backend=None,
+    refresh=False,
+    pb=None,
+    spatial_order=None,
+    session=None,
+):
+    """
+    Runs a SuperParcel build of 'product' ('spfixed' or 'spadaptive') with
+    the options of its 'sps build' command; 'options' holds the ones
+    specific to the product (see run_spfixed and run_spadaptive).
+    'config' is the loaded config.json. 'session' is the WarmSession of
+    'sps serve' (pool, clients and county cache to reuse), or None to
+    start everything for this build.
+    Returns the run manifest summary and the run report path.
+    """
+    import pandas as pd
     from sp_cli.helper import (
         check_paths, 
         sql_query,
         bigquery_to_gdf,
         build_sp_args,
+        build_sp_adaptive_args,
+        process_adaptive_batch,
+        process_place_batch,
+        flush_staged_results,
+        delete_partial_outputs,
+        write_profile_report,
+        write_run_report,
+        candidate_fields,
     )
     from sp_cli.sp_build import build_sp_fixed
+    from sp_geoprocessing.utils import compact_dtypes
+    from sp_geoprocessing.ordering import spatial_sort
+    from sp_cli.manifest import RunManifest, recover_staging
+    from bigq.uploader import Uploader
+    from bigq.backend import set_backend
     
     click.echo("_________________________________________________________")
-    logger.info("BUILDING SuperParcel Fixed Epsilon Phase 1")
+    if product == 'spadaptive':
+        logger.info("BUILDING SuperParcel Adaptive Epsilon Phase 2")
+    else:
+        logger.info("BUILDING SuperParcel Fixed Epsilon Phase 1")
     click.echo("-")
     click.echo("-")
 
-   
-    # Attempt to load configuration from file (if provided via ctx)
-    if os.path.exists(ctx.obj["CONFIG"]):
-        with open(ctx.obj["CONFIG"], "r") as config_file:
-            config = json.load(config_file)
-    else:
-        logger.error('Cannot find config.json!!!')
-        
     timestamp = datetime.now(timezone.utc).replace(second=0, microsecond=0)
-    version = ctx.obj["VERSION"]
 
     logger.debug(f"Timestamp: {timestamp}")
     logger.debug(f"Version: {version}")
+
+    if incremental and stage_upload:
+        raise click.ClickException("--incremental merges each county on its own and cannot be combined with -stage.")
  
 
 
@@ -168,6 +416,26 @@ def spfixed(ctx, fips, dist_thres, sample_size, area_threshold, local_upload, bq
     os.makedirs(bd, exist_ok=True)
     check_paths(bd)
 
+    # RUN MANIFEST: task status for --resume
+    manifest = RunManifest(os.path.join(bd, "manifest.sqlite"))
+    run_timestamp = manifest.get_run_value("timestamp")
+    if resume and run_timestamp:
+        # resumed tasks share the original run's timestamp
+        timestamp = datetime.fromisoformat(run_timestamp)
+        logger.info(f"Resuming run from {timestamp}: {manifest.summary()}")
+    else:
+        if resume:
+            logger.info("No previous run found in manifest. Starting a new run.")
+            resume = False
+        manifest.reset()
+        manifest.set_run_value("timestamp", timestamp.isoformat())
+    checkpoint_root = os.path.join(bd, "checkpoints")
+    owner_cache_path = None
+    neighbor_graph_dir = None
+    if product == 'spfixed':
+        owner_cache_path = os.path.join(bd, "cache", "owner_cache.sqlite") if options['owner_cache'] else None
+        neighbor_graph_dir = os.path.join(bd, "neighbors") if options['neighbor_graph'] else None
+
     try:
         fips = fips or config.get("FIPS_LIST", [])
         input_dir = os.makedirs(os.path.join(bd, "inputs"), exist_ok=True) or config.get("INPUT_DIR")
@@ -180,39 +448,89 @@ def spfixed(ctx, fips, dist_thres, sample_size, area_threshold, local_upload, bq
     bq_output_path = f"{config.get('GCP_PROJECT')}.{config.get('GCP_OUTPUT_DATASET')}"
     json_key = config.get("GCP_JSON")
 
+    # BACKEND: BigQuery or local Parquet tables. Set for the whole process
+    # tree so pool workers and upload threads use the same backend.
+    backend = backend or config.get("BACKEND", "bigquery")
+    local_data_dir = config.get("LOCAL_DATA_DIR") or os.path.join(bd, "local_tables")
+    set_backend(backend, local_data_dir)
+    logger.info(f"Backend: {backend}" + (f" ({local_data_dir})" if backend == "local" else ""))
+
     logger.debug(f"BigQuery Input Path: {bq_input_path}")
     logger.debug(f"BigQuery Output Path: {bq_output_path}")
     logger.debug(f"JSON Key: {json_key}")
-    # Process Place Boundaries if provided (future implementation)
+
+    stage_dir = os.path.join(bd, "staging") if bq_upload and stage_upload else None
+    logger.debug(f"Staging Directory: {stage_dir}")
+    if stage_dir and not resume and os.path.isdir(stage_dir):
+        # results staged by an abandoned run belong to that run
+        logger.info(f"Clearing staged results of a previous run: {stage_dir}")
+        shutil.rmtree(stage_dir)
+    # Process Place Boundaries if provided
+    places = None
     if pb:
-        logger.info("Running with Place Boundaries (feature not yet implemented).")
-        # TODO: Implement processing with place boundaries.
+        import geopandas as gpd
+        from sp_geoprocessing.places import PlaceIndex
 
+        check_paths(pb)
+        # projected and prepared once per UTM zone for all counties
+        places = PlaceIndex(gpd.read_file(pb))
+        logger.info(f"Place Boundaries: {len(places)} places from {pb}")
 
-    # CANDIDATE SQL QUERY
-    query = sql_query(
-        path=bq_input_path,
-        fips_list=fips
-    )
-    logger.debug(f"SQL Query: {query}")
 
-    try:
+    bq = session.client(json_key, backend, local_data_dir) if session else None
+
+    def pull_candidates(fips_list):
+        # CANDIDATE SQL QUERY
+        query = sql_query(
+            path=bq_input_path,
+            fips_list=fips_list
+        )
+        logger.debug(f"SQL Query: {query}")
+
         candidate_gdf = bigquery_to_gdf(
             json_key=json_key,
-            sql_query=query
+            sql_query=query,
+            bq=bq
+        )
+        if candidate_gdf is None:
+            raise click.ClickException(f"Failed to pull candidate parcels from {backend}.")
+        # owner and FIPS as categorical codes, smaller in memory and in every pickled task
+        owner_field, fips_field, _ = candidate_fields(candidate_gdf)
+        candidate_gdf = compact_dtypes(
+            candidate_gdf,
+            category_fields=[f for f in (owner_field, fips_field) if f is not None]
         )
+        if spatial_order:
+            # one curve per county: county subsets keep the curve order
+            candidate_gdf = spatial_sort(candidate_gdf, spatial_order, group_field=fips_field)
+        return candidate_gdf
+
+    county_gdfs = None
+    try:
+        if session and fips:
+            # warm counties come projected from the daemon's cache
+            source = (backend, local_data_dir if backend == "local" else None, bq_input_path, spatial_order)
+            county_gdfs = session.counties.get(source, fips, pull_candidates, refresh=refresh)
+            if not county_gdfs:
+                raise click.ClickException(f"No candidate parcels found for FIPS {fips}.")
+            candidate_gdf = next(iter(county_gdfs.values()))
+        else:
+            candidate_gdf = pull_candidates(fips)
 
         if local_upload: # write input to input_dir
             input_path = os.path.join(input_dir, 'candidate_input.shp')
-            candidate_gdf.to_file(input_path, driver='ESRI Shapefile')
+            input_gdf = candidate_gdf
+            if county_gdfs:
+                input_gdf = pd.concat([gdf.to_crs(epsg=4326) for gdf in county_gdfs.values()])
+            input_gdf.to_file(input_path, driver='ESRI Shapefile')
+    except click.ClickException:
+        raise
     except Exception as e:
         raise logger.error(f"Failed to pull data from BigQuery: {e}")
 
 
     # get KEY OWNER & FIPS PUID FIELD
-    owner_field = next((col for col in candidate_gdf.columns if 'owner' in col.lower()), None)
-    fips_field = next((col for col in candidate_gdf.columns if 'fips' in col.lower()), None)
-    puid_field = next((col for col in candidate_gdf.columns if 'puid' in col.lower()), None)
+    owner_field, fips_field, puid_field = candidate_fields(candidate_gdf)
     logger.debug(f"Owner Field: {owner_field}")
     logger.debug(f"FIPS Field: {fips_field}")
     logger.debug(f"PUID Field: {puid_field}")
@@ -233,26 +551,68 @@ def spfixed(ctx, fips, dist_thres, sample_size, area_threshold, local_upload, bq
     logger.debug(f"FIPS Field: {fips_field}")
 
     # list of tuples for each arg combination
-    sp_args = build_sp_args(
-        candidate_gdf=candidate_gdf,
-        fips_field=fips_field, # arg 1
-        owner_field=owner_field, # arg 2
-        dist_thres=dist_thres, # arg 3
-        sample_size=sample_size, # arg 4
-        area_threshold=area_threshold, # arg 5
-        timestamp=timestamp, # arg 6
-        version=version, # arg 7
-        bq_output_dir=bq_output_path, # arg 8
-        local_output_dir=local_output_dir, # arg 9
-        bq_upload=bq_upload, # arg 10
-        local_upload=local_upload, # arg 11
-        json_key=json_key # arg 12
-    )
+    if product == 'spadaptive':
+        sp_args = build_sp_adaptive_args(
+            candidate_gdf=candidate_gdf,
+            fips_field=fips_field, # arg 1
+            owner_field=owner_field, # arg 2
+            sample_size=sample_size, # arg 3
+            area_threshold=area_threshold, # arg 4
+            adaptive=options['adaptive'], # arg 5
+            timestamp=timestamp, # arg 6
+            version=version, # arg 7
+            bq_output_dir=bq_output_path, # arg 8
+            local_output_dir=local_output_dir, # arg 9
+            bq_upload=bq_upload, # arg 10
+            local_upload=local_upload, # arg 11
+            json_key=json_key, # arg 12
+            stage_dir=stage_dir, # arg 13
+            stage_flush_mb=stage_flush_mb, # arg 14
+            places=places, # arg 16
+            resume_manifest=manifest if resume else None,
+            county_gdfs=county_gdfs,
+            puid_field=puid_field, # arg 17
+            incremental=incremental # arg 18
+        )
+    else:
+        sp_args = build_sp_args(
+            candidate_gdf=candidate_gdf,
+            fips_field=fips_field, # arg 1
+            owner_field=owner_field, # arg 2
+            dist_thres=options['dist_thres'], # arg 3
+            sample_size=sample_size, # arg 4
+            area_threshold=area_threshold, # arg 5
+            timestamp=timestamp, # arg 6
+            version=version, # arg 7
+            bq_output_dir=bq_output_path, # arg 8
+            local_output_dir=local_output_dir, # arg 9
+            bq_upload=bq_upload, # arg 10
+            local_upload=local_upload, # arg 11
+            json_key=json_key, # arg 12
+            stage_dir=stage_dir, # arg 13
+            stage_flush_mb=stage_flush_mb, # arg 14
+            checkpoint_root=checkpoint_root, # arg 16
+            resume_manifest=manifest if resume else None,
+            county_gdfs=county_gdfs,
+            puid_field=puid_field, # arg 17
+            incremental=incremental, # arg 18
+            owner_cache=owner_cache_path, # arg 19
+            owner_cache_mb=options['owner_cache_mb'], # arg 20
+            neighbor_graph_dir=neighbor_graph_dir, # arg 21
+            neighbor_max_distance=options['neighbor_max_dist'], # arg 22
+            places=places, # arg 23
+            rural_dt=options['rural_dt'] # arg 24
+        )
 
-    logger.debug(f"SP Args Example Tuple: {sp_args[0]}")
+    if sp_args:
+        logger.debug(f"SP Args Example Tuple: {sp_args[0]}")
     logger.info(f"Number of SuperParcel Iterations: {len(sp_args)}")
 
-    batch_size = min(len(sp_args), 10)  # Set batch size to 10 or the number of args, whichever is smaller
+    batch_size = max(min(len(sp_args), 10), 1)  # Set batch size to 10 or the number of args, whichever is smaller
+    if product == 'spadaptive':
+        batch_size = options['processes'] # places run as separate tasks
+    elif places is not None:
+        batch_size = 10 # places run as separate tasks
     logger.info(f'Running {batch_size} concurrent processes')
   
     # RUN SUPERPARCEL BUILD
@@ -261,17 +621,118 @@ def spfixed(ctx, fips, dist_thres, sample_size, area_threshold, local_upload, bq
     logger.info(f'STARTING SUPERPARCEL BUILD')
     click.echo("-")
     click.echo("-")
-    process_batch(build_sp_fixed, sp_args, pool_size=batch_size)
+    uploader = None
+    if bq_upload:
+        try:
+            uploader = Uploader(json_key, n_threads=upload_threads, bq=bq)
+        except Exception as e:
+            raise click.ClickException(f"Failed to start {backend} uploader: {e}")
+
+    profile_dir = None
+    if qa:
+        profile_dir = os.path.join(bd, "analysis", "profiles", timestamp.strftime("%Y%m%dT%H%M"))
+        os.makedirs(profile_dir, exist_ok=True)
+        logger.info(f"Profiling enabled. Writing profiles to {profile_dir}")
+
+    report_dir = None
+    if run_report:
+        report_dir = os.path.join(bd, "analysis", "reports", timestamp.strftime("%Y%m%dT%H%M"))
+        os.makedirs(os.path.join(report_dir, "tasks"), exist_ok=True)
+        logger.info(f"Stage reporting enabled. Writing reports to {report_dir}")
+
+    if resume:
+        if stage_dir:
+            recover_staging(stage_dir)
+        if uploader:
+            delete_partial_outputs(uploader.bq, manifest, timestamp)
 
+    try:
+        if product == 'spadaptive':
+            process_adaptive_batch(
+                sp_args,
+                pool_size=batch_size,
+                uploader=uploader,
+                manifest=manifest,
+                profile_dir=profile_dir,
+                report_dir=report_dir and os.path.join(report_dir, "tasks"),
+                trace_memory=trace_memory,
+                pool=session and session.pool
+            )
+        elif places is not None:
+            process_place_batch(
+                sp_args,
+                pool_size=batch_size,
+                uploader=uploader,
+                manifest=manifest,
+                profile_dir=profile_dir,
+                report_dir=report_dir and os.path.join(report_dir, "tasks"),
+                trace_memory=trace_memory,
+                pool=session and session.pool
+            )
+        else:
+            process_batch(
+                build_sp_fixed,
+                sp_args,
+                pool_size=batch_size,
+                uploader=uploader,
+                manifest=manifest,
+                profile_dir=profile_dir,
+                report_dir=report_dir and os.path.join(report_dir, "tasks"),
+                trace_memory=trace_memory,
+                pool=session and session.pool
+            )
+
+        if profile_dir:
+            report_path = write_profile_report(
+                profile_dir,
+                os.path.join(profile_dir, "profile_report.txt")
+            )
+            logger.info(f"Profile report: {report_path}")
+
+        if stage_dir:
+            logger.info('Loading staged results to BigQuery...')
+            flush_staged_results(
+                json_key=json_key,
+                staging_dir=stage_dir,
+                bq_output_dir=bq_output_path,
+                uploader=uploader,
+                manifest=manifest
+            )
+    finally:
+        upload_summary = None
+        if uploader:
+            logger.info('Waiting for BigQuery uploads to finish...')
+            upload_summary = uploader.close()
+        summary = manifest.summary()
+        logger.info(f"Run manifest: {summary}")
+        manifest.close()
+
+    report_path = None
+    if report_dir:
+        report_path, table = write_run_report(
+            report_dir,
+            os.path.join(report_dir, "run_report.json"),
+            upload_summary=upload_summary
+        )
+        click.echo(table)
+        logger.info(f"Run report: {report_path}")
     
     logger.info("BUILD COMPLETE.")
     click.echo("_________________________________________________________")
+    return {'manifest': summary, 'run_report': report_path}
+
+# build function of each 'sps build' command (see run_command and the daemon)
+BUILD_COMMANDS = {
+    'spfixed': run_spfixed,
+    'spadaptive': run_spadaptive,
+}
 
 @click.command(
     help="Build Exploratory Analysis for Distance Thresholds. IN-DEVELOPMENT"
 )
 @click.pass_context
 def dt_analysis(ctx):
+    import pandas as pd
     from sp_geoprocessing.analysis import dt_owner_counts, dt_overlap
     
     click.echo("-")
@@ -348,3 +809,90 @@ def dt_analysis(ctx):
 
 
          
+
+@click.command(
+    help="Generates synthetic candidate-parcel counties (GeoParquet) for reproducible load testing and benchmarking."
+)
+@click.option('-fips', default=None, multiple=True, type=str,
+              help="FIPS code(s) of the synthetic counties. Comma-seperated. No Spaces. Default is 06075.",
+              callback=parse_to_str_list)
+@click.option('-n', '--n-parcels', type=int, default=10_000,
+              help="Parcels per county before stacked duplicates are added. Default is 10000.")
+@click.option('-seed', type=int, default=0,
+              help="Random seed. The same options and seed always give the same output. Default is 0.")
+@click.option('-urban', '--urban-share', type=float, default=0.7,
+              help="Share of parcels on the dense urban grid; the rest are sparse rural lots. Default is 0.7.")
+@click.option('-zipf', '--zipf-a', type=float, default=2.0,
+              help="Zipf exponent of owner sizes. Default is 2.0.")
+@click.option('-mega', '--mega-owner-share', type=float, default=0.05,
+              help="Share of parcels held by county-wide mega-owners. Default is 0.05.")
+@click.option('-dup', '--duplicate-rate', type=float, default=0.01,
+              help="Share of parcels stacked 2-5 times with new PUIDs. Default is 0.01.")
+@click.option('-inv', '--invalid-rate', type=float, default=0.002,
+              help="Share of parcels replaced by self-intersecting shapes. Default is 0.002.")
+@click.option('-vh', '--vertex-heavy-rate', type=float, default=0.005,
+              help="Share of parcels replaced by ~400-vertex shapes. Default is 0.005.")
+@click.option('-o', '--output', type=click.Path(), default=None,
+              help="Output GeoParquet path. If not provided, writes to the build directory's inputs folder.")
+@click.pass_context
+def synth(ctx, fips, n_parcels, seed, urban_share, zipf_a, mega_owner_share, duplicate_rate, invalid_rate, vertex_heavy_rate, output):
+    from sp_geoprocessing.synth import synth_counties
+
+    click.echo("_________________________________________________________")
+    logger.info("BUILDING Synthetic Candidate Parcels")
+
+    fips = fips or ['06075']
+    if not output:
+        config = load_config(ctx.obj["CONFIG"])
+        bd = config.get("BUILD_DIR")
+        if not bd:
+            raise click.ClickException("Output path must be provided as an argument (-o) or a build directory in the config file.")
+        output = os.path.join(bd, "inputs", f"synth_{'_'.join(fips)}_n{n_parcels}_s{seed}.parquet")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+
+    gdf = synth_counties(
+        fips,
+        n_parcels,
+        seed=seed,
+        urban_share=urban_share,
+        zipf_a=zipf_a,
+        mega_owner_share=mega_owner_share,
+        duplicate_rate=duplicate_rate,
+        invalid_rate=invalid_rate,
+        vertex_heavy_rate=vertex_heavy_rate,
+    )
+    gdf.to_parquet(output, index=False)
+
+    logger.info(f"Parcels: {len(gdf)}  Owners: {gdf['OWNER'].nunique()}  Counties: {len(fips)}")
+    logger.info(f"Written to {output}")
+    click.echo("_________________________________________________________")
+
+
+@click.command(
+    help="Runs a local build daemon that keeps a warm worker pool, authenticated clients and recently built counties in memory. Submit builds to it with 'sps build --daemon'."
+)
+@click.option('--socket', 'socket_path', type=click.Path(), default=None,
+              help="Unix socket to listen on. Default is $SPS_SOCKET or sps.sock next to config.json.")
+@click.option('-p', '--processes', type=int, default=10,
+              help="Worker pool size, the maximum number of concurrent tasks. Default is 10.")
+@click.option('-cc', '--cache-counties', type=int, default=8,
+              help="Number of projected counties kept in memory between builds. Default is 8.")
+@click.option('--status', is_flag=True, default=False,
+              help="Prints the running daemon's pool and cache status and exits.")
+@click.option('--stop', is_flag=True, default=False,
+              help="Stops the running daemon.")
+@click.pass_context
+def serve(ctx, socket_path, processes, cache_counties, status, stop):
+    from sp_cli.daemon import serve as run_daemon, submit
+
+    if status or stop:
+        try:
+            result = submit({'cmd': 'stop' if stop else 'status'}, socket_path)
+        except (ConnectionError, RuntimeError) as e:
+            raise click.ClickException(str(e))
+        click.echo(json.dumps(result, indent=2))
+        return
+
+    if ctx.obj["VERBOSE"]:
+        logger.setLevel(logging.DEBUG)
+    run_daemon(socket_path, processes=processes, max_counties=cache_counties)
@@ -0,0 +1,156 @@
+import numpy as np
+from math import ceil
+import pandas as pd
+import shapely
+import logging
+from sp_geoprocessing.cluster import build_place_regions
+from sp_geoprocessing.tools import build_coords
+from sp_geoprocessing.knn import calculate_regional_knn_distance, calculate_knn_density_field, merge_small_clusters
+
+logger = logging.getLogger(__name__)
+
+# Defaults of the phase 2 (adaptive epsilon) analysis
+MAX_PARCELS_PER_REGION = 200 # parcels per region of a place
+KNEIGHBORS = 3 # nearest neighbors of the regional KNN distance
+SMOOTHING_WINDOW = 0.5 # share of a region's KNN distances in the moving average
+MIN_URBAN_DISTANCE = 15
+MAX_URBAN_DISTANCE = 120 # largest distance at which singles join, and clusters merge, within a place
+RURAL_DISTANCE = 200 # fixed epsilon outside places
+
+# 'regional': one epsilon per region. 'field': one per owner, from
+# a smoothed KNN distance field over the county (see parcel_distances).
+KNN_MODES = ('regional', 'field')
+CELL_SIZE = 100 # grid cell of the KNN distance field
+SMOOTHING_RADIUS = 500 # half width of the field's smoothing window
+
+""" Adaptive-epsilon clustering: regions and regional distances """
+
+def place_regions(parcels, max_parcels_per_region=MAX_PARCELS_PER_REGION, kneighbors=KNEIGHBORS):
+    """
+    Splits a place's parcels into regions of about
+    'max_parcels_per_region' parcels (see cluster.build_place_regions).
+    Regions of fewer than kneighbors + 1 parcels are merged into the
+    nearest region (see knn.merge_small_clusters).
+    Returns the region of every parcel.
+    """
+    regions, centroids = build_place_regions(parcels, max_parcels_per_region)
+    if regions.max() > 0:
+        regions = merge_small_clusters(regions, centroids, kneighbors + 1)
+    return np.asarray(regions)
+
+
+def region_distance(
+        parcels,
+        kneighbors=KNEIGHBORS,
+        smoothing_window=SMOOTHING_WINDOW,
+        min_distance=MIN_URBAN_DISTANCE,
+        max_distance=MAX_URBAN_DISTANCE
+    ):
+    """
+    DBSCAN epsilon of a region: the elbow of its parcels' smoothed KNN
+    distances (see knn.calculate_regional_knn_distance), rounded up and
+    kept between 'min_distance' and 'max_distance', so sparse regions of a
+    place are not clustered and buffered at rural distances.
+    """
+    distance = calculate_regional_knn_distance(
+        coords=np.array(build_coords(parcels)),
+        kneighbors=kneighbors,
+        smoothing_window=smoothing_window,
+        min_distance=min_distance,
+        max_distance=max_distance
+    )
+    return min(max(ceil(distance), min_distance), max_distance)
+
+
+def parcel_distances(
+        parcels,
+        kneighbors=KNEIGHBORS,
+        cell_size=CELL_SIZE,
+        smoothing_radius=SMOOTHING_RADIUS,
+        min_distance=MIN_URBAN_DISTANCE,
+        max_distance=MAX_URBAN_DISTANCE
+    ):
+    """
+    Local DBSCAN epsilon of every parcel of a county ('field' mode): its
+    kth nearest neighbor distance smoothed over 'smoothing_radius' (see
+    knn.calculate_knn_density_field). Returns an array aligned with 'parcels'.
+    """
+    coords = shapely.get_coordinates(shapely.centroid(parcels.geometry.to_numpy()))
+    return calculate_knn_density_field(
+        coords, kneighbors, cell_size, smoothing_radius, min_distance, max_distance
+    )
+
+
+def owner_distances(parcels, key_field, distance_field='local_eps'):
+    """
+    DBSCAN epsilon of every owner of a place in 'field' mode: the median
+    local epsilon of its parcels (see parcel_distances), rounded up.
+    Returns a Series indexed by owner.
+    """
+    distances = parcels.groupby(key_field, sort=False, observed=True)[distance_field].median()
+    return np.ceil(distances).astype(np.int64)
+
+
+def attach_singles(clustered, singles, key_field, max_distance=MAX_URBAN_DISTANCE):
+    """
+    Adds each single parcel (of an owner with too few parcels, or DBSCAN
+    noise) to the cluster of the nearest clustered parcel of the same owner
+    within 'max_distance'. An attached single takes the attributes of that
+    parcel, except its geometry and puid. Singles without one are dropped.
+
+    All singles are matched with one STRtree.query_nearest call. Every
+    owner's parcels are shifted along x by a multiple of the county width
+    (see offset_by_owner), so the nearest parcel within 'max_distance' is
+    always one of the same owner. On ties the first clustered parcel wins.
+    Singles attach to the clusters as given, not to other attached singles.
+
+    Returns the clustered parcels with the attached singles appended.
+    """
+    if len(clustered) == 0 or len(singles) == 0:
+        return clustered
+
+    owners = pd.Index(clustered[key_field].astype(object).unique())
+    cluster_owners = owners.get_indexer(clustered[key_field].astype(object))
+    single_owners = owners.get_indexer(singles[key_field].astype(object))
+    candidates = np.flatnonzero(single_owners >= 0) # singles of owners with clusters
+    if len(candidates) == 0:
+        return clustered
+    cluster_geoms = clustered.geometry.to_numpy()
+    single_geoms = singles.geometry.to_numpy()
+
+    bounds = shapely.total_bounds(np.concatenate([cluster_geoms, single_geoms[candidates]]))
+    tree = shapely.STRtree(offset_by_owner(cluster_geoms, cluster_owners, bounds, max_distance))
+    single_rows, cluster_rows = tree.query_nearest(
+        offset_by_owner(single_geoms[candidates], single_owners[candidates], bounds, max_distance),
+        max_distance=max_distance,
+        all_matches=True
+    )
+    if len(single_rows) == 0:
+        return clustered
+
+    # equidistant matches: the first clustered parcel
+    order = np.lexsort((cluster_rows, single_rows))
+    first = np.ones(len(order), dtype=bool)
+    first[1:] = single_rows[order][1:] != single_rows[order][:-1]
+    attached = candidates[single_rows[order][first]]
+    nearest = cluster_rows[order][first]
+    logger.info(f'Attached {len(attached)} of {len(singles)} single parcels to clusters')
+
+    joined = clustered.take(nearest).reset_index(drop=True)
+    joined['puid'] = singles['puid'].to_numpy()[attached]
+    joined[clustered.geometry.name] = single_geoms[attached]
+    return pd.concat([clustered, joined], ignore_index=True)
+
+
+def offset_by_owner(geoms, owners, bounds, max_distance):
+    """
+    Copies of 'geoms' moved to the origin of 'bounds' and shifted along x
+    by their owner code times a spacing wider than 'bounds' plus twice
+    'max_distance'. Distances between parcels of one owner are unchanged;
+    parcels of different owners end up further than 'max_distance' apart.
+    """
+    spacing = bounds[2] - bounds[0] + 2 * max_distance + 1
+    coords, index = shapely.get_coordinates(geoms, return_index=True)
+    coords[:, 0] += owners[index] * spacing - bounds[0]
+    coords[:, 1] -= bounds[1]
+    return shapely.set_coordinates(np.array(geoms, dtype=object), coords)
@@ -1,10 +1,14 @@
 import numpy as np
-from sklearn.cluster import DBSCAN, KMeans
+import shapely
 from shapely.ops import nearest_points
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Near-exact duplicate geometries are compared with their coordinates
+# rounded to this grid (CRS units, meters once projected).
+DUPLICATE_GRID_SIZE = 0.01
+
 """ Functions for DBSCAN clustering """
 
 def polygon_distance(polygon1, polygon2):
@@ -39,51 +43,126 @@ def build_multistep_owner_clusters(df, min_samples, eps):
     else:
         return build_dbscan_clusters(distance_matrix, min_samples, eps)
 
-def build_owner_clusters(df, min_samples, eps):
+def build_owner_clusters(df, min_samples, eps, collapse_duplicates=True, grid_size=DUPLICATE_GRID_SIZE):
     """
     Builds clusters for a same-owner parcels within a region.
     DBSCAN is used to cluster parcels based on their distance
-    using the calculated regional optimal distance. 
+    using the calculated regional optimal distance.
+
+    With 'collapse_duplicates', stacked parcels (condos, timeshares) with
+    the same geometry are clustered once, as a representative weighted by
+    its count, and the labels are expanded back to every parcel. DBSCAN
+    counts the weights towards min_samples, so the labels are unchanged.
     """
     polygons = df.geometry.to_list()
 
+    if len(polygons) < 3: # only two parcels
+        ##print('Only two parcels in region. No clustering performed.')
+        dbscan = np.array([]) # no clustering
+        return dbscan
+
+    weights = None
+    if collapse_duplicates:
+        representatives, groups, counts = collapse_duplicate_geoms(polygons, grid_size)
+        if len(representatives) < len(polygons):
+            polygons = [polygons[i] for i in representatives]
+            weights = counts
+
     distance_matrix = compute_distance_matrix(polygons)
 
     if np.all(distance_matrix == 0): # if all adjacent parcels (i.e. zero-distances), then set distance to 1
         eps = 1
 
-    if distance_matrix.shape[0] < 3: # only two parcels
-        ##print('Only two parcels in region. No clustering performed.')
-        dbscan = np.array([]) # no clustering
-        return dbscan
-    else:
-        return build_dbscan_clusters(distance_matrix, min_samples, eps)
+    labels = build_dbscan_clusters(distance_matrix, min_samples, eps, sample_weight=weights)
+    if weights is not None:
+        labels = labels[groups]
+    return labels
+
+def collapse_duplicate_geoms(polygons, grid_size=DUPLICATE_GRID_SIZE):
+    """
+    Groups exact and near-exact duplicate geometries. Geometries are
+    normalized (same vertex order and orientation) and, if grid_size is
+    set, their coordinates rounded to that grid before their WKB is compared.
+    Returns the index of each group's representative (its first geometry),
+    the group of every input geometry and the group sizes.
+    """
+    geoms = shapely.normalize(np.asarray(polygons, dtype=object))
+    if grid_size:
+        geoms = shapely.set_precision(geoms, grid_size, mode='pointwise')
+    _, first, inverse, counts = np.unique(
+        shapely.to_wkb(geoms), return_index=True, return_inverse=True, return_counts=True
+    )
+
+    # number the groups in order of first occurrence, so DBSCAN visits the
+    # representatives in input order and numbers the clusters the same way
+    order = np.argsort(first)
+    group = np.empty_like(order)
+    group[order] = np.arange(len(order))
+    return first[order], group[inverse.ravel()], counts[order]
+
+def build_dbscan_clusters(dmatrix, min_samples, eps, sample_weight=None):
+    from sklearn.cluster import DBSCAN # imported on use, sklearn is slow to import
 
-def build_dbscan_clusters(dmatrix, min_samples, eps):
     dbscan = DBSCAN(eps=eps, min_samples=min_samples, metric='precomputed')
-    return dbscan.fit_predict(dmatrix)
+    return dbscan.fit_predict(dmatrix, sample_weight=sample_weight)
 
 
 
-""" Functions for KMeans clustering """
+""" Functions for region partitioning """
 def build_place_regions(df, max_parcels_per_cluster):
     """
-    Assigns each parcel to a region based on Kmeans clustering.
-    Returns a list of region assignments.
+    Assigns each parcel to a region of about 'max_parcels_per_cluster'
+    parcels by recursive coordinate bisection of the parcel centroids
+    (see build_bisection_regions).
+    Returns the region of every parcel and the centroid of every region.
     """
 
-    # number of clustrs is proportional to the number of parcels
+    # number of regions is proportional to the number of parcels
     if len(df) < max_parcels_per_cluster:
         nclusters = 1
     else:    
         nclusters = len(df) // max_parcels_per_cluster
     
-    coords = build_coords(df)
+    coords = shapely.get_coordinates(shapely.centroid(df.geometry.to_numpy()))
 
-    labels, centroids = build_kmeans_clusters(nclusters, coords)
+    labels, centroids = build_bisection_regions(nclusters, coords)
+    return labels, centroids
+
+def build_bisection_regions(n_regions, coords):
+    """
+    Splits points into 'n_regions' regions of near-equal size, a
+    deterministic stand-in for KMeans. The points of k regions are cut at
+    the (k // 2) / k quantile of their wider coordinate extent, and both
+    sides are split again for k // 2 and k - k // 2 regions.
+    O(n log n_regions).
+    Returns the region of every point (0 to n_regions - 1) and the mean
+    coordinates of every region.
+    """
+    coords = np.asarray(coords, dtype=np.float64).reshape(-1, 2)
+    labels = np.zeros(len(coords), dtype=np.int64)
+    stack = [(np.arange(len(coords)), n_regions, 0)] # rows, regions, first label
+    while stack:
+        rows, k, first = stack.pop()
+        if k <= 1 or len(rows) <= 1:
+            labels[rows] = first
+            continue
+        points = coords[rows]
+        axis = int(np.ptp(points, axis=0).argmax())
+        k_left = k // 2
+        cut = len(rows) * k_left // k
+        order = np.argpartition(points[:, axis], cut)
+        stack.append((rows[order[:cut]], k_left, first))
+        stack.append((rows[order[cut:]], k - k_left, first + k_left))
+
+    # regions left empty by tiny inputs are dropped from the numbering
+    _, labels = np.unique(labels, return_inverse=True)
+    counts = np.bincount(labels)
+    centroids = np.column_stack([np.bincount(labels, weights=coords[:, axis]) / counts for axis in (0, 1)])
     return labels, centroids
 
 def build_kmeans_clusters(n_clusters, coords):
+    from sklearn.cluster import KMeans
+
     kmeans = KMeans(n_clusters=n_clusters, random_state=42)
     labels = kmeans.fit_predict(coords)  
     centroids = kmeans.cluster_centers_
@@ -1,7 +1,4 @@
 import numpy as np
-from scipy.spatial import cKDTree
-from scipy.ndimage import uniform_filter1d
-from scipy.spatial.distance import cdist
 from math import ceil
 import logging
 
@@ -38,6 +35,8 @@ def build_knn_distances(coords, k):
     Returns a 2d array where each row is a parcel and each column 
     is the distance to itself then 1st, 2nd, ..., kth nearest neighbor.
     """
+    from scipy.spatial import cKDTree # scipy is imported on use
+
     dtree = cKDTree(coords) # KDTree for nearest neighbor
 
     # distances between each parcel and its 1 to kth nearest neighbor
@@ -59,6 +58,8 @@ def smooth_distances(distances, window):
     Smooths distances to reduce noise and make the elbow more apparent.
     Window is size of moving average. 
     """
+    from scipy.ndimage import uniform_filter1d
+
     return uniform_filter1d(distances, size=ceil(window * len(distances)))
 
 def build_difference(distances):
@@ -86,28 +87,86 @@ def calculate_knn_optimal_distance(distances, diff_array):
     
     return knn_dist
 
-def merge_small_clusters(labels, centroids, min_cluster_size):
+def calculate_knn_density_field(
+            coords,
+            kneighbors,
+            cell_size,
+            smoothing_radius,
+            min_distance,
+            max_distance,
+            max_cells=4_000_000
+        ):
     """
-    Merges small clusters into larger clusters.
-    Returns the new cluster labels.
+    Calculates a local DBSCAN distance for every point, a continuous
+    alternative to one distance per region (calculate_regional_knn_distance)
+    without a partition into regions or jumps at region borders.
+
+    The kth nearest neighbor distance of every point comes from one KD-tree
+    query over all points on all cores. The distances are averaged on a grid
+    of 'cell_size' cells, over the square window of 'smoothing_radius'
+    around the cell of each point, then rounded up and kept between
+    min_distance and max_distance. Cells grow past 'cell_size' if the
+    extent needs more than 'max_cells' of them.
+    O(n log n) in the points, O(n) for the smoothing.
     """
+    from scipy.spatial import cKDTree # scipy is imported on use
 
-    # Step 1: Identify Small Clusters
-    cluster_sizes = np.bincount(labels)
-    
-    small_clusters = np.where(cluster_sizes < min_cluster_size)[0]
+    coords = np.asarray(coords, dtype=np.float64)
+    if len(coords) <= kneighbors:
+        return np.full(len(coords), float(max_distance))
 
-    # Step 2: Merge Small Clusters
-    for small_cluster in small_clusters:
-        small_cluster_indices = np.where(labels == small_cluster)[0]
-        small_cluster_centroid = centroids[small_cluster]
+    kth_distances, _ = cKDTree(coords).query(coords, k=[kneighbors + 1], workers=-1) # +1 for itself
+    kth_distances = np.nan_to_num(kth_distances[:, 0], posinf=max_distance)
 
-        # Find the nearest larger cluster
-        other_clusters = [i for i in range(len(centroids)) if i != small_cluster]
-        distances = cdist([small_cluster_centroid], centroids[other_clusters], metric='euclidean')
-        nearest_cluster = other_clusters[np.argmin(distances)]
+    origin = coords.min(axis=0)
+    extent = coords.max(axis=0) - origin
+    cell_size = max(cell_size, np.sqrt(extent[0] * extent[1] / max_cells))
+    radius = ceil(smoothing_radius / cell_size)
+    cells = ((coords - origin) // cell_size).astype(np.int64)
+    shape = tuple(cells.max(axis=0) + 1)
 
-        # Reassign small cluster points to the nearest cluster
-        labels[small_cluster_indices] = nearest_cluster
-    
-    return labels
\ No newline at end of file
+    flat = np.ravel_multi_index((cells[:, 0], cells[:, 1]), shape)
+    sums = np.bincount(flat, weights=kth_distances, minlength=shape[0] * shape[1]).reshape(shape)
+    counts = np.bincount(flat, minlength=shape[0] * shape[1]).reshape(shape)
+    smoothed = window_sums(sums, cells, radius) / window_sums(counts, cells, radius)
+    return np.clip(np.ceil(smoothed), min_distance, max_distance)
+
+def window_sums(grid, cells, radius):
+    """
+    Sums of 'grid' over the (2 radius + 1) x (2 radius + 1) window around
+    each of 'cells' (row, column pairs), clipped at the grid edges. Read
+    from the integral image of the grid, so the window size is free.
+    """
+    integral = np.zeros((grid.shape[0] + 1, grid.shape[1] + 1))
+    integral[1:, 1:] = grid.cumsum(axis=0).cumsum(axis=1)
+    i0 = np.clip(cells[:, 0] - radius, 0, grid.shape[0])
+    i1 = np.clip(cells[:, 0] + radius + 1, 0, grid.shape[0])
+    j0 = np.clip(cells[:, 1] - radius, 0, grid.shape[1])
+    j1 = np.clip(cells[:, 1] + radius + 1, 0, grid.shape[1])
+    return integral[i1, j1] - integral[i0, j1] - integral[i1, j0] + integral[i0, j0]
+
+def merge_small_clusters(labels, centroids, min_cluster_size):
+    """
+    Merges every cluster of fewer than 'min_cluster_size' points into the
+    cluster with the nearest centroid among the larger ones, with one
+    KD-tree query for all of them. If no cluster is large enough, all
+    are merged into the largest.
+    Returns the new cluster labels.
+    """
+    from scipy.spatial import cKDTree
+
+    labels = np.asarray(labels)
+    centroids = np.asarray(centroids)
+    cluster_sizes = np.bincount(labels, minlength=len(centroids))
+    small = cluster_sizes < min_cluster_size
+    if not small.any():
+        return labels
+
+    large = np.flatnonzero(~small)
+    target = np.arange(len(cluster_sizes))
+    if len(large) == 0:
+        target[:] = cluster_sizes.argmax()
+    else:
+        _, nearest = cKDTree(centroids[large]).query(centroids[small])
+        target[small] = large[nearest]
+    return target[labels]
@@ -0,0 +1,252 @@
+import os
+import json
+import shutil
+import uuid
+import numpy as np
+import shapely
+import logging
+from sp_geoprocessing.cluster import DUPLICATE_GRID_SIZE
+
+logger = logging.getLogger(__name__)
+
+# Bump when the stored arrays change, so older graphs are built again
+GRAPH_VERSION = 2
+# Margin of the shapely.distance preselection of pairs (see NeighborGraph.build)
+DISTANCE_SLACK = 1e-6
+GRAPH_ARRAYS = ('indptr', 'indices', 'distances', 'duplicates')
+
+""" Persistent same-owner neighbor graph """
+
+class NeighborGraph:
+    def __init__(self, indptr, indices, distances, duplicates, max_distance):
+        """
+        Neighbor graph of a county's parcels: every pair of parcels of the
+        same owner within 'max_distance' of each other, with their exact
+        polygon distance (as cluster.polygon_distance computes it), in CSR form. The neighbors of parcel i (a row
+        position) are indices[indptr[i]:indptr[i + 1]], sorted, at
+        distances[indptr[i]:indptr[i + 1]].
+
+        'duplicates' numbers the exact and near-exact duplicate geometries
+        of the county (see cluster.collapse_duplicate_geoms), so stacked
+        parcels are collapsed without GEOS at clustering time.
+
+        Clustering at any eps up to 'max_distance' reads the graph instead
+        of computing an owner's distance matrix (see owner_clusters).
+        """
+        self.indptr = indptr
+        self.indices = indices
+        self.distances = distances
+        self.duplicates = duplicates
+        self.max_distance = max_distance
+
+    @property
+    def n_edges(self) -> int:
+        return int(self.indptr[-1])
+
+    @classmethod
+    def build(cls, geoms, owners, max_distance, min_parcels=3, grid_size=DUPLICATE_GRID_SIZE, chunk_size=2_000):
+        """
+        Builds the graph with one STRtree over the county. Candidate pairs
+        come from bounding boxes grown by 'max_distance', pairs of different
+        owners are dropped before the exact distances are computed.
+
+        Parameters
+        ----------
+        geoms : array of shapely geometries
+            Parcel geometries in a projected CRS.
+        owners : array of int
+            Owner code of every parcel (-1 for none).
+        max_distance : float
+            Largest distance kept, i.e. the largest eps the graph serves.
+        min_parcels : int
+            Owners with fewer parcels are never clustered and get no edges.
+        grid_size : float
+            Grid for the near-exact duplicate comparison.
+        chunk_size : int
+            Parcels queried at once, to bound the memory of candidate pairs.
+        """
+        geoms = np.asarray(geoms, dtype=object)
+        owners = np.asarray(owners)
+        n = len(geoms)
+
+        n_parcels = np.bincount(owners[owners >= 0], minlength=owners.max() + 1 if n else 0)
+        owners = np.where((owners >= 0) & (n_parcels[np.maximum(owners, 0)] >= min_parcels), owners, -1)
+
+        tree = shapely.STRtree(geoms)
+        bounds = shapely.bounds(geoms)
+        sources, targets, distances = [], [], []
+        for start in range(0, n, chunk_size):
+            chunk = slice(start, start + chunk_size)
+            boxes = shapely.box(
+                bounds[chunk, 0] - max_distance, bounds[chunk, 1] - max_distance,
+                bounds[chunk, 2] + max_distance, bounds[chunk, 3] + max_distance
+            )
+            i, j = tree.query(boxes)
+            i += start
+            # each pair once, same owner only
+            same = (i < j) & (owners[i] >= 0) & (owners[i] == owners[j])
+            i, j = i[same], j[same]
+            # shapely.distance can differ from polygon_distance in the last
+            # bits, which decides pairs at exactly eps. It only preselects;
+            # the stored distance is the length of the nearest points' line,
+            # the same float as cluster.polygon_distance.
+            near = shapely.distance(geoms[i], geoms[j]) <= max_distance + DISTANCE_SLACK
+            i, j = i[near], j[near]
+            d = shapely.length(shapely.shortest_line(geoms[i], geoms[j]))
+            near = d <= max_distance
+            sources.append(i[near])
+            targets.append(j[near])
+            distances.append(d[near])
+
+        i = np.concatenate(sources + targets) if n else np.array([], dtype=np.int64)
+        j = np.concatenate(targets + sources) if n else np.array([], dtype=np.int64)
+        d = np.concatenate(distances * 2) if n else np.array([], dtype=np.float64)
+        order = np.lexsort((j, i))
+        indptr = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(np.bincount(i, minlength=n), out=indptr[1:])
+
+        return cls(
+            indptr,
+            j[order].astype(np.int32),
+            d[order].astype(np.float64),
+            duplicate_ids(geoms, grid_size),
+            max_distance,
+        )
+
+    def save(self, path: str):
+        """
+        Writes the arrays as .npy files to a temporary directory renamed to
+        'path', so readers never see a partial graph. If another process
+        saved the same graph first, its copy is kept.
+        """
+        tmp_path = f'{path}.{uuid.uuid4().hex[:8]}.tmp'
+        os.makedirs(tmp_path)
+        for name in GRAPH_ARRAYS:
+            np.save(os.path.join(tmp_path, f'{name}.npy'), getattr(self, name))
+        with open(os.path.join(tmp_path, 'graph.json'), 'w') as f:
+            json.dump({'version': GRAPH_VERSION, 'max_distance': self.max_distance, 'edges': self.n_edges}, f)
+        try:
+            os.rename(tmp_path, path)
+        except OSError: # saved by a concurrent task
+            shutil.rmtree(tmp_path, ignore_errors=True)
+
+    @classmethod
+    def load(cls, path: str):
+        """Opens a saved graph with its arrays memory-mapped. Returns None if there is none."""
+        meta_path = os.path.join(path, 'graph.json')
+        if not os.path.exists(meta_path):
+            return None
+        with open(meta_path) as f:
+            meta = json.load(f)
+        if meta.get('version') != GRAPH_VERSION:
+            return None
+        arrays = [np.load(os.path.join(path, f'{name}.npy'), mmap_mode='r') for name in GRAPH_ARRAYS]
+        return cls(*arrays, meta['max_distance'])
+
+    def owner_clusters(self, rows, min_samples, eps):
+        """
+        DBSCAN labels of one owner's parcels ('rows', their row positions),
+        as build_owner_clusters returns them, from the graph edges within
+        'eps'. Duplicate geometries are clustered once, weighted by their count.
+        """
+        if eps > self.max_distance:
+            raise ValueError(f'eps {eps} is over the graph distance {self.max_distance}')
+        rows = np.asarray(rows)
+        if len(rows) < 3: # only two parcels
+            return np.array([])
+
+        # representatives in order of first occurrence (see collapse_duplicate_geoms)
+        _, first, inverse, counts = np.unique(
+            self.duplicates[rows], return_index=True, return_inverse=True, return_counts=True
+        )
+        order = np.argsort(first)
+        group = np.empty_like(order)
+        group[order] = np.arange(len(order))
+        representatives = rows[first[order]]
+        weights = counts[order] if len(representatives) < len(rows) else None
+
+        # pairs of representatives within eps
+        starts = np.asarray(self.indptr[representatives])
+        lengths = np.asarray(self.indptr[representatives + 1]) - starts
+        edges = np.arange(lengths.sum()) + np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+        source = np.repeat(np.arange(len(representatives)), lengths)
+        neighbors = np.asarray(self.indices[edges])
+        distances = np.asarray(self.distances[edges])
+
+        sorter = np.argsort(representatives)
+        target = np.searchsorted(representatives, neighbors, sorter=sorter)
+        target = sorter[np.minimum(target, len(sorter) - 1)]
+        keep = (representatives[target] == neighbors) & (distances <= eps)
+
+        m = len(representatives)
+        labels = graph_dbscan(source[keep], target[keep], m, min_samples, sample_weight=weights)
+        return labels[group[inverse.ravel()]]
+
+
+def graph_dbscan(source, target, n, min_samples, sample_weight=None):
+    """
+    DBSCAN labels of 'n' points from the pairs within eps ('source' ->
+    'target', both directions, without self pairs), the same labels as
+    sklearn's DBSCAN(metric='precomputed') without its per-call overhead.
+
+    A point is core if the weight of its neighborhood (itself included) is
+    at least 'min_samples'. Connected core points form a cluster, numbered
+    in order of their first core point. A border point joins the
+    lowest-numbered cluster among its core neighbors, the first that
+    DBSCAN's expansion reaches. Other points are noise (-1).
+    """
+    from scipy import sparse
+    from scipy.sparse.csgraph import connected_components
+
+    weights = np.ones(n) if sample_weight is None else np.asarray(sample_weight, dtype=np.float64)
+    core = weights + np.bincount(source, weights=weights[target], minlength=n) >= min_samples
+    labels = np.full(n, -1, dtype=np.int64)
+    if not core.any():
+        return labels
+
+    core_pairs = core[source] & core[target]
+    graph = sparse.csr_matrix(
+        (np.ones(int(core_pairs.sum())), (source[core_pairs], target[core_pairs])), shape=(n, n)
+    )
+    _, component = connected_components(graph, directed=False)
+    cores = np.flatnonzero(core)
+    components, first = np.unique(component[cores], return_index=True)
+    cluster = np.empty(component.max() + 1, dtype=np.int64)
+    cluster[components] = np.argsort(np.argsort(first))
+    labels[cores] = cluster[component[cores]]
+
+    border = core[target] & ~core[source]
+    if border.any():
+        joined = np.full(n, n, dtype=np.int64)
+        np.minimum.at(joined, source[border], labels[target[border]])
+        labels[joined < n] = joined[joined < n]
+    return labels
+
+
+def duplicate_ids(geoms, grid_size=DUPLICATE_GRID_SIZE):
+    """
+    Id of every geometry such that exact and near-exact duplicates share
+    one, compared as in cluster.collapse_duplicate_geoms.
+    """
+    geoms = shapely.normalize(np.asarray(geoms, dtype=object))
+    if grid_size:
+        geoms = shapely.set_precision(geoms, grid_size, mode='pointwise')
+    _, inverse = np.unique(shapely.to_wkb(geoms), return_inverse=True)
+    return inverse.ravel().astype(np.int64)
+
+
+def load_or_build_graph(path, geoms, owners, max_distance):
+    """
+    The neighbor graph saved at 'path', or a new one built and saved there.
+    'path' identifies the county snapshot (see sp_build.build_sp_fixed).
+    """
+    graph = NeighborGraph.load(path)
+    if graph is not None:
+        logger.info(f'Loaded neighbor graph: {path} ({graph.n_edges} edges)')
+        return graph
+
+    logger.info(f'Building neighbor graph within {max_distance}: {path}')
+    graph = NeighborGraph.build(geoms, owners, max_distance)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    graph.save(path)
+    return NeighborGraph.load(path) or graph
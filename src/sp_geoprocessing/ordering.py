@@ -0,0 +1,109 @@
+import numpy as np
+import pandas as pd
+import shapely
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Space-filling curves of spatial_sort
+CURVES = ('hilbert', 'morton')
+CURVE_ORDER = 16 # bits per axis: a grid of 2**16 x 2**16 cells per county
+SPATIAL_KEY_FIELD = 'spatial_key'
+
+""" Spatial ordering of parcels by Hilbert or Morton keys """
+
+def grid_cells(coords, bounds, order=CURVE_ORDER):
+    """
+    Integer grid cells (x, y) in [0, 2**order) of 'coords' (n x 2) within
+    'bounds' (minx, miny, maxx, maxy), one for all rows or one row per
+    coordinate. Coordinates outside 'bounds' are clipped to the grid.
+    """
+    bounds = np.nan_to_num(np.asarray(bounds, dtype=np.float64))
+    side = (1 << order) - 1
+    lower = bounds[..., :2]
+    span = bounds[..., 2:] - lower
+    scale = np.divide(side, span, out=np.zeros_like(span), where=span > 0)
+    cells = np.floor((coords - lower) * scale)
+    return np.clip(cells, 0, side).astype(np.int64)
+
+
+def hilbert_keys(x, y, order=CURVE_ORDER):
+    """
+    Distance along a Hilbert curve of grid cells 'x', 'y' in [0, 2**order),
+    one bit level of the whole array per iteration. The quadrant rotations
+    are XOR masks: n - 1 - x is x ^ (n - 1) on the grid.
+    """
+    x = np.array(x, dtype=np.uint32)
+    y = np.array(y, dtype=np.uint32)
+    keys = np.zeros(len(x), dtype=np.int64)
+    side = np.uint32((1 << order) - 1)
+    for level in range(order - 1, -1, -1):
+        rx = (x >> np.uint32(level)) & np.uint32(1)
+        ry = (y >> np.uint32(level)) & np.uint32(1)
+        keys += ((rx * np.uint32(3)) ^ ry).astype(np.int64) << (2 * level)
+        # rotate the quadrant so the curve continues into the next level:
+        # flip where rx and not ry, then swap x and y where not ry
+        swap = ry - np.uint32(1) # all ones where ry is 0
+        flip = (rx * side) & swap
+        x ^= flip
+        y ^= flip
+        t = (x ^ y) & swap
+        x ^= t
+        y ^= t
+    return keys
+
+
+def morton_keys(x, y, order=CURVE_ORDER):
+    """
+    Z-order (Morton) keys of grid cells 'x', 'y' in [0, 2**order),
+    order <= 16: the bits of x and y interleaved.
+    """
+    def spread(v):
+        v = np.asarray(v, dtype=np.uint64)
+        for shift, mask in ((8, 0x00FF00FF), (4, 0x0F0F0F0F), (2, 0x33333333), (1, 0x55555555)):
+            v = (v | (v << np.uint64(shift))) & np.uint64(mask)
+        return v
+
+    return (spread(x) | (spread(y) << np.uint64(1))).astype(np.int64)
+
+
+def spatial_keys(coords, bounds, curve='hilbert', order=CURVE_ORDER):
+    """
+    Space-filling curve keys of 'coords' (n x 2) on a 2**order grid over
+    'bounds' (see grid_cells). Rows with NaN coordinates (empty
+    geometries) get the largest key, so they sort last.
+    """
+    if curve not in CURVES:
+        raise ValueError(f"Unknown curve '{curve}'. Expected one of {CURVES}.")
+    coords = np.asarray(coords, dtype=np.float64)
+    missing = np.isnan(coords).any(axis=1)
+    cells = grid_cells(np.nan_to_num(coords), bounds, order)
+    keys = (hilbert_keys if curve == 'hilbert' else morton_keys)(cells[:, 0], cells[:, 1], order)
+    keys[missing] = (1 << (2 * order)) - 1
+    return keys
+
+
+def spatial_sort(gdf, curve='hilbert', group_field=None, key_field=SPATIAL_KEY_FIELD, order=CURVE_ORDER):
+    """
+    Sorts parcels along a Hilbert or Morton curve through the centers of
+    their bounding boxes (cheaper than centroids, as local), so neighboring
+    parcels are neighboring rows. The curve spans the bounds of each
+    'group_field' value (e.g. each county), or of all parcels. The key is kept in 'key_field' for partitioning and row
+    groups downstream. Row order within a group (a county subset of the
+    result) follows the key; ties keep their input order.
+    """
+    boxes = shapely.bounds(gdf.geometry.to_numpy()) # NaN for empty geometries
+    xy = pd.DataFrame((boxes[:, :2] + boxes[:, 2:]) / 2, columns=['x', 'y'])
+    if group_field is None:
+        bounds = [xy['x'].min(), xy['y'].min(), xy['x'].max(), xy['y'].max()]
+    else:
+        groups = xy.groupby(gdf[group_field].to_numpy(), sort=False)
+        bounds = np.column_stack([
+            groups['x'].transform('min'), groups['y'].transform('min'),
+            groups['x'].transform('max'), groups['y'].transform('max'),
+        ])
+    coords = xy.to_numpy()
+    keys = spatial_keys(coords, bounds, curve, order)
+    logger.info(f'Sorted {len(gdf)} parcels along a {curve} curve')
+    rows = np.argsort(keys, kind='stable')
+    return gdf.assign(**{key_field: keys}).take(rows)
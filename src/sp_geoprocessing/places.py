@@ -0,0 +1,90 @@
+import hashlib
+import numpy as np
+import pandas as pd
+import shapely
+import logging
+
+logger = logging.getLogger(__name__)
+
+# place_id of the parcels outside every place. Places are numbered from 1.
+RURAL_PLACE_ID = 0
+
+""" Place boundaries and the assignment of parcels to places """
+
+class PlaceIndex:
+    def __init__(self, places, name_field='NAME'):
+        """
+        Place boundaries of a build, numbered from 1 in row order. Place
+        names are read from 'name_field' (empty if missing).
+
+        The place geometries are projected to the CRS of the parcels they
+        are assigned, prepared, and kept per CRS, so the counties of a
+        build (or of the 'sps serve' daemon) in one UTM zone project and
+        prepare the places once.
+        """
+        self.places = places.reset_index(drop=True)
+        names = (
+            self.places[name_field].astype(str) if name_field in self.places
+            else pd.Series('', index=self.places.index)
+        )
+        names.index = names.index + 1
+        self.names = names
+        self._projected = {}
+
+    def __len__(self) -> int:
+        return len(self.places)
+
+    @property
+    def digest(self) -> str:
+        """Short content hash of the place boundaries, part of the task hash of place builds."""
+        wkb = b''.join(shapely.to_wkb(self.places.geometry.to_numpy()))
+        return hashlib.sha256(wkb).hexdigest()[:12]
+
+    def projected(self, crs):
+        """Prepared place geometries in 'crs', projected on first use."""
+        geoms = self._projected.get(crs)
+        if geoms is None:
+            places = self.places
+            if crs is not None and places.crs is not None:
+                places = places.to_crs(crs)
+            geoms = places.geometry.to_numpy()
+            shapely.prepare(geoms)
+            self._projected[crs] = geoms
+        return geoms
+
+    def assign(self, parcels):
+        """
+        Returns the place_id of every parcel (a Series aligned with
+        'parcels'): the place that contains it, or the first of them where
+        places overlap. Parcels outside every place, or across a place
+        boundary, get RURAL_PLACE_ID.
+
+        One query of a tree of the parcels with the prepared place
+        geometries replaces a within() scan of the county per place.
+        """
+        place_geoms = self.projected(parcels.crs)
+        place_rows, parcel_rows = shapely.STRtree(parcels.geometry.to_numpy()).query(
+            place_geoms, predicate='contains'
+        )
+        first = np.full(len(parcels), len(place_geoms), dtype=np.int64)
+        np.minimum.at(first, parcel_rows, place_rows)
+        place_ids = np.where(first < len(place_geoms), first + 1, RURAL_PLACE_ID)
+        return pd.Series(place_ids, index=parcels.index, dtype=np.int64)
+
+    def split(self, parcels):
+        """
+        Splits 'parcels' by place (see assign). Returns (place_id,
+        place_name, parcels) per place with parcels, in place order, with
+        the parcels outside every place last as RURAL_PLACE_ID.
+        """
+        place_ids = self.assign(parcels)
+        place_rows = place_ids.groupby(place_ids.to_numpy()).indices
+        order = sorted(place_rows, key=lambda place_id: (place_id == RURAL_PLACE_ID, place_id))
+        logger.info(
+            f'{len(parcels)} parcels in {len(order)} places '
+            f'({len(place_rows.get(RURAL_PLACE_ID, []))} outside places)'
+        )
+        return [
+            (int(place_id), self.names.get(place_id, ''), parcels.take(place_rows[place_id]))
+            for place_id in order
+        ]
@@ -0,0 +1,167 @@
+import os
+import json
+import time
+import tracemalloc
+from contextlib import contextmanager
+import logging
+
+try:
+    import resource # not available on Windows
+except ImportError:
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+""" Lightweight per-stage timing and memory instrumentation """
+
+class StageRecorder:
+    """
+    Records wall time, CPU time, peak memory and row counts per pipeline stage.
+    Repeated stages (e.g. clustering once per owner) are aggregated by name.
+
+    Usage:
+        with recorder.stage('dissolve', rows_in=len(df)) as rec:
+            sp = df.dissolve(by='cluster_ID')
+            rec['rows_out'] = len(sp)
+    """
+    enabled = True
+
+    def __init__(self, trace_memory=False):
+        self.trace_memory = trace_memory
+        self.stages = {}
+        self._open = [] # traced peaks of the enclosing stages
+        if trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    @contextmanager
+    def stage(self, name, rows_in=None):
+        rec = {'rows_out': None}
+        if self.trace_memory:
+            # resetting the peak would lose it for enclosing stages, so fold it in first
+            self._fold_peak()
+            tracemalloc.reset_peak()
+            self._open.append(0)
+        wall = time.perf_counter()
+        cpu = time.process_time()
+        try:
+            yield rec
+        finally:
+            wall = time.perf_counter() - wall
+            cpu = time.process_time() - cpu
+            traced = None
+            if self.trace_memory:
+                self._fold_peak()
+                traced = self._open.pop()
+            self._add(name, wall, cpu, rows_in, rec['rows_out'], traced)
+
+    def _fold_peak(self):
+        peak = tracemalloc.get_traced_memory()[1]
+        self._open = [max(p, peak) for p in self._open]
+
+    def _add(self, name, wall, cpu, rows_in, rows_out, traced=None):
+        s = self.stages.setdefault(name, {
+            'calls': 0,
+            'wall_s': 0.0,
+            'cpu_s': 0.0,
+            'rows_in': 0,
+            'rows_out': 0,
+            'peak_rss_mb': 0.0,
+            'peak_traced_mb': None,
+        })
+        s['calls'] += 1
+        s['wall_s'] += wall
+        s['cpu_s'] += cpu
+        s['rows_in'] += rows_in or 0
+        s['rows_out'] += rows_out or 0
+        s['peak_rss_mb'] = max(s['peak_rss_mb'], peak_rss_mb())
+        if traced is not None:
+            s['peak_traced_mb'] = max(s['peak_traced_mb'] or 0.0, traced / 1024 ** 2)
+
+    def to_dict(self, **meta):
+        return {**meta, 'stages': self.stages}
+
+    def write(self, path, **meta):
+        """Writes the recorded stages (plus any metadata) to a JSON file."""
+        with open(path, 'w') as f:
+            json.dump(self.to_dict(**meta), f, indent=2, default=str)
+
+
+class NullRecorder:
+    """Disabled recorder. stage() costs one method call and records nothing."""
+    enabled = False
+    stages = {}
+
+    class _NullStage:
+        def __enter__(self):
+            return {}
+
+        def __exit__(self, *exc):
+            return False
+
+    _null_stage = _NullStage()
+
+    def stage(self, name, rows_in=None):
+        return self._null_stage
+
+    def to_dict(self, **meta):
+        return {**meta, 'stages': {}}
+
+    def write(self, path, **meta):
+        pass
+
+NULL_RECORDER = NullRecorder()
+
+
+def peak_rss_mb():
+    """Process peak resident set size in MB (0 where unavailable)."""
+    if resource is None:
+        return 0.0
+    # ru_maxrss is KB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def aggregate_reports(report_dir):
+    """
+    Aggregates the per-task stage reports in 'report_dir' into one run report.
+    Times and row counts are summed over tasks; peak memory is the maximum.
+    """
+    tasks = []
+    for fn in sorted(os.listdir(report_dir)):
+        if fn.endswith('.json'):
+            with open(os.path.join(report_dir, fn)) as f:
+                tasks.append(json.load(f))
+
+    totals = {}
+    for task in tasks:
+        for name, s in task['stages'].items():
+            t = totals.setdefault(name, {
+                'tasks': 0,
+                'calls': 0,
+                'wall_s': 0.0,
+                'cpu_s': 0.0,
+                'rows_in': 0,
+                'rows_out': 0,
+                'peak_rss_mb': 0.0,
+                'peak_traced_mb': None,
+            })
+            t['tasks'] += 1
+            for key in ('calls', 'wall_s', 'cpu_s', 'rows_in', 'rows_out'):
+                t[key] += s[key]
+            t['peak_rss_mb'] = max(t['peak_rss_mb'], s['peak_rss_mb'])
+            if s['peak_traced_mb'] is not None:
+                t['peak_traced_mb'] = max(t['peak_traced_mb'] or 0.0, s['peak_traced_mb'])
+
+    return {'tasks': tasks, 'totals': totals}
+
+
+def format_stage_table(totals):
+    """Formats aggregated stage totals as a text table sorted by wall time."""
+    header = f"{'stage':<22}{'calls':>9}{'wall s':>10}{'cpu s':>10}{'rows in':>12}{'rows out':>12}{'peak MB':>10}"
+    lines = [header, '-' * len(header)]
+    for name, t in sorted(totals.items(), key=lambda x: -x[1]['wall_s']):
+        peak = t['peak_traced_mb'] if t['peak_traced_mb'] is not None else t['peak_rss_mb']
+        lines.append(
+            f"{name:<22}{t['calls']:>9}{t['wall_s']:>10.2f}{t['cpu_s']:>10.2f}"
+            f"{t['rows_in']:>12}{t['rows_out']:>12}{peak:>10.1f}"
+        )
+    return '\n'.join(lines)
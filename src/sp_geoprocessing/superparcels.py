@@ -1,22 +1,35 @@
 import numpy as np
+import pandas as pd
 import geopandas as gpd
+import shapely
 from shapely.geometry import Polygon
 import hashlib
 import logging
+from sp_geoprocessing.stages import NULL_RECORDER
 
 logger = logging.getLogger(__name__)
 
-def build_superparcels(df, buffer, dissolve_by='cluster_ID', area_threshold=None):
+def build_superparcels(df, buffer, dissolve_by='cluster_ID', area_threshold=None, recorder=NULL_RECORDER):
     """
     Dissolves clusters into super-parcels.
     Returns a GeoDataFrame with super-parcels.
+    'buffer' is the distance of the closing buffer, or the name of the
+    field holding each cluster's distance (e.g. the regional knn_dist).
+    Clusters whose total parcel area is below 'area_threshold' are dropped
+    before the dissolve (see filter_area).
+    'recorder' (StageRecorder) times the dissolve and buffer stages.
     """
+    if area_threshold:
+        df = filter_area(df, area_threshold, dissolve_by=dissolve_by)
+
     #logger.info('Calculating mitre limit...')
     #df['mitre'] = df['geometry'].apply(compute_mitre_limit)
 
     #mitre_max = df.groupby(dissolve_by)['mitre'].max().reset_index()
 
-    sp = df.dissolve(by=dissolve_by).reset_index()
+    with recorder.stage('dissolve', rows_in=len(df)) as rec:
+        sp = df.dissolve(by=dissolve_by).reset_index()
+        rec['rows_out'] = len(sp)
 
     #sp['max_mitre'] = sp[dissolve_by].map(mitre_max.set_index(dissolve_by)['mitre'])
     
@@ -27,15 +40,42 @@ def build_superparcels(df, buffer, dissolve_by='cluster_ID', area_threshold=None
     
 
     logger.info('Applying buffer...')
-    sp['geometry'] = sp.apply(lambda x: x.geometry.buffer(buffer), axis=1)
-    sp['geometry'] = sp.apply(lambda x: x.geometry.buffer(-buffer), axis=1)
-    
-    if area_threshold:
-        pass
+    with recorder.stage('buffer', rows_in=len(sp)) as rec:
+        if isinstance(buffer, str): # a distance per cluster
+            distances = sp[buffer].to_numpy(dtype=np.float64)
+            geoms = shapely.buffer(np.asarray(sp.geometry.array), distances)
+            sp['geometry'] = shapely.buffer(geoms, -distances)
+        else:
+            sp['geometry'] = sp.apply(lambda x: x.geometry.buffer(buffer), axis=1)
+            sp['geometry'] = sp.apply(lambda x: x.geometry.buffer(-buffer), axis=1)
+        rec['rows_out'] = len(sp)
 
     return sp
 
 
+def filter_area(df, area_threshold, dissolve_by='cluster_ID', area_field='p_area'):
+    """
+    Keeps the clusters whose total member-parcel area is at least
+    'area_threshold' (square meters once projected). Run it before the
+    dissolve so small clusters are never dissolved, buffered or overlap-checked.
+
+    'area_field' holds each cluster's total area on every member row (p_area,
+    summed from cluster_area in the owner loop). Without it, the totals are
+    summed from the parcel areas per 'dissolve_by'.
+    """
+    if area_field in df.columns:
+        total_area = df[area_field]
+    else:
+        total_area = df.geometry.area.groupby(df[dissolve_by]).transform('sum')
+
+    keep = (total_area >= area_threshold).to_numpy()
+    logger.info(
+        f'Area threshold {area_threshold}: kept {df.loc[keep, dissolve_by].nunique()} '
+        f'of {df[dissolve_by].nunique()} clusters'
+    )
+    return df[keep]
+
+
 def compute_mitre_limit(polygon):
     """Compute the minimum mitre limit needed to avoid truncation."""
     if isinstance(polygon, Polygon):
@@ -84,6 +124,71 @@ def hash_puids(puid_list):
     return hashlib.sha256(joined.encode()).hexdigest()[:10]
 
 
+def hash_puid_groups(puids, groups):
+    """
+    Hashes the set of PUIDs of every group at once. Each PUID is hashed
+    (integer PUIDs as integers, others as text) and the hashes of a group
+    are summed (mod 2**64), so the result depends on which parcels are in
+    the group, not on their order.
+    Returns a 16-digit hex id per group, as a Series indexed by group.
+    """
+    codes, uniques = pd.factorize(np.asarray(groups))
+    puids = pd.Series(puids)
+    if pd.api.types.is_integer_dtype(puids):
+        hashes = pd.util.hash_array(puids.to_numpy(dtype=np.int64))
+    else:
+        hashes = pd.util.hash_array(puids.astype(str).to_numpy(dtype=object))
+    sums = np.zeros(len(uniques), dtype=np.uint64)
+    np.add.at(sums, codes, hashes)
+
+    # big-endian bytes as one hex string, split into 16-digit ids
+    hex_ids = np.frombuffer(sums.astype('>u8').tobytes().hex().encode(), dtype='S16').astype(str)
+    return pd.Series(hex_ids.astype(object), index=uniques)
+
+
+def hash_rows(gdf, exclude=()):
+    """
+    Content hash (int64) of every row, over its attributes and geometry,
+    to tell changed superparcels apart between builds. Attributes are
+    hashed as text so the hash does not depend on column dtypes.
+    """
+    attrs = pd.DataFrame(gdf.drop(columns=[gdf.geometry.name, *exclude])).astype(str).astype(object)
+    attrs['wkb'] = gdf.geometry.to_wkb().to_numpy()
+    return pd.util.hash_pandas_object(attrs, index=False).astype(np.int64)
+
+
+def diff_superparcels(new, previous, key='sp_id', hash_field='sp_hash'):
+    """
+    Compares a build with the previous output of the same county and
+    distance threshold, by sp_id and content hash. Previous rows without a
+    hash (written before hashes were stored) count as changed.
+
+    Returns the new rows to write (inserted or changed), the previous
+    sp_ids missing from the build (to delete), and the number of
+    'inserted', 'changed', 'unchanged' and 'deleted' superparcels.
+    """
+    previous = previous.drop_duplicates(key)
+    if hash_field in previous:
+        old_hashes = pd.to_numeric(previous[hash_field]).astype('Int64')
+    else:
+        old_hashes = pd.Series(pd.NA, index=previous.index, dtype='Int64')
+    old_hashes.index = previous[key].to_numpy()
+
+    existing = new[key].isin(old_hashes.index)
+    unchanged = (
+        new[key].map(old_hashes).astype('Int64') == new[hash_field].astype('Int64')
+    ).fillna(False).astype(bool)
+    deleted = previous.loc[~previous[key].isin(new[key]), key]
+
+    counts = {
+        'inserted': int((~existing).sum()),
+        'changed': int((existing & ~unchanged).sum()),
+        'unchanged': int(unchanged.sum()),
+        'deleted': len(deleted),
+    }
+    return new[~unchanged], deleted.to_list(), counts
+
+
 def remove_overlap(gdf):
     sindex = gdf.sindex
     result = []
@@ -130,3 +235,67 @@ def remove_invalid_geoms(gdf, geom_type=['Polygon', 'MultiPolygon']):
 
     return clean_gdf, invalid_geoms
 
+
+def repair_invalid_geoms(gdf):
+    """
+    Repairs invalid geometries (self-intersections, bow-ties) before any
+    distance, dissolve or buffer work, so GEOS never takes its slow
+    robustness paths or throws inside a worker.
+
+    Invalid geometries are fixed with shapely.make_valid and reduced to
+    their polygonal parts. Geometries with no polygonal part left (e.g.
+    collapsed to a line) are dropped.
+
+    Args:
+        gdf (geopandas.GeoDataFrame): Candidate parcels.
+
+    Returns:
+        tuple:
+            - geopandas.GeoDataFrame: The parcels with repaired geometries, without the dropped ones.
+            - dict: Counts of 'invalid', 'repaired' and 'dropped' geometries.
+    """
+    geoms = np.asarray(gdf.geometry.array)
+    invalid = ~shapely.is_valid(geoms) & ~shapely.is_missing(geoms)
+    counts = {'invalid': int(invalid.sum()), 'repaired': 0, 'dropped': 0}
+    if not counts['invalid']:
+        return gdf, counts
+
+    # 'Self-intersection[x y]' -> 'Self-intersection'
+    reasons = pd.Series(shapely.is_valid_reason(geoms[invalid])).str.replace(r'\[.*', '', regex=True)
+    logger.info(f'Invalid geometries: {reasons.value_counts().to_dict()}')
+
+    repaired = polygonal_parts(shapely.make_valid(geoms[invalid]))
+    dropped = shapely.is_missing(repaired) | shapely.is_empty(repaired)
+    counts['repaired'] = int((~dropped).sum())
+    counts['dropped'] = int(dropped.sum())
+
+    gdf = gdf.copy()
+    gdf.loc[invalid, gdf.geometry.name] = repaired
+    if counts['dropped']:
+        drop_index = gdf.index[invalid][dropped]
+        gdf = gdf.drop(index=drop_index)
+    logger.info(f"Geometries repaired: {counts['repaired']}, dropped: {counts['dropped']}")
+    return gdf, counts
+
+def polygonal_parts(geoms):
+    """
+    Polygonal parts of each geometry as a Polygon (one part) or a
+    MultiPolygon. None where a geometry has no polygonal part.
+    """
+    # two levels: GeometryCollection -> MultiPolygon -> Polygon
+    parts, index = shapely.get_parts(geoms, return_index=True)
+    parts, sub_index = shapely.get_parts(parts, return_index=True)
+    index = index[sub_index]
+
+    polygons = shapely.get_type_id(parts) == shapely.GeometryType.POLYGON
+    polygons &= ~shapely.is_empty(parts)
+    parts, index = parts[polygons], index[polygons]
+
+    result = np.full(len(geoms), None, dtype=object)
+    if len(parts) == 0:
+        return result
+    owners, group, n_parts = np.unique(index, return_inverse=True, return_counts=True)
+    result[owners] = shapely.multipolygons(parts, indices=group)
+    single = owners[n_parts == 1]
+    result[single] = shapely.get_geometry(result[single], 0)
+    return result
@@ -0,0 +1,205 @@
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+import shapely
+import logging
+
+logger = logging.getLogger(__name__)
+
+""" Synthetic candidate-parcel counties for reproducible load testing """
+
+# Projected CRS the counties are laid out in (UTM 10N, San Francisco)
+SYNTH_EPSG = 32610
+SYNTH_ORIGIN = (550_000, 4_180_000)
+COUNTY_SPACING = 200_000 # meters between synthetic counties
+
+URBAN_LOT = 25 # meters, urban grid cell
+RURAL_LOT = 400 # meters, rural grid cell
+
+
+def synth_county(
+    n_parcels,
+    fips='06075',
+    seed=0,
+    urban_share=0.7,
+    zipf_a=2.0,
+    max_owner_parcels=500,
+    n_mega_owners=3,
+    mega_owner_share=0.05,
+    owner_scatter=0.2,
+    duplicate_rate=0.01,
+    invalid_rate=0.002,
+    vertex_heavy_rate=0.005,
+    vertex_count=400,
+    origin=SYNTH_ORIGIN,
+):
+    """
+    Generates a synthetic county of candidate parcels with the spfixed input
+    schema (FIPS, PUID, OWNER, geometry in EPSG:4326). Same arguments and
+    seed always give the same GeoDataFrame.
+
+    Args:
+    n_parcels (int): Number of parcels before stacked duplicates are added.
+    fips (str): FIPS code written to every row.
+    seed (int): Random seed.
+    urban_share (float): Share of parcels on the dense urban grid. The rest are sparse rural lots.
+    zipf_a (float): Zipf exponent of owner sizes (parcels per owner).
+    max_owner_parcels (int): Cap on a regular owner's size.
+    n_mega_owners (int): Number of owners scattered over the whole county (agencies, utilities).
+    mega_owner_share (float): Share of parcels held by the mega-owners.
+    owner_scatter (float): Share of regular-owner parcels placed away from the owner's block.
+    duplicate_rate (float): Share of parcels stacked 2-5 times (condos) with new PUIDs.
+    invalid_rate (float): Share of parcels replaced by self-intersecting (bow-tie) shapes.
+    vertex_heavy_rate (float): Share of parcels replaced by shapes with ~vertex_count vertices.
+    vertex_count (int): Vertices of the vertex-heavy parcels.
+    origin (tuple): Lower-left corner of the county in SYNTH_EPSG.
+    """
+    rng = np.random.default_rng(seed)
+
+    # LAYOUT: urban grid in the middle of a sparse rural ring
+    n_urban = int(n_parcels * urban_share)
+    n_rural = n_parcels - n_urban
+    urban = _grid_lots(rng, n_urban, URBAN_LOT, fill=(0.7, 0.95))
+    rural = _grid_lots(rng, n_rural, RURAL_LOT, fill=(0.2, 0.8), hole=urban_extent(n_urban))
+    # centre the urban grid inside the rural one
+    shift = rural_extent_offset(n_urban)
+    urban[:, :2] += shift
+    lots = np.vstack([urban, rural])
+    lots[:, :2] += origin
+
+    x, y, size = lots[:, 0], lots[:, 1], lots[:, 2]
+    geoms = shapely.box(x, y, x + size, y + size)
+
+    owners = _assign_owners(
+        rng, n_parcels, zipf_a, max_owner_parcels, n_mega_owners, mega_owner_share, owner_scatter
+    )
+
+    # VERTEX-HEAVY PARCELS: noisy circles
+    heavy = rng.random(n_parcels) < vertex_heavy_rate
+    if heavy.any():
+        geoms[heavy] = [
+            _vertex_heavy(rng, cx, cy, r, vertex_count)
+            for cx, cy, r in zip(x[heavy] + size[heavy] / 2, y[heavy] + size[heavy] / 2, size[heavy] / 2)
+        ]
+
+    # INVALID PARCELS: bow-ties
+    invalid = (rng.random(n_parcels) < invalid_rate) & ~heavy
+    if invalid.any():
+        xi, yi, si = x[invalid], y[invalid], size[invalid]
+        coords = np.stack([
+            np.column_stack([xi, yi]),
+            np.column_stack([xi + si, yi + si]),
+            np.column_stack([xi + si, yi]),
+            np.column_stack([xi, yi + si]),
+            np.column_stack([xi, yi]),
+        ], axis=1)
+        geoms[invalid] = shapely.polygons(coords)
+
+    gdf = gpd.GeoDataFrame({'OWNER': owners}, geometry=geoms, crs=SYNTH_EPSG)
+
+    # STACKED DUPLICATES: same geometry and owner, new PUID
+    stacked = np.flatnonzero(rng.random(n_parcels) < duplicate_rate)
+    if len(stacked):
+        copies = np.repeat(stacked, rng.integers(1, 5, len(stacked)))
+        gdf = pd.concat([gdf, gdf.iloc[copies]], ignore_index=True)
+
+    # rows come back from BigQuery in no particular order
+    gdf = gdf.iloc[rng.permutation(len(gdf))].reset_index(drop=True)
+    gdf.insert(0, 'FIPS', fips)
+    gdf.insert(1, 'PUID', (rng.choice(10 ** 9, len(gdf), replace=False) + 10 ** 9).astype('int64'))
+
+    logger.debug(
+        f'Synthetic county {fips}: {len(gdf)} parcels, {gdf["OWNER"].nunique()} owners, '
+        f'{len(stacked)} stacked, {invalid.sum()} invalid, {heavy.sum()} vertex-heavy'
+    )
+    return gdf.to_crs(epsg=4326)
+
+
+def synth_counties(fips_list, n_parcels, seed=0, **kwargs):
+    """
+    Generates one synthetic county per FIPS code, side by side.
+    Each county gets its own seed (seed + index) and origin.
+    """
+    counties = []
+    for i, fips in enumerate(fips_list):
+        origin = (SYNTH_ORIGIN[0], SYNTH_ORIGIN[1] + i * COUNTY_SPACING)
+        counties.append(synth_county(n_parcels, fips=fips, seed=seed + i, origin=origin, **kwargs))
+    return pd.concat(counties, ignore_index=True)
+
+
+def urban_extent(n_urban):
+    """Side length in meters of the urban grid."""
+    return int(np.ceil(np.sqrt(n_urban))) * URBAN_LOT
+
+
+def rural_extent_offset(n_urban):
+    """Offset that centres the urban grid in the hole left in the rural grid."""
+    hole_cells = int(np.ceil(urban_extent(n_urban) / RURAL_LOT))
+    return RURAL_LOT * 2 + (hole_cells * RURAL_LOT - urban_extent(n_urban)) / 2
+
+
+def _grid_lots(rng, n, cell, fill, hole=0):
+    """
+    Places n square lots on a grid of 'cell' meter cells, one lot per cell,
+    with a random size (share of the cell) and offset so lots never overlap.
+    Cells inside a central 'hole' of that many meters are left empty.
+    Returns an (n, 3) array of lower-left x, y and side length.
+    """
+    if n == 0:
+        return np.empty((0, 3))
+    hole_cells = int(np.ceil(hole / cell)) if hole else 0
+    side = int(np.ceil(np.sqrt(n + hole_cells ** 2))) + (4 if hole_cells else 0)
+    col, row = np.divmod(np.arange(side * side), side)
+    if hole_cells:
+        inside = (col >= 2) & (col < 2 + hole_cells) & (row >= 2) & (row < 2 + hole_cells)
+        col, row = col[~inside], row[~inside]
+    col, row = col[:n], row[:n]
+
+    size = cell * rng.uniform(*fill, n)
+    x = col * cell + rng.uniform(0, 1, n) * (cell - size)
+    y = row * cell + rng.uniform(0, 1, n) * (cell - size)
+    return np.column_stack([x, y, size])
+
+
+def _assign_owners(rng, n, zipf_a, max_owner_parcels, n_mega_owners, mega_owner_share, scatter):
+    """
+    Owner names for n parcels. Regular owners have Zipf-distributed sizes and
+    hold neighbouring parcels (with some scattered), mega-owners hold parcels
+    all over the county.
+    """
+    n_mega = int(n * mega_owner_share) if n_mega_owners else 0
+    n_regular = n - n_mega
+
+    # regular owner sizes until all parcels are owned
+    sizes = []
+    total = 0
+    while total < n_regular:
+        batch = np.minimum(rng.zipf(zipf_a, max(n_regular // 2, 16)), max_owner_parcels)
+        sizes.append(batch)
+        total += batch.sum()
+    sizes = np.concatenate(sizes)
+    sizes = sizes[:np.searchsorted(np.cumsum(sizes), n_regular) + 1]
+    regular = np.repeat(np.arange(len(sizes)), sizes)[:n_regular]
+
+    # lots are in grid order, so consecutive parcels are neighbours; scatter some
+    moved = np.flatnonzero(rng.random(n_regular) < scatter)
+    regular[moved] = regular[rng.permutation(moved)]
+
+    regular_names = np.array([f'SYNTH OWNER {o:07d}' for o in regular], dtype=object)
+    if not n_mega:
+        return regular_names
+
+    owners = np.empty(n, dtype=object)
+    mega_rows = np.zeros(n, dtype=bool)
+    mega_rows[rng.choice(n, n_mega, replace=False)] = True
+    owners[~mega_rows] = regular_names
+    owners[mega_rows] = [f'MEGA OWNER {m}' for m in rng.integers(0, n_mega_owners, n_mega)]
+    return owners
+
+
+def _vertex_heavy(rng, cx, cy, r, vertex_count):
+    """Closed polygon of 'vertex_count' vertices with a jittered radius."""
+    angles = np.linspace(0, 2 * np.pi, vertex_count, endpoint=False)
+    radius = r * rng.uniform(0.85, 1.0, vertex_count)
+    ring = np.column_stack([cx + radius * np.cos(angles), cy + radius * np.sin(angles)])
+    return shapely.Polygon(ring)
@@ -1,38 +1,20 @@
 from shapely.ops import nearest_points
-from sklearn.neighbors import NearestNeighbors
-from scipy.ndimage import uniform_filter1d
 import numpy as np
 from math import ceil
-from sklearn.cluster import DBSCAN, KMeans
 from shapely.geometry import MultiPolygon, MultiPoint, Polygon
-from scipy.spatial import cKDTree
-from scipy.spatial.distance import cdist
 import ast
 from typing import List
 import logging
 import multiprocessing
+from sp_geoprocessing.superparcels import filter_area
+from sp_geoprocessing.cluster import build_place_regions # regions by coordinate bisection
 
 logger = logging.getLogger(__name__)
 
 """ Functions for KMeans clustering """
-def build_place_regions(df, max_parcels_per_cluster):
-    """
-    Assigns each parcel to a region based on Kmeans clustering.
-    Returns a list of region assignments.
-    """
-
-    # number of clustrs is proportional to the number of parcels
-    if len(df) < max_parcels_per_cluster:
-        nclusters = 1
-    else:    
-        nclusters = len(df) // max_parcels_per_cluster
-    
-    coords = build_coords(df)
-
-    labels, centroids = build_kmeans_clusters(nclusters, coords)
-    return labels, centroids
-
 def build_kmeans_clusters(n_clusters, coords):
+    from sklearn.cluster import KMeans # sklearn and scipy are imported on use
+
     kmeans = KMeans(n_clusters=n_clusters, random_state=42)
     labels = kmeans.fit_predict(coords)  
     centroids = kmeans.cluster_centers_
@@ -74,6 +56,8 @@ def build_knn_distances(coords, k):
     Returns a 2d array where each row is a parcel and each column 
     is the distance to itself then 1st, 2nd, ..., kth nearest neighbor.
     """
+    from scipy.spatial import cKDTree
+
     dtree = cKDTree(coords) # KDTree for nearest neighbor
 
     # distances between each parcel and its 1 to kth nearest neighbor
@@ -95,6 +79,8 @@ def smooth_distances(distances, window):
     Smooths distances to reduce noise and make the elbow more apparent.
     Window is size of moving average. 
     """
+    from scipy.ndimage import uniform_filter1d
+
     return uniform_filter1d(distances, size=ceil(window * len(distances)))
 
 def build_difference(distances):
@@ -128,6 +114,8 @@ def merge_small_clusters(labels, centroids, min_cluster_size):
     Returns the new cluster labels.
     """
 
+    from scipy.spatial.distance import cdist
+
     # Step 1: Identify Small Clusters
     cluster_sizes = np.bincount(labels)
     
@@ -198,6 +186,8 @@ def build_owner_clusters(df, min_samples, eps):
         return build_dbscan_clusters(distance_matrix, min_samples, eps)
 
 def build_dbscan_clusters(dmatrix, min_samples, eps):
+    from sklearn.cluster import DBSCAN
+
     dbscan = DBSCAN(eps=eps, min_samples=min_samples, metric='precomputed')
     return dbscan.fit_predict(dmatrix)
 
@@ -236,34 +226,55 @@ def generate_cluster_string(List:[str]) -> List[str]:
 
 
 """ Funcitons to Merge """
-def merge_cross_region_clusters(df, max_merge_distance=4):
-    # Step 1: Identify owners spanning multiple regions
-    owner_region_count = df.groupby(['OWNER', 'place_id']).size().unstack(fill_value=0)
-    multi_region_owners = owner_region_count[owner_region_count.sum(axis=1) > 1].index
-
-    # Step 2: For each multi-region owner, check distances between clusters
-    for owner in multi_region_owners:
-        
-        owner_df = df[df['OWNER'] == owner]
-        
-        # Extract centroids for each cluster of the owner
-        centroids = owner_df.geometry.centroid
-        coords = list(zip(centroids.x, centroids.y))
-
-        # Build a KDTree for fast distance lookup
-        tree = cKDTree(coords)
-
-        # Find pairs of clusters within the max_merge_distance
-        pairs = tree.query_pairs(max_merge_distance)
-        
-        # Merge clusters if they are close enough
-        for i, j in pairs:
-            cluster_i = owner_df.iloc[i]['cluster_ID']
-            cluster_j = owner_df.iloc[j]['cluster_ID']
-
-            # Update cluster_ID to merge them
-            df.loc[df['cluster_ID'] == cluster_j, 'cluster_ID'] = cluster_i
-
+def merge_cross_region_clusters(df, max_merge_distance=4, key_field='OWNER', region_field='place_id'):
+    """
+    Merges the clusters of an owner that were clustered apart in different
+    regions ('region_field') but have parcels within 'max_merge_distance'
+    of each other (centroid distance). Merges are transitive: clusters
+    joined through any chain of close pairs become one, named by the
+    cluster_ID that comes first in 'df'.
+
+    Close pairs come from one KD-tree query over the parcels of owners in
+    more than one region. The owner code is a third coordinate, spaced
+    further apart than 'max_merge_distance', so only same-owner pairs are
+    returned. The merged clusters are the connected components of the
+    cross-region pairs, applied with one relabel of 'df'.
+    Returns 'df' with the merged cluster_IDs.
+    """
+    import pandas as pd
+    import shapely
+    from scipy import sparse
+    from scipy.spatial import cKDTree
+    from scipy.sparse.csgraph import connected_components
+
+    owners = pd.factorize(df[key_field])[0]
+    regions = pd.factorize(df[region_field])[0]
+    owner_regions = pd.DataFrame({'owner': owners, 'region': regions}).drop_duplicates()
+    multi_region = np.bincount(owner_regions['owner'], minlength=owners.max() + 1 if len(df) else 0) > 1
+    rows = np.flatnonzero(multi_region[owners]) if len(df) else np.array([], dtype=np.int64)
+    if len(rows) < 2:
+        return df
+
+    coords = shapely.get_coordinates(shapely.centroid(df.geometry.to_numpy()[rows]))
+    spacing = 2.0 * max_merge_distance + 1
+    points = np.column_stack([coords, owners[rows] * spacing])
+    pairs = cKDTree(points).query_pairs(max_merge_distance, output_type='ndarray')
+    i, j = rows[pairs[:, 0]], rows[pairs[:, 1]]
+
+    clusters, cluster_ids = pd.factorize(df['cluster_ID'])
+    cross = (regions[i] != regions[j]) & (clusters[i] != clusters[j])
+    if not cross.any():
+        return df
+
+    n = len(cluster_ids)
+    graph = sparse.csr_matrix(
+        (np.ones(int(cross.sum())), (clusters[i[cross]], clusters[j[cross]])), shape=(n, n)
+    )
+    n_components, component = connected_components(graph, directed=False)
+    # clusters are numbered in order of appearance: the first of each component names it
+    first = np.full(n_components, n, dtype=np.int64)
+    np.minimum.at(first, component, np.arange(n))
+    df['cluster_ID'] = np.asarray(cluster_ids)[first[component]][clusters]
     return df
 
 def build_superparcels(df, buffer, dissolve_by='cluster_ID', area_threshold=None):
@@ -271,6 +282,9 @@ def build_superparcels(df, buffer, dissolve_by='cluster_ID', area_threshold=None
     Dissolves clusters into super-parcels.
     Returns a GeoDataFrame with super-parcels.
     """
+    if area_threshold:
+        df = filter_area(df, area_threshold, dissolve_by=dissolve_by)
+
     sp = df.dissolve(by=dissolve_by).reset_index()
     logger.info('Calculating mitre limit...')
     sp['mitre'] = sp['geometry'].apply(compute_mitre_limit)
@@ -278,27 +292,9 @@ def build_superparcels(df, buffer, dissolve_by='cluster_ID', area_threshold=None
     logger.info('Applying buffer...')
     sp['geometry'] = sp.apply(lambda x: x.geometry.buffer(buffer, join_style=2, mitre_limit=x['mitre']), axis=1)
     sp['geometry'] = sp.apply(lambda x: x.geometry.buffer(-buffer, join_style=2, mitre_limit=x['mitre']), axis=1)
-    
-    if area_threshold:
-        pass
 
     return sp.explode(ignore_index=True)
 
-def filter_area():
-    pass
-    #parcel_dissolve['area'] = parcel_dissolve['geometry'].area # total area of the cluster
-
-    #mean_area = parcel_dissolve.groupby('cluster_ID')['area'].mean() # mean area of the cluster
-    #super_parcel_ids = mean_area[mean_area > area_threshold].index # ids of clusters with mean area greater than threshold
-
-    #super_parcels = parcel_dissolve[parcel_dissolve['cluster_ID'].isin(super_parcel_ids)]
-
-    # POSSIBLE RANKING/SORTING?
-        # rank super parcels by area
-        #super_parcels['rank'] = super_parcels['area'].rank(ascending=False) 
-        #super_parcels = super_parcels.sort_values(by='rank', ascending=True)
-        #super_parcels = super_parcels.reset_index(drop=True)
-
 def num_2_short_form(number):
     """
     Short form text creation for 
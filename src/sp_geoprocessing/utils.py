@@ -1,5 +1,6 @@
 from typing import List
 import numpy as np
+import pandas as pd
 import logging
 
 logger = logging.getLogger(__name__)
@@ -60,4 +61,44 @@ def num_2_short_form(number):
 def add_attributes(df, **kwargs):
     for key, value in kwargs.items():
         df[key] = value
-    return df
\ No newline at end of file
+    return df
+
+def to_utm(gdf):
+    """
+    Projects a GeoDataFrame to its estimated UTM zone.
+    """
+    utm = gdf.estimate_utm_crs().to_epsg()
+    return gdf.to_crs(epsg=utm)
+
+
+def compact_dtypes(df, category_fields=(), downcast_fields=()):
+    """
+    Stores 'category_fields' as categoricals (int codes and one dictionary
+    of values) and downcasts 'downcast_fields' to the smallest integer type
+    holding their values. Categorical columns drop the categories missing
+    from df, so subsets only carry their own values. Returns a new frame.
+    """
+    columns = {}
+    for field in category_fields:
+        columns[field] = df[field].astype('category')
+    for field, series in df.items():
+        if isinstance(series.dtype, pd.CategoricalDtype) and field not in columns:
+            columns[field] = series
+    for field, series in columns.items():
+        columns[field] = series.cat.remove_unused_categories()
+    for field in downcast_fields:
+        columns[field] = pd.to_numeric(df[field], downcast='integer')
+    return df.assign(**columns)
+
+
+def restore_dtypes(df, fields=()):
+    """
+    Converts categorical 'fields' back to the dtype of their values,
+    e.g. before writing output tables.
+    """
+    columns = {
+        field: df[field].astype(df[field].cat.categories.dtype)
+        for field in fields
+        if isinstance(df[field].dtype, pd.CategoricalDtype)
+    }
+    return df.assign(**columns) if columns else df